@@ -0,0 +1,40 @@
+"""add_media_files_table
+
+Revision ID: 3b1f0c7d9e24
+Revises: fbd02f8a2927
+Create Date: 2026-10-18 12:45:02.114392
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+# revision identifiers, used by Alembic.
+revision = '3b1f0c7d9e24'
+down_revision = 'fbd02f8a2927'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('media_files',
+                    sa.Column('id', mysql.BIGINT(unsigned=True), autoincrement=True, nullable=False),
+                    sa.Column('path', mysql.VARCHAR(length=255), nullable=False),
+                    sa.Column('sha256', mysql.CHAR(length=64), nullable=False),
+                    sa.Column('size', mysql.BIGINT(unsigned=True), nullable=False),
+                    sa.Column('content_type', mysql.VARCHAR(length=255), nullable=True),
+                    sa.Column('refcount', mysql.INTEGER(unsigned=True), nullable=False),
+                    sa.Column('created_at', mysql.TIMESTAMP(), server_default=sa.text('CURRENT_TIMESTAMP'),
+                              nullable=False),
+                    sa.Column('updated_at', mysql.TIMESTAMP(),
+                              server_default=sa.text('CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP'), nullable=False),
+                    sa.PrimaryKeyConstraint('id')
+                    )
+    op.create_index(op.f('ix_media_files_path'), 'media_files', ['path'], unique=True)
+    op.create_index(op.f('ix_media_files_updated_at'), 'media_files', ['updated_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_media_files_updated_at'), table_name='media_files')
+    op.drop_index(op.f('ix_media_files_path'), table_name='media_files')
+    op.drop_table('media_files')
@@ -0,0 +1,28 @@
+"""add_fulltext_indexes
+
+Revision ID: 5d2e8a41c7b3
+Revises: 3b1f0c7d9e24
+Create Date: 2026-10-18 13:20:41.508213
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '5d2e8a41c7b3'
+down_revision = '3b1f0c7d9e24'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(op.f('ix_books_writer_id'), 'books', ['writer_id'], unique=False)
+    op.create_index('ix_books_fulltext', 'books', ['title', 'description', 'genres'], unique=False,
+                    mysql_prefix='FULLTEXT')
+    op.create_index('ix_writers_fulltext', 'writers', ['name', 'lastname'], unique=False, mysql_prefix='FULLTEXT')
+
+
+def downgrade():
+    op.drop_index('ix_writers_fulltext', table_name='writers')
+    op.drop_index('ix_books_fulltext', table_name='books')
+    op.drop_index(op.f('ix_books_writer_id'), table_name='books')
@@ -0,0 +1,86 @@
+"""add_genres_tables
+
+Revision ID: 8a4c6f1e2d90
+Revises: 5d2e8a41c7b3
+Create Date: 2026-10-18 14:02:17.935120
+
+"""
+from collections import Counter
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+# revision identifiers, used by Alembic.
+revision = '8a4c6f1e2d90'
+down_revision = '5d2e8a41c7b3'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 10000
+
+
+def parse_genres(genres):
+    names = []
+    for name in (genres or "").split(","):
+        name = " ".join(name.split()).lower()[:64]
+        if name and name not in names:
+            names.append(name)
+    return names
+
+
+def upgrade():
+    op.create_table('genres',
+                    sa.Column('id', mysql.BIGINT(unsigned=True), autoincrement=True, nullable=False),
+                    sa.Column('name', mysql.VARCHAR(length=64), nullable=False),
+                    sa.Column('book_count', mysql.INTEGER(unsigned=True), server_default='0', nullable=False),
+                    sa.Column('created_at', mysql.TIMESTAMP(), server_default=sa.text('CURRENT_TIMESTAMP'),
+                              nullable=False),
+                    sa.Column('updated_at', mysql.TIMESTAMP(),
+                              server_default=sa.text('CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP'), nullable=False),
+                    sa.PrimaryKeyConstraint('id')
+                    )
+    op.create_index(op.f('ix_genres_name'), 'genres', ['name'], unique=True)
+    op.create_index(op.f('ix_genres_updated_at'), 'genres', ['updated_at'], unique=False)
+    op.create_table('book_genres',
+                    sa.Column('book_id', mysql.BIGINT(unsigned=True), nullable=False),
+                    sa.Column('genre_id', mysql.BIGINT(unsigned=True), nullable=False),
+                    sa.ForeignKeyConstraint(['book_id'], ['books.id'], ondelete='CASCADE'),
+                    sa.ForeignKeyConstraint(['genre_id'], ['genres.id'], ondelete='CASCADE'),
+                    sa.PrimaryKeyConstraint('book_id', 'genre_id')
+                    )
+    op.create_index('ix_book_genres_genre_id_book_id', 'book_genres', ['genre_id', 'book_id'], unique=False)
+
+    # Backfill from the free-form books.genres column, comma separated names
+    connection = op.get_bind()
+    genre_ids = {}
+    book_counts = Counter()
+    last_id = 0
+    while True:
+        rows = connection.execute(sa.text("SELECT id, genres FROM books WHERE id > :last_id ORDER BY id LIMIT :limit"),
+                                  {"last_id": last_id, "limit": BATCH_SIZE}).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        links = []
+        for row in rows:
+            for name in parse_genres(row.genres):
+                if name not in genre_ids:
+                    genre_ids[name] = connection.execute(sa.text("INSERT INTO genres (name) VALUES (:name)"),
+                                                         {"name": name}).lastrowid
+                links.append({"book_id": row.id, "genre_id": genre_ids[name]})
+                book_counts[genre_ids[name]] += 1
+        if links:
+            connection.execute(sa.text("INSERT INTO book_genres (book_id, genre_id) VALUES (:book_id, :genre_id)"),
+                               links)
+    for genre_id, count in book_counts.items():
+        connection.execute(sa.text("UPDATE genres SET book_count = :count WHERE id = :id"),
+                           {"count": count, "id": genre_id})
+
+
+def downgrade():
+    op.drop_index('ix_book_genres_genre_id_book_id', table_name='book_genres')
+    op.drop_table('book_genres')
+    op.drop_index(op.f('ix_genres_updated_at'), table_name='genres')
+    op.drop_index(op.f('ix_genres_name'), table_name='genres')
+    op.drop_table('genres')
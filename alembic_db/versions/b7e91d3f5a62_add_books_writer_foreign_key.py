@@ -0,0 +1,29 @@
+"""add_books_writer_foreign_key
+
+Revision ID: b7e91d3f5a62
+Revises: 8a4c6f1e2d90
+Create Date: 2026-10-18 14:48:55.271604
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'b7e91d3f5a62'
+down_revision = '8a4c6f1e2d90'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    orphans = op.get_bind().execute(sa.text(
+        "SELECT COUNT(*) FROM books LEFT JOIN writers ON writers.id = books.writer_id WHERE writers.id IS NULL"
+    )).scalar()
+    if orphans:
+        raise RuntimeError(f"{orphans} books reference a missing writer, fix their writer_id before upgrading")
+    op.create_foreign_key('fk_books_writer_id_writers', 'books', 'writers', ['writer_id'], ['id'],
+                          ondelete='RESTRICT')
+
+
+def downgrade():
+    op.drop_constraint('fk_books_writer_id_writers', 'books', type_='foreignkey')
@@ -0,0 +1,48 @@
+"""add_jobs_table
+
+Revision ID: d3c5a9e7f1b8
+Revises: b7e91d3f5a62
+Create Date: 2026-10-18 16:10:32.640187
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+# revision identifiers, used by Alembic.
+revision = 'd3c5a9e7f1b8'
+down_revision = 'b7e91d3f5a62'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('jobs',
+                    sa.Column('id', mysql.BIGINT(unsigned=True), autoincrement=True, nullable=False),
+                    sa.Column('kind', mysql.VARCHAR(length=64), nullable=False),
+                    sa.Column('payload', mysql.JSON(), nullable=False),
+                    sa.Column('run_at', mysql.TIMESTAMP(), server_default=sa.text('CURRENT_TIMESTAMP'),
+                              nullable=False),
+                    sa.Column('locked_at', mysql.TIMESTAMP(), nullable=True),
+                    sa.Column('status', mysql.MEDIUMINT(unsigned=True), server_default=sa.text('0'), nullable=False),
+                    sa.Column('priority', mysql.MEDIUMINT(unsigned=True), nullable=True),
+                    sa.Column('attempt', mysql.MEDIUMINT(unsigned=True), nullable=True),
+                    sa.Column('exception', mysql.TEXT(), nullable=True),
+                    sa.Column('created_at', mysql.TIMESTAMP(), server_default=sa.text('CURRENT_TIMESTAMP'),
+                              nullable=False),
+                    sa.Column('updated_at', mysql.TIMESTAMP(),
+                              server_default=sa.text('CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP'), nullable=False),
+                    sa.PrimaryKeyConstraint('id')
+                    )
+    op.create_index(op.f('ix_jobs_status'), 'jobs', ['status'], unique=False)
+    op.create_index(op.f('ix_jobs_priority'), 'jobs', ['priority'], unique=False)
+    op.create_index(op.f('ix_jobs_updated_at'), 'jobs', ['updated_at'], unique=False)
+    op.create_index('ix_jobs_status_priority_run_at', 'jobs', ['status', 'priority', 'run_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_jobs_status_priority_run_at', table_name='jobs')
+    op.drop_index(op.f('ix_jobs_updated_at'), table_name='jobs')
+    op.drop_index(op.f('ix_jobs_priority'), table_name='jobs')
+    op.drop_index(op.f('ix_jobs_status'), table_name='jobs')
+    op.drop_table('jobs')
@@ -0,0 +1,44 @@
+"""add_sessions_table
+
+Revision ID: e8f2b4c6a1d3
+Revises: d3c5a9e7f1b8
+Create Date: 2026-10-18 19:02:47.318520
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+# revision identifiers, used by Alembic.
+revision = 'e8f2b4c6a1d3'
+down_revision = 'd3c5a9e7f1b8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('sessions',
+                    sa.Column('id', mysql.BIGINT(unsigned=True), autoincrement=True, nullable=False),
+                    sa.Column('user_id', mysql.BIGINT(unsigned=True), nullable=False),
+                    sa.Column('token_hash', mysql.CHAR(length=64), nullable=False),
+                    sa.Column('previous_token_hash', mysql.CHAR(length=64), nullable=True),
+                    sa.Column('expires_at', mysql.TIMESTAMP(), nullable=False),
+                    sa.Column('revoked_at', mysql.TIMESTAMP(), nullable=True),
+                    sa.Column('created_at', mysql.TIMESTAMP(), server_default=sa.text('CURRENT_TIMESTAMP'),
+                              nullable=False),
+                    sa.Column('updated_at', mysql.TIMESTAMP(),
+                              server_default=sa.text('CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP'), nullable=False),
+                    sa.ForeignKeyConstraint(['user_id'], ['users.id'], name='fk_sessions_user_id_users',
+                                            ondelete='CASCADE'),
+                    sa.PrimaryKeyConstraint('id')
+                    )
+    op.create_index(op.f('ix_sessions_user_id'), 'sessions', ['user_id'], unique=False)
+    op.create_index(op.f('ix_sessions_expires_at'), 'sessions', ['expires_at'], unique=False)
+    op.create_index(op.f('ix_sessions_updated_at'), 'sessions', ['updated_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_sessions_updated_at'), table_name='sessions')
+    op.drop_index(op.f('ix_sessions_expires_at'), table_name='sessions')
+    op.drop_index(op.f('ix_sessions_user_id'), table_name='sessions')
+    op.drop_table('sessions')
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+"""Concurrent read load against the book and writer lookups.
+
+Start the application against a local MySQL (or any stand-in reachable through the
+DB_* settings) and run the script once on the commit before the async data layer
+and once after it to compare requests/sec:
+
+    python -m benchmarks.bench_async_db --requests 5000 --concurrency 200
+"""
+import asyncio
+
+from benchmarks.common import base_parser, run_load, print_report
+
+
+def main():
+    parser = base_parser(__doc__)
+    parser.add_argument("--max-id", type=int, default=100, help="ids are requested round-robin in [1, max-id]")
+    args = parser.parse_args()
+
+    for name, template in (("GET /book/{id}/info", "/book/{}/info"),
+                           ("GET /writer/{id}/info", "/writer/{}/info"),
+                           ("GET /books/?limit=10", "/books/?limit=10&skip={}")):
+        stats = asyncio.run(run_load(args.base_url,
+                                     lambda i, t=template: t.format(i % args.max_id + 1),
+                                     total=args.requests,
+                                     concurrency=args.concurrency))
+        print_report(name, stats)
+
+
+if __name__ == "__main__":
+    main()
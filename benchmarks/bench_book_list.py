@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""Cost of building a /books/ page: ORM entities with per-row url_for (previous implementation)
+against column rows with the media URL resolved once (src.serializers).
+
+Both response-building stages run in-process against the configured database, timing them and
+tracing their peak allocation, then /books/?limit=1000 is loaded over HTTP if a server runs:
+
+    python -m benchmarks.bench_book_list --seed 1000
+"""
+import asyncio
+import time
+import tracemalloc
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import select
+from starlette.requests import Request
+
+from benchmarks.common import base_parser, run_load, print_report
+from benchmarks.bench_pagination import seed_books
+
+
+async def orm_page(db, request: Request, limit: int):
+    import src.models as models
+    import src.schemas as schemas
+
+    result = await db.execute(select(models.Book).order_by(models.Book.id).limit(limit))
+    items = result.scalars().all()
+    for item in items:
+        if item.cover_file:
+            item.cover_file = request.url_for('media', path=item.cover_file.replace('\\', '/'))
+        item.book_file = request.url_for('media', path=item.book_file.replace('\\', '/'))
+    body = jsonable_encoder([schemas.Book.from_orm(item) for item in items])
+    db.expunge_all()
+    return body
+
+
+async def row_page(db, request: Request, limit: int):
+    import src.crud as crud
+    import src.serializers as serializers
+
+    rows = await crud.get_books(db, limit=limit)
+    media_url = serializers.MediaUrls(request)
+    return jsonable_encoder([serializers.book_row_dict(row, media_url) for row in rows])
+
+
+async def measure(build, request: Request, limit: int, rounds: int):
+    from src.database import AsyncSessionLocal
+
+    async with AsyncSessionLocal() as db:
+        await build(db, request, limit)
+        elapsed = 0.0
+        peak = 0
+        for _ in range(rounds):
+            tracemalloc.start()
+            started = time.perf_counter()
+            await build(db, request, limit)
+            elapsed += time.perf_counter() - started
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+    return elapsed / rounds, peak
+
+
+def main():
+    parser = base_parser(__doc__)
+    parser.add_argument("--seed", type=int, default=0, help="insert this many rows before benchmarking")
+    parser.add_argument("--limit", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--skip-http", action="store_true")
+    parser.set_defaults(requests=200, concurrency=4)
+    args = parser.parse_args()
+
+    if args.seed:
+        seed_books(args.seed)
+
+    from src.main import configure_static, create_app
+
+    # The /media mount is added by the lifespan, the page builders need it for url_for
+    application = create_app()
+    configure_static(application)
+    request = Request({"type": "http", "method": "GET", "scheme": "http", "server": ("bench", 80), "path": "/books/",
+                       "root_path": "", "query_string": b"", "headers": [(b"host", b"bench")],
+                       "router": application.router, "app": application})
+    for name, build in (("orm entities + url_for per row", orm_page), ("column rows + MediaUrls", row_page)):
+        mean, peak = asyncio.run(measure(build, request, args.limit, args.rounds))
+        print(f"{name:<40} {mean * 1000:>8.2f} ms/page  peak {peak / 1024:>9.1f} KiB")
+
+    if not args.skip_http:
+        stats = asyncio.run(run_load(args.base_url, lambda i: f"/books/?limit={args.limit}",
+                                     total=args.requests, concurrency=args.concurrency))
+        print_report(f"GET /books/?limit={args.limit}", stats)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""Rows/sec of the bulk loader for different batch sizes, run against the configured DB:
+
+    python -m benchmarks.bench_bulk_import --rows 200000 --batch-sizes 100 1000 5000
+"""
+import argparse
+import asyncio
+import json
+import tempfile
+import time
+import uuid
+
+from src.bulk import import_file
+
+
+def write_books(path: str, rows: int):
+    run = uuid.uuid4().hex[:8]
+    with open(path, "w") as file:
+        for i in range(rows):
+            file.write(json.dumps({"title": f"Bulk {run} {i}", "writer_id": 1, "publish_date": "2020-01-01",
+                                   "rating": i % 10, "genres": "bench", "cover_file": "covers/bench.png",
+                                   "book_file": "books/bench.pdf", "description": "Benchmark row"}) + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[100, 1000, 5000])
+    args = parser.parse_args()
+
+    for batch_size in args.batch_sizes:
+        with tempfile.NamedTemporaryFile(suffix=".ndjson") as payload:
+            write_books(payload.name, args.rows)
+            started = time.perf_counter()
+            report = asyncio.run(import_file("books", payload.name, "ndjson", batch_size))
+            elapsed = time.perf_counter() - started
+        print(f"batch {batch_size:>6}: {report['accepted'] / elapsed:>10.0f} rows/s "
+              f"({report['accepted']} accepted, {report['rejected']} rejected, {elapsed:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
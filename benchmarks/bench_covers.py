@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""Generation latency and bytes saved of the cover variants, no database or server needed:
+
+    python -m benchmarks.bench_covers                    # synthetic 1200x1800 covers
+    python -m benchmarks.bench_covers --images covers/   # real .png / .jpg files
+
+Every image is resized to each COVER_WIDTHS width, in its own format and as WebP, with
+src.images.resize, the function the process pool runs.
+"""
+import argparse
+import pathlib
+import statistics
+import tempfile
+import time
+from collections import defaultdict
+
+from PIL import Image
+
+import settings
+from src.images import IMAGE_FORMATS, VARIANT_FORMATS, resize
+
+
+def synthetic_covers(directory: pathlib.Path, count: int):
+    for i in range(count):
+        image = Image.effect_mandelbrot((1200, 1800), (-2.0 + i * 0.1, -1.5, 1.0, 1.5), 100).convert("RGB")
+        for suffix in (".png", ".jpg"):
+            path = directory / f"cover-{i}{suffix}"
+            image.save(path, IMAGE_FORMATS[suffix])
+            yield path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--images", type=pathlib.Path, help="directory of covers, synthetic ones by default")
+    parser.add_argument("--count", type=int, default=5, help="synthetic covers per format")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp:
+        temp = pathlib.Path(temp)
+        if args.images:
+            sources = [path for path in sorted(args.images.iterdir()) if path.suffix.lower() in IMAGE_FORMATS]
+        else:
+            sources = list(synthetic_covers(temp, args.count))
+        timings, saved, originals = defaultdict(list), defaultdict(int), defaultdict(int)
+        for source in sources:
+            for width in settings.COVER_WIDTHS:
+                for variant_format in (None, *VARIANT_FORMATS):
+                    suffix = VARIANT_FORMATS[variant_format] if variant_format else source.suffix.lower()
+                    target = temp / f"{source.stem}-w{width}{suffix}"
+                    started = time.perf_counter()
+                    size = resize(str(source), str(target), width, suffix)
+                    name = f"w{width} {variant_format or source.suffix.lower().lstrip('.')}"
+                    timings[name].append(time.perf_counter() - started)
+                    originals[name] += source.stat().st_size
+                    saved[name] += source.stat().st_size - size
+
+    print(f"{len(sources)} source images")
+    for name in sorted(timings, key=lambda key: (int(key.split()[0][1:]), key)):
+        print(f"{name:<14} median {statistics.median(timings[name]) * 1000:>8.1f} ms  "
+              f"saved {saved[name] / 1024:>10.1f} KiB ({saved[name] / originals[name]:>6.1%})")
+
+
+if __name__ == "__main__":
+    main()
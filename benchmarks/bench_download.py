@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""Throughput of /book/{id}/download with a single client and with parallel ranged clients.
+
+Upload a large book first (see bench_upload) and run:
+
+    python -m benchmarks.bench_download --book-id 1 --parallel 8
+"""
+import asyncio
+import time
+
+import httpx
+
+from benchmarks.common import base_parser
+
+
+async def fetch(client: httpx.AsyncClient, path: str, start: int, end: int) -> int:
+    received = 0
+    async with client.stream("GET", path, headers={"Range": f"bytes={start}-{end}"}) as response:
+        async for chunk in response.aiter_bytes():
+            received += len(chunk)
+    return received
+
+
+async def download(base_url: str, book_id: int, parallel: int):
+    path = f"/book/{book_id}/download"
+    async with httpx.AsyncClient(base_url=base_url, timeout=None) as client:
+        async with client.stream("GET", path, headers={"Range": "bytes=0-0"}) as response:
+            size = int(response.headers["content-range"].rsplit("/", 1)[1])
+        part = -(-size // parallel)
+        started = time.perf_counter()
+        received = await asyncio.gather(*(fetch(client, path, start, min(start + part, size) - 1)
+                                          for start in range(0, size, part)))
+        elapsed = time.perf_counter() - started
+    assert sum(received) == size, f"received {sum(received)} of {size} bytes"
+    print(f"{parallel:>3} ranged clients: {size / 1024 / 1024 / elapsed:>8.1f} MB/s ({size} bytes in {elapsed:.2f}s)")
+
+
+def main():
+    parser = base_parser(__doc__)
+    parser.add_argument("--book-id", type=int, default=1)
+    parser.add_argument("--parallel", type=int, default=8)
+    args = parser.parse_args()
+
+    asyncio.run(download(args.base_url, args.book_id, 1))
+    asyncio.run(download(args.base_url, args.book_id, args.parallel))
+
+
+if __name__ == "__main__":
+    main()
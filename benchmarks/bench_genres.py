@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""Latency of the genre filter on /books/ against a LIKE scan over the old text column.
+
+Seed books with normalized genres once (1M rows by default), start the application and run:
+
+    python -m benchmarks.bench_genres --seed 1000000
+    python -m benchmarks.bench_genres
+"""
+import asyncio
+import datetime
+import random
+import time
+
+from benchmarks.common import base_parser, run_load, print_report
+
+GENRES = [f"genre {i}" for i in range(200)]
+
+
+def seed_books(rows: int, batch_size: int = 10_000):
+    from sqlalchemy import func, select
+    from src.database import get_engine
+    import src.models as models
+
+    engine = get_engine()
+    rng = random.Random(0)
+    with engine.begin() as connection:
+        connection.execute(models.Genre.__table__.insert().prefix_with("IGNORE"),
+                           [{"name": name, "book_count": 0} for name in GENRES])
+        genre_ids = dict(connection.execute(select(models.Genre.name, models.Genre.id)
+                                            .filter(models.Genre.name.in_(GENRES))).all())
+        first_id = (connection.execute(select(func.max(models.Book.id))).scalar() or 0) + 1
+        for start in range(0, rows, batch_size):
+            books, links = [], []
+            for i in range(start, min(start + batch_size, rows)):
+                names = rng.sample(GENRES, k=rng.randint(1, 3))
+                books.append({"id": first_id + i, "title": f"Genre bench book {first_id + i}", "writer_id": 1,
+                              "publish_date": datetime.date.today(), "rating": i % 10, "genres": ", ".join(names),
+                              "cover_file": "covers/bench.png", "book_file": "books/bench.pdf"})
+                links.extend({"book_id": first_id + i, "genre_id": genre_ids[name]} for name in names)
+            connection.execute(models.Book.__table__.insert(), books)
+            connection.execute(models.book_genres.insert(), links)
+        connection.execute(models.Genre.__table__.update().values(
+            book_count=select(func.count()).select_from(models.book_genres)
+            .where(models.book_genres.c.genre_id == models.Genre.id).scalar_subquery()))
+
+
+def like_scan(genre: str, limit: int) -> float:
+    """Time of the string matching the genre filter replaces"""
+    from sqlalchemy import select
+    from src.database import get_engine
+    import src.models as models
+
+    engine = get_engine()
+    query = select(models.Book.id).filter(models.Book.genres.like(f"%{genre}%")).order_by(models.Book.id).limit(limit)
+    started = time.perf_counter()
+    with engine.connect() as connection:
+        connection.execute(query).all()
+    return time.perf_counter() - started
+
+
+def main():
+    parser = base_parser(__doc__)
+    parser.add_argument("--seed", type=int, default=0, help="insert this many rows before benchmarking")
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--like-samples", type=int, default=5, help="LIKE scans to time, 0 to skip")
+    parser.set_defaults(requests=500, concurrency=10)
+    args = parser.parse_args()
+
+    if args.seed:
+        seed_books(args.seed)
+
+    genres = random.Random(1).choices(GENRES, k=args.requests)
+    stats = asyncio.run(run_load(args.base_url, lambda i: f"/books/?genre={genres[i]}&limit={args.limit}",
+                                 total=args.requests, concurrency=args.concurrency))
+    print_report("index /books/?genre=", stats)
+    stats = asyncio.run(run_load(args.base_url, lambda i: "/books/genres", total=args.requests,
+                                 concurrency=args.concurrency))
+    print_report("facets /books/genres", stats)
+    if args.like_samples:
+        timings = [like_scan(genre, args.limit) for genre in genres[:args.like_samples]]
+        print(f"{'LIKE scan (direct SQL)':<40} mean {sum(timings) / len(timings) * 1000:>8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
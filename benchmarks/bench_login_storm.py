@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""Login throughput and latency of an unrelated endpoint during a login storm.
+
+Needs an existing account; its TOTP secret is used to build valid passwords:
+
+    python -m benchmarks.bench_login_storm --username bench --password secret123 --otp-secret BASE32SECRET
+"""
+import asyncio
+
+import pyotp
+
+from benchmarks.common import base_parser, run_load, print_report
+
+
+async def storm(args):
+    totp = pyotp.TOTP(args.otp_secret)
+    logins = run_load(args.base_url, lambda i: "/token", total=args.requests, concurrency=args.concurrency,
+                      method="POST", data={"username": args.username, "password": args.password + totp.now()})
+    reads = run_load(args.base_url, lambda i: "/book/1/info", total=args.requests, concurrency=10)
+    return await asyncio.gather(logins, reads)
+
+
+def main():
+    parser = base_parser(__doc__)
+    parser.add_argument("--username", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--otp-secret", required=True)
+    parser.set_defaults(requests=500, concurrency=50)
+    args = parser.parse_args()
+
+    baseline = asyncio.run(run_load(args.base_url, lambda i: "/book/1/info", total=args.requests, concurrency=10))
+    print_report("GET /book/1/info (idle)", baseline)
+    logins, reads = asyncio.run(storm(args))
+    print_report("POST /token (storm)", logins)
+    print_report("GET /book/1/info (during storm)", reads)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""Overhead of the request metrics middleware (src.middleware.MetricsMiddleware).
+
+A FastAPI app with a trivial JSON route and a streamed response is called in-process through
+raw ASGI, without middleware, with MetricsMiddleware and with the previous BaseHTTPMiddleware
+based timer, so only the middleware cost is measured:
+
+    python -m benchmarks.bench_middleware --requests 20000
+"""
+import argparse
+import asyncio
+import time
+
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from starlette.middleware.base import BaseHTTPMiddleware
+
+
+class TimerMiddleware(BaseHTTPMiddleware):
+    """The middleware MetricsMiddleware replaced"""
+
+    async def dispatch(self, request, call_next):
+        start_time = time.time()
+        response = await call_next(request)
+        response.headers["X-Process-Time"] = str(time.time() - start_time)
+        return response
+
+
+def create_app(middleware=None) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/ping/{item_id}")
+    async def ping(item_id: int):
+        return {"item_id": item_id}
+
+    @app.get("/stream")
+    async def stream():
+        async def chunks():
+            for _ in range(10):
+                yield b"x" * 1024
+
+        return StreamingResponse(chunks())
+
+    if middleware is not None:
+        app.add_middleware(middleware)
+    return app
+
+
+async def drive(app, path: str, total: int) -> float:
+    scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+             "path": path, "raw_path": path.encode(), "root_path": "", "query_string": b"", "headers": [],
+             "client": ("127.0.0.1", 1234), "server": ("127.0.0.1", 80)}
+
+    async def send(message):
+        pass
+
+    async def request():
+        received = False
+
+        async def receive():
+            nonlocal received
+            if not received:
+                received = True
+                return {"type": "http.request", "body": b"", "more_body": False}
+            # The client stays connected, streaming responses wait for a disconnect until they are done
+            await asyncio.Event().wait()
+
+        await app(dict(scope), receive, send)
+
+    await request()
+    started = time.perf_counter()
+    for _ in range(total):
+        await request()
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+
+    from src.middleware import MetricsMiddleware
+
+    variants = {"no middleware": None, "MetricsMiddleware": MetricsMiddleware, "TimerMiddleware (previous)": TimerMiddleware}
+    for path in ("/ping/1", "/stream"):
+        baseline = None
+        for name, middleware in variants.items():
+            elapsed = asyncio.run(drive(create_app(middleware), path, args.requests))
+            per_request = elapsed / args.requests * 1e6
+            baseline = baseline or per_request
+            print(f"{path:<10} {name:<28} {args.requests / elapsed:>10.0f} req/s  {per_request:>8.1f} us/req  "
+                  f"overhead {per_request - baseline:>+7.1f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""Per-page latency of offset vs. cursor pagination on /books/ at increasing depth.
+
+Seed a large books table once (1M rows by default), start the application and run:
+
+    python -m benchmarks.bench_pagination --seed 1000000
+    python -m benchmarks.bench_pagination
+"""
+import asyncio
+import datetime
+
+from benchmarks.common import base_parser, run_load, print_report
+from src.schemas import encode_cursor
+
+DEPTHS = (0, 10_000, 100_000, 500_000, 990_000)
+
+
+def seed_books(rows: int, batch_size: int = 10_000):
+    from src.database import get_engine
+    import src.models as models
+
+    engine = get_engine()
+    table = models.Book.__table__
+    with engine.begin() as connection:
+        for start in range(0, rows, batch_size):
+            connection.execute(table.insert(), [
+                {"title": f"Bench book {i}", "writer_id": 1, "publish_date": datetime.date.today(), "rating": i % 10,
+                 "cover_file": "covers/bench.png", "book_file": "books/bench.pdf", "genres": "bench"}
+                for i in range(start, min(start + batch_size, rows))
+            ])
+
+
+def main():
+    parser = base_parser(__doc__)
+    parser.add_argument("--seed", type=int, default=0, help="insert this many rows before benchmarking")
+    parser.add_argument("--limit", type=int, default=100)
+    parser.set_defaults(requests=200, concurrency=1)
+    args = parser.parse_args()
+
+    if args.seed:
+        seed_books(args.seed)
+
+    for depth in DEPTHS:
+        for mode, path in (("offset", f"/books/?limit={args.limit}&skip={depth}"),
+                           ("cursor", f"/books/?limit={args.limit}&cursor={encode_cursor(depth)}")):
+            stats = asyncio.run(run_load(args.base_url, lambda i, p=path: p,
+                                         total=args.requests, concurrency=args.concurrency))
+            print_report(f"{mode:<6} depth={depth}", stats)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""OTP QR code rendering: PNG written to media_protected/qr_codes and read back for the mail
+attachment (previous implementation) against an in-memory buffer and a cache hit.
+
+Runs in-process and reports time and bytes left on disk per signup. With credentials of an
+existing account GET /users/me/qr is loaded over HTTP as well:
+
+    python -m benchmarks.bench_qr --rounds 200 --username bench --password secret123 --otp-secret BASE32
+"""
+import asyncio
+import pathlib
+import tempfile
+import time
+
+import pyotp
+
+from benchmarks.common import base_parser, run_load, print_report
+
+
+def legacy_disk(uri: str, directory: pathlib.Path, i: int) -> int:
+    import qrcode
+
+    qr = qrcode.QRCode(box_size=5)
+    qr.add_data(uri)
+    path = directory / f"user_{i}.png"
+    qr.make_image().save(path)
+    path.read_bytes()
+    return path.stat().st_size
+
+
+def measure(render, rounds: int) -> float:
+    started = time.perf_counter()
+    for i in range(rounds):
+        render(i)
+    return (time.perf_counter() - started) / rounds
+
+
+async def fetch_token(args) -> str:
+    import httpx
+
+    async with httpx.AsyncClient(base_url=args.base_url) as client:
+        response = await client.post("/token", data={"username": args.username,
+                                                     "password": args.password + pyotp.TOTP(args.otp_secret).now()})
+        response.raise_for_status()
+        return response.json()["access_token"]
+
+
+def main():
+    parser = base_parser(__doc__)
+    parser.add_argument("--rounds", type=int, default=200)
+    parser.add_argument("--username")
+    parser.add_argument("--password")
+    parser.add_argument("--otp-secret")
+    args = parser.parse_args()
+
+    from src.internal.users import get_qr_code_png, render_qr_code_png
+
+    uris = [pyotp.TOTP(pyotp.random_base32()).provisioning_uri(name=f"user{i}@example.com",
+                                                               issuer_name="Library App")
+            for i in range(args.rounds)]
+    with tempfile.TemporaryDirectory() as directory:
+        written = []
+        disk = measure(lambda i: written.append(legacy_disk(uris[i], pathlib.Path(directory), i)), args.rounds)
+    memory = measure(lambda i: render_qr_code_png(uris[i]), args.rounds)
+    asyncio.run(get_qr_code_png(uris[0]))
+    cached = measure(lambda i: asyncio.run(get_qr_code_png(uris[0])), args.rounds)
+
+    print(f"{'disk + read back (previous)':<30} {disk * 1000:>8.2f} ms  {sum(written) / len(written):>8.0f} B/signup kept")
+    print(f"{'in-memory':<30} {memory * 1000:>8.2f} ms  {0:>8} B/signup kept")
+    print(f"{'cache hit (incl. event loop)':<30} {cached * 1000:>8.2f} ms")
+
+    if args.username and args.password and args.otp_secret:
+        token = asyncio.run(fetch_token(args))
+        stats = asyncio.run(run_load(args.base_url, lambda i: "/users/me/qr", total=args.requests,
+                                     concurrency=args.concurrency, headers={"Authorization": f"Bearer {token}"}))
+        print_report("GET /users/me/qr", stats)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""Cost of the in-memory rate limiter (src.rate_limit) per request and per tracked client.
+
+A rejected login costs one counter lookup instead of a DB query and a bcrypt verify; this
+times RateLimiter.acquire for known and new client addresses and measures the memory held
+per address:
+
+    python -m benchmarks.bench_rate_limit --clients 100000
+"""
+import argparse
+import asyncio
+import time
+import tracemalloc
+
+
+async def measure(limiter, limit, keys) -> float:
+    started = time.perf_counter()
+    for key in keys:
+        try:
+            await limiter.acquire(limit, key)
+        except Exception:
+            pass
+    return (time.perf_counter() - started) / len(keys)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--clients", type=int, default=100000)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    from src.rate_limit import Limit, MemoryBackend, RateLimiter
+
+    limit = Limit("bench", limit=args.rounds - 1, window=60)
+    keys = [f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}" for i in range(args.clients)]
+    limiter = RateLimiter(MemoryBackend(maxsize=args.clients))
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    new = asyncio.run(measure(limiter, limit, keys))
+    held = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    print(f"{'new client':<24} {new * 1e6:>8.2f} us/request")
+    for round_ in range(2, args.rounds + 1):
+        known = asyncio.run(measure(limiter, limit, keys))
+        name = "known client" + (" (limited)" if round_ > limit.limit else "")
+        print(f"{name:<24} {known * 1e6:>8.2f} us/request")
+    print(f"{held / args.clients:.0f} bytes per tracked client")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""Sustained authenticated load, renewing tokens with a full login vs with /token/refresh.
+
+Each client sends --renew-every authenticated requests per access token, standing in for
+token expiry, then renews it: in the first run with POST /token (bcrypt + TOTP), in the second
+with the rotating refresh token. Needs an existing account; its TOTP secret is used to build
+valid passwords:
+
+    python -m benchmarks.bench_refresh --username bench --password secret123 --otp-secret BASE32SECRET
+"""
+import asyncio
+import statistics
+import time
+from typing import Dict, List
+
+import httpx
+import pyotp
+
+from benchmarks.common import base_parser, percentile, print_report
+
+
+def summarize(latencies: List[float], statuses: Dict[int, int], elapsed: float) -> dict:
+    return {"requests": len(latencies), "elapsed": elapsed, "rps": len(latencies) / elapsed if elapsed else 0.0,
+            "mean_ms": statistics.mean(latencies) * 1000 if latencies else 0.0,
+            "p50_ms": percentile(latencies, 50) * 1000, "p95_ms": percentile(latencies, 95) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000, "statuses": statuses}
+
+
+async def sustained(args, use_refresh: bool):
+    totp = pyotp.TOTP(args.otp_secret)
+    reads: List[float] = []
+    renewals: List[float] = []
+    read_statuses: Dict[int, int] = {}
+    renew_statuses: Dict[int, int] = {}
+    counter = iter(range(args.requests))
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=60) as client:
+        async def login() -> dict:
+            # A code taken right before the 30 s TOTP step may be stale on arrival, one retry covers it
+            for attempt in range(2):
+                response = await client.post("/token", data={"username": args.username,
+                                                              "password": args.password + totp.now()})
+                renew_statuses[response.status_code] = renew_statuses.get(response.status_code, 0) + 1
+                if response.status_code != 401 or attempt:
+                    response.raise_for_status()
+                    return response.json()
+
+        async def worker():
+            tokens = await login()
+            served = 0
+            for _ in counter:
+                if served == args.renew_every:
+                    started = time.perf_counter()
+                    if use_refresh:
+                        response = await client.post("/token/refresh",
+                                                     data={"refresh_token": tokens["refresh_token"]})
+                        renew_statuses[response.status_code] = renew_statuses.get(response.status_code, 0) + 1
+                        response.raise_for_status()
+                        tokens = response.json()
+                    else:
+                        tokens = await login()
+                    renewals.append(time.perf_counter() - started)
+                    served = 0
+                started = time.perf_counter()
+                response = await client.get(args.path, headers={"Authorization": f"Bearer {tokens['access_token']}"})
+                reads.append(time.perf_counter() - started)
+                read_statuses[response.status_code] = read_statuses.get(response.status_code, 0) + 1
+                served += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return summarize(reads, read_statuses, elapsed), summarize(renewals, renew_statuses, elapsed)
+
+
+def main():
+    parser = base_parser(__doc__)
+    parser.add_argument("--username", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--otp-secret", required=True)
+    parser.add_argument("--path", default="/users/me/", help="authenticated endpoint under load")
+    parser.add_argument("--renew-every", type=int, default=20, help="requests per access token")
+    parser.set_defaults(requests=4000, concurrency=20)
+    args = parser.parse_args()
+
+    for name, use_refresh in (("login", False), ("refresh", True)):
+        reads, renewals = asyncio.run(sustained(args, use_refresh))
+        print_report(f"GET {args.path} (renew by {name})", reads)
+        print_report(f"renewals by {name}", renewals)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""Throughput of the cached catalog endpoints.
+
+Run once against a server started with RESPONSE_CACHE_BACKEND=none and once with
+RESPONSE_CACHE_BACKEND=memory (or redis). Pass an admin bearer token to also print the
+hit ratio reported by the worker that served /internal/metrics:
+
+    python -m benchmarks.bench_response_cache --token eyJ...
+"""
+import asyncio
+
+import httpx
+
+from benchmarks.common import base_parser, run_load, print_report
+
+PATHS = ("/book/1/info", "/writer/1/info", "/books/?limit=100", "/writers/?limit=100")
+
+
+def hit_ratio(base_url: str, token: str) -> dict:
+    response = httpx.get(f"{base_url}/internal/metrics", headers={"Authorization": f"Bearer {token}"})
+    counts = response.json()["metrics"].get("response_cache_requests_total", {})
+    ratios = {}
+    for namespace in ("books", "writers"):
+        hits = sum(v for k, v in counts.items() if f"namespace={namespace}" in k and "result=miss" not in k)
+        total = hits + counts.get(f"namespace={namespace},result=miss", 0)
+        ratios[namespace] = hits / total if total else 0.0
+    return ratios
+
+
+def main():
+    parser = base_parser(__doc__)
+    parser.add_argument("--token", help="admin bearer token used to read the hit ratio")
+    args = parser.parse_args()
+
+    for path in PATHS:
+        stats = asyncio.run(run_load(args.base_url, lambda i, p=path: p,
+                                     total=args.requests, concurrency=args.concurrency))
+        print_report(f"GET {path}", stats)
+        etag = httpx.get(args.base_url + path).headers.get("etag")
+        if etag:
+            stats = asyncio.run(run_load(args.base_url, lambda i, p=path: p, total=args.requests,
+                                         concurrency=args.concurrency, headers={"If-None-Match": etag}))
+            print_report(f"GET {path} (If-None-Match)", stats)
+
+    if args.token:
+        print("hit ratio:", hit_ratio(args.base_url, args.token))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""Latency of /books/search against a LIKE scan over the same columns.
+
+Seed a books corpus with a synthetic vocabulary once (1M rows by default), start the
+application and run:
+
+    python -m benchmarks.bench_search --seed 1000000
+    python -m benchmarks.bench_search
+"""
+import asyncio
+import datetime
+import random
+import time
+
+from benchmarks.common import base_parser, run_load, print_report
+
+VOCABULARY = [f"word{i}" for i in range(20_000)]
+GENRES = ("fantasy", "science fiction", "mystery", "romance", "horror", "history", "poetry", "drama")
+
+
+def seed_corpus(rows: int, batch_size: int = 10_000):
+    from src.database import get_engine
+    import src.models as models
+
+    engine = get_engine()
+    rng = random.Random(0)
+    table = models.Book.__table__
+    with engine.begin() as connection:
+        for start in range(0, rows, batch_size):
+            connection.execute(table.insert(), [
+                {"title": f"{' '.join(rng.choices(VOCABULARY, k=3))} {i}", "writer_id": 1,
+                 "description": " ".join(rng.choices(VOCABULARY, k=40)), "publish_date": datetime.date.today(),
+                 "rating": i % 10, "genres": rng.choice(GENRES), "cover_file": "covers/bench.png",
+                 "book_file": "books/bench.pdf"}
+                for i in range(start, min(start + batch_size, rows))
+            ])
+
+
+def like_scan(term: str, limit: int) -> float:
+    """Time of the naive LIKE query the endpoint replaces"""
+    from sqlalchemy import or_, select
+    from src.database import get_engine
+    import src.models as models
+
+    engine = get_engine()
+    pattern = f"%{term}%"
+    query = select(models.Book.id).filter(or_(models.Book.title.like(pattern), models.Book.description.like(pattern),
+                                              models.Book.genres.like(pattern))).limit(limit)
+    started = time.perf_counter()
+    with engine.connect() as connection:
+        connection.execute(query).all()
+    return time.perf_counter() - started
+
+
+def main():
+    parser = base_parser(__doc__)
+    parser.add_argument("--seed", type=int, default=0, help="insert this many rows before benchmarking")
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--like-samples", type=int, default=5, help="LIKE scans to time, 0 to skip")
+    parser.set_defaults(requests=500, concurrency=10)
+    args = parser.parse_args()
+
+    if args.seed:
+        seed_corpus(args.seed)
+
+    terms = random.Random(1).choices(VOCABULARY, k=args.requests)
+    stats = asyncio.run(run_load(args.base_url, lambda i: f"/books/search?q={terms[i]}&limit={args.limit}",
+                                 total=args.requests, concurrency=args.concurrency))
+    print_report("fulltext /books/search", stats)
+    if args.like_samples:
+        timings = [like_scan(term, args.limit) for term in terms[:args.like_samples]]
+        print(f"{'LIKE scan (direct SQL)':<40} mean {sum(timings) / len(timings) * 1000:>8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
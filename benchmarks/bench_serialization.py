@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""Serialization time per 1k rows of the list endpoints, no database or server needed:
+
+    python -m benchmarks.bench_serialization --rows 1000 --repeat 50
+
+- response_model: pydantic orm_mode validation of every row, jsonable_encoder, json.dumps
+  (FastAPI's default path for `response_model=List[...]`)
+- rows + json: row dicts from src.serializers, jsonable_encoder, json.dumps
+- rows + orjson: row dicts from src.serializers encoded by orjson (JSON_RESPONSE_ENCODER=orjson)
+"""
+import argparse
+import datetime
+import json
+import statistics
+import timeit
+from collections import namedtuple
+from types import SimpleNamespace
+
+from fastapi.encoders import jsonable_encoder
+
+import src.schemas as schemas
+import src.serializers as serializers
+
+BookRow = namedtuple("BookRow", [column.key for column in serializers.BOOK_COLUMNS])
+WriterRow = namedtuple("WriterRow", [column.key for column in serializers.WRITER_LIST_COLUMNS])
+
+
+def book_rows(count: int):
+    return [BookRow(id=i, title=f"Book {i}", writer_id=i % 100, description="A fairly ordinary description " * 4,
+                    publish_date=datetime.date(2000, 1, 1) + datetime.timedelta(days=i), rating=i % 10,
+                    genres="fantasy, science fiction", cover_file=f"cas/ab/cd/{i:064x}.png",
+                    book_file=f"cas/ef/01/{i:064x}.pdf") for i in range(count)]
+
+
+def writer_rows(count: int):
+    return [WriterRow(id=i, name=f"Name {i}", lastname=f"Lastname {i}", born=datetime.date(1900, 1, 1), died=None)
+            for i in range(count)]
+
+
+def media_url(key):
+    return "http://127.0.0.1:8080/media/" + key if key else None
+
+
+def response_model_books(rows):
+    items = [schemas.Book.from_orm(SimpleNamespace(**{**row._asdict(), "cover_file": media_url(row.cover_file),
+                                                      "book_file": media_url(row.book_file)})) for row in rows]
+    return json.dumps(jsonable_encoder(items), ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def response_model_writers(rows):
+    items = [schemas.Writer.from_orm(SimpleNamespace(**row._asdict())) for row in rows]
+    return json.dumps(jsonable_encoder(items), ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    try:
+        import orjson
+    except ImportError:
+        orjson = None
+
+    books, writers = book_rows(args.rows), writer_rows(args.rows)
+    cases = [
+        ("books response_model", lambda: response_model_books(books)),
+        ("books rows + json", lambda: serializers.encode_json(
+            [serializers.book_row_dict(row, media_url) for row in books])),
+        ("writers response_model", lambda: response_model_writers(writers)),
+        ("writers rows + json", lambda: serializers.encode_json([serializers.writer_row_dict(row) for row in writers])),
+    ]
+    if orjson is not None:
+        cases.insert(2, ("books rows + orjson", lambda: orjson.dumps(
+            [serializers.book_row_dict(row, media_url) for row in books], default=jsonable_encoder)))
+        cases.append(("writers rows + orjson", lambda: orjson.dumps(
+            [serializers.writer_row_dict(row) for row in writers], default=jsonable_encoder)))
+    else:
+        print("orjson is not installed, skipping the fast path")
+
+    for name, case in cases:
+        timings = timeit.repeat(case, number=1, repeat=args.repeat)
+        per_1k = statistics.median(timings) * 1000 * 1000 / args.rows
+        print(f"{name:<28} {per_1k:>8.2f} ms / 1k rows  ({len(case())} bytes)")
+
+
+if __name__ == "__main__":
+    main()
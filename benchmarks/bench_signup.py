@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""User signup latency, now that the QR code and welcome email are sent by the job workers.
+
+Posts unique users to /users/ and reports the latency and how much --watch-dir grew. With
+--smtp-port a local SMTP sink is started (needs `pip install aiosmtpd`) and the time until
+every welcome email arrived is reported as well. Point the workers at it without TLS and
+credentials:
+
+    MAIL_SERVER=127.0.0.1 MAIL_PORT=8025 MAIL_STARTTLS=false MAIL_USE_CREDENTIALS=false python -m src.jobs
+    python -m benchmarks.bench_signup --requests 200 --concurrency 20 --smtp-port 8025
+"""
+import asyncio
+import pathlib
+import statistics
+import time
+import uuid
+from typing import Dict, List
+
+import httpx
+
+from benchmarks.common import base_parser, percentile, print_report
+
+
+class Sink:
+    """aiosmtpd handler counting the received messages"""
+
+    def __init__(self):
+        self.received = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        self.received += 1
+        return "250 Message accepted for delivery"
+
+
+async def wait_for_mail(sink: Sink, expected: int, timeout: float) -> float:
+    started = time.perf_counter()
+    while sink.received < expected and time.perf_counter() - started < timeout:
+        await asyncio.sleep(0.05)
+    return time.perf_counter() - started
+
+
+async def signup(args) -> dict:
+    """Like common.run_load, but every request posts a new user"""
+    run = uuid.uuid4().hex[:8]
+    latencies: List[float] = []
+    statuses: Dict[int, int] = {}
+    counter = iter(range(args.requests))
+
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=60) as client:
+        async def worker():
+            for i in counter:
+                user = {"username": f"bench_{run}_{i}", "email": f"bench_{run}_{i}@example.com",
+                        "full_name": "Bench User", "password": "secret123", "role": "user"}
+                started = time.perf_counter()
+                response = await client.post("/users/", json=user)
+                latencies.append(time.perf_counter() - started)
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return {"requests": args.requests, "elapsed": elapsed, "rps": args.requests / elapsed,
+            "mean_ms": statistics.mean(latencies) * 1000, "p50_ms": percentile(latencies, 50) * 1000,
+            "p95_ms": percentile(latencies, 95) * 1000, "p99_ms": percentile(latencies, 99) * 1000,
+            "statuses": statuses}
+
+
+def disk_usage(directory: pathlib.Path) -> int:
+    return sum(path.stat().st_size for path in directory.rglob("*") if path.is_file()) if directory.is_dir() else 0
+
+
+def main():
+    parser = base_parser(__doc__)
+    parser.add_argument("--smtp-port", type=int, default=None, help="start an SMTP sink on this port")
+    parser.add_argument("--mail-timeout", type=float, default=120.0)
+    parser.add_argument("--watch-dir", type=pathlib.Path, default=pathlib.Path("src") / "media_protected",
+                        help="reports how much this directory grew during the run")
+    parser.set_defaults(requests=200, concurrency=20)
+    args = parser.parse_args()
+
+    controller = sink = None
+    if args.smtp_port:
+        try:
+            from aiosmtpd.controller import Controller
+        except ImportError:
+            parser.error("--smtp-port needs aiosmtpd installed")
+        sink = Sink()
+        controller = Controller(sink, hostname="127.0.0.1", port=args.smtp_port)
+        controller.start()
+    disk_before = disk_usage(args.watch_dir)
+    try:
+        stats = asyncio.run(signup(args))
+        print_report("POST /users/", stats)
+        if sink is not None:
+            created = stats["statuses"].get(200, 0)
+            elapsed = asyncio.run(wait_for_mail(sink, created, args.mail_timeout))
+            print(f"{sink.received}/{created} welcome emails delivered {elapsed:.2f} s after the last signup")
+        print(f"{args.watch_dir} grew by {disk_usage(args.watch_dir) - disk_before} bytes")
+    finally:
+        if controller is not None:
+            controller.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""Cold start of the app: import time breakdown, app factory time and time to first request.
+
+Each step runs in a fresh interpreter from the src directory. The import breakdown comes
+from `python -X importtime` and lists the packages costing the most.
+Time to first request starts the server and polls GET / until it answers:
+
+    python -m benchmarks.bench_startup --top 15
+"""
+import argparse
+import os
+import pathlib
+import shlex
+import signal
+import subprocess
+import sys
+import time
+
+import httpx
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+ENV = {**os.environ, "PYTHONPATH": os.pathsep.join([str(ROOT), str(ROOT / "src")])}
+
+
+def python(code: str, *options: str) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, *options, "-c", code], cwd=ROOT / "src", env=ENV,
+                          capture_output=True, text=True, check=True)
+
+
+def import_breakdown(top: int):
+    """Self import time summed per top-level package, so e.g. every sqlalchemy submodule counts once"""
+    stderr = python("import src.main", "-X", "importtime").stderr
+    packages = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        package = name.strip().split(".")[0]
+        packages[package] = packages.get(package, 0) + int(self_us)
+    total = sum(packages.values())
+    print(f"import src.main: {total / 1000:.1f} ms in {len(packages)} packages")
+    for package, self_us in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]:
+        print(f"  {self_us / 1000:>8.1f} ms  {self_us / total:>6.1%}  {package}")
+
+
+def factory_time():
+    code = ("import time; started = time.perf_counter(); from src.main import create_app; "
+            "imported = time.perf_counter(); create_app(); print(imported - started, time.perf_counter() - imported)")
+    imported, created = map(float, python(code).stdout.split())
+    print(f"import src.main {imported * 1000:.1f} ms, create_app() {created * 1000:.1f} ms")
+
+
+def first_request(server_cmd: str, port: int, timeout: float):
+    command = shlex.split(server_cmd) + ["--workers", "1", "--port", str(port)]
+    started = time.perf_counter()
+    server = subprocess.Popen(command, cwd=ROOT / "src", env=ENV, stdout=subprocess.DEVNULL,
+                              stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - started < timeout:
+            try:
+                httpx.get(f"http://127.0.0.1:{port}/", timeout=1).raise_for_status()
+                break
+            except httpx.HTTPError:
+                time.sleep(0.01)
+        else:
+            raise RuntimeError(f"No answer on port {port} within {timeout} s")
+        print(f"time to first request {(time.perf_counter() - started) * 1000:.0f} ms")
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--port", type=int, default=8091)
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--server-cmd", default=f"{sys.executable} -m src.server",
+                        help="--workers and --port are appended")
+    parser.add_argument("--skip-server", action="store_true")
+    args = parser.parse_args()
+
+    import_breakdown(args.top)
+    factory_time()
+    if not args.skip_server:
+        first_request(args.server_cmd, args.port, args.timeout)
+
+
+if __name__ == "__main__":
+    main()
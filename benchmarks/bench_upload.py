@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""Upload throughput of /book/add_form and peak RSS of the server process.
+
+Start the application, note its pid and run:
+
+    python -m benchmarks.bench_upload --size-mb 500 --uploads 5 --server-pid 12345
+"""
+import os
+import tempfile
+import time
+import uuid
+
+import httpx
+
+from benchmarks.common import base_parser
+
+
+def peak_rss_mb(pid: int) -> float:
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def main():
+    parser = base_parser(__doc__)
+    parser.add_argument("--size-mb", type=int, default=500)
+    parser.add_argument("--uploads", type=int, default=3)
+    parser.add_argument("--server-pid", type=int)
+    args = parser.parse_args()
+
+    with tempfile.NamedTemporaryFile(suffix=".pdf") as payload:
+        for _ in range(args.size_mb):
+            payload.write(os.urandom(1024 * 1024))
+        payload.flush()
+
+        with httpx.Client(base_url=args.base_url, timeout=None) as client:
+            for i in range(args.uploads):
+                payload.seek(0)
+                started = time.perf_counter()
+                response = client.post("/book/add_form",
+                                       data={"title": f"Upload bench {uuid.uuid4().hex}", "writer_id": "1",
+                                             "rating": "1", "genres": "bench"},
+                                       files={"book_file": ("bench.pdf", payload, "application/pdf")})
+                elapsed = time.perf_counter() - started
+                print(f"upload {i}: HTTP {response.status_code} {args.size_mb / elapsed:>8.1f} MB/s")
+
+    if args.server_pid:
+        print(f"server peak RSS: {peak_rss_mb(args.server_pid):.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""Throughput scaling of the production launcher (src.server) across worker counts.
+
+Starts `python -m src.server` with 1, 2, 4 and 8 workers in turn, loads --path and stops it
+with SIGTERM. The load is generated by --clients processes so the client does not become
+the bottleneck before the server does; keep them on other cores than the workers if you can:
+
+    python -m benchmarks.bench_workers --path /book/1/info --requests 20000 --clients 4
+"""
+import asyncio
+import multiprocessing
+import os
+import pathlib
+import shlex
+import signal
+import subprocess
+import sys
+import time
+
+import httpx
+
+from benchmarks.common import base_parser, run_load
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+
+
+def load(base_url: str, path: str, total: int, concurrency: int) -> dict:
+    return asyncio.run(run_load(base_url, lambda i: path, total=total, concurrency=concurrency))
+
+
+def wait_ready(base_url: str, path: str, timeout: float):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(base_url + path, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Server did not answer on {base_url} within {timeout} s")
+
+
+def measure(args, workers: int) -> dict:
+    command = shlex.split(args.server_cmd) + ["--workers", str(workers), "--port", str(args.port)]
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join([str(ROOT), str(ROOT / "src")])}
+    server = subprocess.Popen(command, cwd=args.app_dir, env=env, stdout=subprocess.DEVNULL,
+                              stderr=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{args.port}"
+    try:
+        wait_ready(base_url, args.path, timeout=30)
+        # Connections and per-worker caches are set up by the first requests, those are not measured
+        load(base_url, args.path, total=workers * 50, concurrency=workers * 4)
+        share = args.requests // args.clients
+        with multiprocessing.get_context("spawn").Pool(args.clients) as pool:
+            started = time.perf_counter()
+            results = pool.starmap(load, [(base_url, args.path, share, args.concurrency // args.clients)]
+                                   * args.clients)
+            elapsed = time.perf_counter() - started
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=60)
+    statuses = {}
+    for result in results:
+        for code, count in result["statuses"].items():
+            statuses[code] = statuses.get(code, 0) + count
+    return {"rps": share * args.clients / elapsed,
+            "p50_ms": sum(result["p50_ms"] for result in results) / len(results),
+            "p99_ms": max(result["p99_ms"] for result in results), "statuses": statuses}
+
+
+def main():
+    parser = base_parser(__doc__)
+    parser.add_argument("--path", default="/")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--clients", type=int, default=4, help="load generator processes")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--app-dir", default=str(ROOT / "src"), help="working directory of the server")
+    parser.add_argument("--server-cmd", default=f"{sys.executable} -m src.server",
+                        help="--workers and --port are appended")
+    parser.set_defaults(requests=20000, concurrency=200)
+    args = parser.parse_args()
+
+    baseline = None
+    for workers in args.workers:
+        stats = measure(args, workers)
+        baseline = baseline or stats["rps"]
+        print(f"{workers:>2} workers {stats['rps']:>10.1f} req/s  x{stats['rps'] / baseline:>5.2f}  "
+              f"p50 {stats['p50_ms']:>8.2f} ms  p99 {stats['p99_ms']:>8.2f} ms  {stats['statuses']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+import argparse
+import asyncio
+import os
+import statistics
+import time
+from typing import Callable, Dict, List, Optional
+
+import httpx
+
+BASE_URL = os.getenv("BENCH_BASE_URL", "http://127.0.0.1:8080")
+
+
+def base_parser(description: str) -> argparse.ArgumentParser:
+    """Returns an argument parser with the options shared by every benchmark"""
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--base-url", default=BASE_URL)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    return parser
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def run_load(base_url: str,
+                   path_factory: Callable[[int], str],
+                   total: int,
+                   concurrency: int,
+                   method: str = "GET",
+                   headers: Optional[Dict[str, str]] = None,
+                   **request_kwargs) -> dict:
+    """Fires `total` requests with at most `concurrency` in flight and returns latency stats"""
+    latencies: List[float] = []
+    statuses: Dict[int, int] = {}
+    counter = iter(range(total))
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, headers=headers, limits=limits, timeout=60) as client:
+        async def worker():
+            for i in counter:
+                started = time.perf_counter()
+                response = await client.request(method, path_factory(i), **request_kwargs)
+                latencies.append(time.perf_counter() - started)
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "requests": total,
+        "elapsed": elapsed,
+        "rps": total / elapsed if elapsed else 0.0,
+        "mean_ms": statistics.mean(latencies) * 1000 if latencies else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "statuses": statuses,
+    }
+
+
+def print_report(name: str, stats: dict):
+    print(f"{name:<40} {stats['rps']:>10.1f} req/s  "
+          f"mean {stats['mean_ms']:>8.2f} ms  p50 {stats['p50_ms']:>8.2f} ms  "
+          f"p95 {stats['p95_ms']:>8.2f} ms  p99 {stats['p99_ms']:>8.2f} ms  {stats['statuses']}")
@@ -1 +1 @@
-from .mysql_connection_string import mysql_connection_string
+from .mysql_connection_string import mysql_connection_string, mysql_async_connection_string
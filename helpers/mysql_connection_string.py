@@ -2,12 +2,18 @@
 import settings
 
 
-def mysql_connection_string() -> str:
+def mysql_connection_string(driver: str = "mysqldb") -> str:
     """Returns mysql connection string"""
-    return "mysql+mysqldb://{}:{}@{}:{}/{}?charset=utf8mb4".format(
+    return "mysql+{}://{}:{}@{}:{}/{}?charset=utf8mb4".format(
+        driver,
         settings.DB_USERNAME,
         settings.DB_PASSWORD,
         settings.DB_HOST,
         settings.DB_PORT,
         settings.DB_DATABASE,
-    )
\ No newline at end of file
+    )
+
+
+def mysql_async_connection_string() -> str:
+    """Returns mysql connection string for the asyncio (aiomysql) driver"""
+    return mysql_connection_string(driver="aiomysql")
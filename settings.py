@@ -14,6 +14,13 @@ DB_USERNAME = os.getenv("DB_USERNAME", "root")
 DB_PASSWORD = os.getenv("DB_PASSWORD", "")
 DB_DATABASE = os.getenv("DB_DATABASE", "db_name")
 
+# DATABASE POOL
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "3600"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
 # MAIL
 MAIL_USERNAME = os.getenv("MAIL_USERNAME", "username")
 MAIL_PASSWORD = os.getenv("MAIL_PASSWORD", "********")
@@ -21,14 +28,101 @@ MAIL_FROM = os.getenv("MAIL_FROM", "test@example.com")
 MAIL_PORT = int(os.getenv("MAIL_PORT", "587"))
 MAIL_SERVER = os.getenv("MAIL_SERVER", "mail server")
 MAIL_FROM_NAME = os.getenv("MAIL_FROM_NAME", "Test Admin Name").replace('_', ' ')
+# Turn both off to send through a local stand-in such as `python -m aiosmtpd -n`
+MAIL_STARTTLS = os.getenv("MAIL_STARTTLS", "true").lower() in ("1", "true", "yes")
+MAIL_USE_CREDENTIALS = os.getenv("MAIL_USE_CREDENTIALS", "true").lower() in ("1", "true", "yes")
+# SMTP connections kept open by each job worker process
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", "2"))
 
 # to get a string like this run:
 # openssl rand -hex 32
 SECRET_KEY = os.getenv("SECRET_KEY", "")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
-ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "15"))
+# Lifetime of a login session, its refresh token is rotated on every use but the session never outlives this
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "30"))
+# Seconds between two remove_expired_sessions jobs, queued by the src.jobs workers
+SESSION_CLEANUP_INTERVAL = int(os.getenv("SESSION_CLEANUP_INTERVAL", "3600"))
+
+# SERVER, see src.server
+SERVER_HOST = os.getenv("SERVER_HOST", "0.0.0.0")
+SERVER_PORT = int(os.getenv("SERVER_PORT", "8080"))
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", str(os.cpu_count() or 1)))
+# Seconds workers get to finish their in-flight requests on SIGTERM
+GRACEFUL_TIMEOUT = float(os.getenv("GRACEFUL_TIMEOUT", "30"))
+DEBUG = os.getenv("DEBUG", "false").lower() in ("1", "true", "yes")
+
+# PASSWORD HASHING
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 1)))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64"))
+
+# CACHES
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", "60"))
+# Verified bearer tokens, kept until their exp
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+# Disabled users and admins are reloaded this often, see src.internal.tokens.RevocationList
+REVOCATION_REFRESH_SECONDS = float(os.getenv("REVOCATION_REFRESH_SECONDS", "30"))
+# Rendered OTP QR codes, keyed by provisioning URI
+QR_CODE_CACHE_SIZE = int(os.getenv("QR_CODE_CACHE_SIZE", "1000"))
+QR_CODE_CACHE_TTL = int(os.getenv("QR_CODE_CACHE_TTL", "300"))
+# memory, redis or none. memory is per process, src.server turns it off with more than one worker
+RESPONSE_CACHE_BACKEND = os.getenv("RESPONSE_CACHE_BACKEND", "memory").lower()
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "5000"))
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", "300"))
+RESPONSE_CACHE_REDIS_URL = os.getenv("RESPONSE_CACHE_REDIS_URL", "redis://127.0.0.1:6379/0")
+
+# RATE LIMITING
+# memory (per worker), redis (shared by all workers) or none
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory").lower()
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL", "redis://127.0.0.1:6379/0")
+# Clients tracked by the memory backend, about 300 bytes each
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+# <requests>/<seconds>, checked before any password hashing or DB lookup
+RATE_LIMIT_LOGIN_PER_IP = os.getenv("RATE_LIMIT_LOGIN_PER_IP", "30/60")
+RATE_LIMIT_LOGIN_FAILURES_PER_USERNAME = os.getenv("RATE_LIMIT_LOGIN_FAILURES_PER_USERNAME", "5/300")
+RATE_LIMIT_REFRESH_PER_IP = os.getenv("RATE_LIMIT_REFRESH_PER_IP", "60/60")
+RATE_LIMIT_SIGNUP_PER_IP = os.getenv("RATE_LIMIT_SIGNUP_PER_IP", "10/3600")
+
 cwd = Path.cwd()
 
+# SERIALIZATION
+# json, or orjson for the fast path (needs the optional `orjson` package)
+JSON_RESPONSE_ENCODER = os.getenv("JSON_RESPONSE_ENCODER", "json").lower()
+
+# UPLOADS
+MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", str(1024 * 1024 * 1024)))
+BULK_IMPORT_BATCH_SIZE = int(os.getenv("BULK_IMPORT_BATCH_SIZE", "1000"))
+
+# IMAGES
+# Cover widths served for ?w=, any other width is rounded up to the next one
+COVER_WIDTHS = tuple(sorted(int(width) for width in os.getenv("COVER_WIDTHS", "160,320,640").split(",")))
+COVER_CACHE_MAX_BYTES = int(os.getenv("COVER_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+
+# JOBS
+JOB_WORKER_CONCURRENCY = int(os.getenv("JOB_WORKER_CONCURRENCY", "4"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1.0"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+# Retry n waits JOB_RETRY_BASE_SECONDS * 2 ** (n - 1), +-20% jitter
+JOB_RETRY_BASE_SECONDS = int(os.getenv("JOB_RETRY_BASE_SECONDS", "10"))
+# Jobs in progress for longer are considered abandoned by a crashed worker and run again
+JOB_LOCK_TIMEOUT = int(os.getenv("JOB_LOCK_TIMEOUT", "300"))
+
+# METRICS
+# Per request metrics middleware, the values are shown to admins at GET /internal/metrics
+REQUEST_METRICS = os.getenv("REQUEST_METRICS", "true").lower() in ("1", "true", "yes")
+# Bearer token Prometheus scrapes GET /metrics with (`authorization` in the scrape config).
+# The endpoint only exists when it is set.
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+# Per statement profile at GET /internal/queries, statements are attributed to routes through
+# the metrics middleware. Off by default, it times and aggregates every statement.
+SQL_PROFILER = os.getenv("SQL_PROFILER", "false").lower() in ("1", "true", "yes")
+SQL_SLOW_QUERY_MS = float(os.getenv("SQL_SLOW_QUERY_MS", "100"))
+# Runs EXPLAIN for slow SELECTs on the same connection, right after them
+SQL_EXPLAIN_SLOW = os.getenv("SQL_EXPLAIN_SLOW", "false").lower() in ("1", "true", "yes")
+SQL_PROFILER_MAX_STATEMENTS = int(os.getenv("SQL_PROFILER_MAX_STATEMENTS", "2000"))
+
 
 class LogConfig(BaseModel):
     """Logging configuration to be set for the server"""
@@ -59,5 +153,9 @@ class LogConfig(BaseModel):
     }
 
 
-dictConfig(LogConfig().dict())
+def configure_logging():
+    """Installs the handlers of `logger`, called by the entry points instead of on import"""
+    dictConfig(LogConfig().dict())
+
+
 logger = logging.getLogger("library_app")
@@ -0,0 +1,344 @@
+import argparse
+import asyncio
+import csv
+import json
+import time
+from collections import Counter, deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, NamedTuple, Optional, Tuple, Type
+
+from fastapi import Request
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import select, tuple_
+from sqlalchemy.dialects.mysql import insert
+from sqlalchemy.exc import DataError, IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import settings
+import src.crud as crud
+import src.models as models
+import src.schemas as schemas
+from src.database import AsyncSessionLocal
+
+MAX_REPORTED_ERRORS = 1000
+# Bounds the size of a single INSERT, books have about ten columns per row
+MAX_BATCH_SIZE = 5000
+
+
+BatchCheck = Callable[[AsyncSession, List[dict]], Awaitable[List[Optional[str]]]]
+BatchRead = Callable[[AsyncSession, List[dict]], Awaitable[Any]]
+BatchHook = Callable[[AsyncSession, List[dict], Any], Awaitable[None]]
+
+
+class Importer(NamedTuple):
+    schema: Type[BaseModel]
+    model: type
+    # Rows are upserted against the unique indexes ix_books_title_writer_id and
+    # ix_writers_name_lastname_born, these columns are refreshed on duplicates
+    update_columns: Tuple[str, ...]
+    # Returns an error (or None) per row, rejected rows are left out of the insert
+    check_batch: Optional[BatchCheck] = None
+    # Runs inside the transaction of every batch before the insert, what it returns is passed to the hooks below
+    before_batch: Optional[BatchRead] = None
+    # Runs inside the transaction of every batch, after the insert
+    after_batch: Optional[BatchHook] = None
+    # Runs once the batch is committed
+    after_commit: Optional[BatchHook] = None
+
+
+MEDIA_COLUMNS = ("cover_file", "book_file")
+BookMedia = Dict[Tuple[str, int], Tuple[Optional[str], ...]]
+
+
+def book_key(row: dict) -> Tuple[str, int]:
+    # ix_books_title_writer_id compares titles case insensitively
+    return row["title"].lower(), row["writer_id"]
+
+
+async def check_books(db: AsyncSession, batch: List[dict]) -> List[Optional[str]]:
+    """The writers must exist and the media keys must name files already stored, such as by /book/add_form"""
+    writer_ids = {row["writer_id"] for row in batch}
+    result = await db.execute(select(models.Writer.id).filter(models.Writer.id.in_(writer_ids)))
+    known = set(result.scalars().all())
+    stored = await crud.lock_stored_media(db, {row[column] for row in batch for column in MEDIA_COLUMNS})
+    errors = []
+    for row in batch:
+        missing = [row[column] for column in MEDIA_COLUMNS if row[column] not in stored]
+        if row["writer_id"] not in known:
+            errors.append(f"Writer {row['writer_id']} not found")
+        elif missing:
+            errors.append(f"Media file {missing[0]} not found")
+        else:
+            errors.append(None)
+    return errors
+
+
+async def get_books_media(db: AsyncSession, batch: List[dict]) -> BookMedia:
+    """Media keys the books of the batch that already exist hold, before the upsert replaces them"""
+    result = await db.execute(select(models.Book.title, models.Book.writer_id,
+                                     *(getattr(models.Book, column) for column in MEDIA_COLUMNS))
+                              .filter(tuple_(models.Book.title, models.Book.writer_id)
+                                      .in_([(row["title"], row["writer_id"]) for row in batch])))
+    return {(title.lower(), writer_id): tuple(keys) for title, writer_id, *keys in result.all()}
+
+
+async def sync_books(db: AsyncSession, batch: List[dict], held: BookMedia):
+    """Links the genres of an upserted batch and moves the media references from the old keys to the new ones"""
+    result = await db.execute(select(models.Book.id, models.Book.title, models.Book.writer_id)
+                              .filter(tuple_(models.Book.title, models.Book.writer_id)
+                                      .in_([(row["title"], row["writer_id"]) for row in batch])))
+    genres = {book_key(row): row["genres"] for row in batch}
+    await crud.link_book_genres(db, {book_id: genres.get((title.lower(), writer_id))
+                                     for book_id, title, writer_id in result.all()})
+
+    held = dict(held)
+    deltas: Counter = Counter()
+    # In order, a book listed twice in one batch ends up with the keys of its last row
+    for row in batch:
+        keys = tuple(row[column] for column in MEDIA_COLUMNS)
+        deltas.update(key for key in keys if key)
+        deltas.subtract(key for key in held.get(book_key(row), ()) if key)
+        held[book_key(row)] = keys
+    await crud.add_media_references(db, deltas)
+
+
+async def remove_released_media(db: AsyncSession, batch: List[dict], held: BookMedia):
+    await crud.remove_unreferenced_media(db, {key for keys in held.values() for key in keys if key})
+
+
+IMPORTERS: Dict[str, Importer] = {
+    "books": Importer(schemas.BookCreate, models.Book,
+                      ("description", "publish_date", "rating", "cover_file", "book_file", "genres"),
+                      check_batch=check_books, before_batch=get_books_media, after_batch=sync_books,
+                      after_commit=remove_released_media),
+    "writers": Importer(schemas.WriterCreate, models.Writer, ("died",)),
+}
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, Optional[str]]]:
+    """Yields (line number, text) per line, the text is None when the line is not valid UTF-8"""
+    buffer = b""
+    line_number = 0
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            line_number += 1
+            yield line_number, decode_line(line.rstrip(b"\r"))
+    if buffer.strip():
+        yield line_number + 1, decode_line(buffer)
+
+
+def decode_line(line: bytes) -> Optional[str]:
+    try:
+        return line.decode("utf-8")
+    except UnicodeDecodeError:
+        return None
+
+
+INVALID_UTF8 = "Line is not valid UTF-8"
+
+
+async def parse_ndjson(lines: AsyncIterator[Tuple[int, Optional[str]]]
+                       ) -> AsyncIterator[Tuple[int, Optional[dict], Optional[str]]]:
+    async for line_number, line in lines:
+        if line is None:
+            yield line_number, None, INVALID_UTF8
+            continue
+        if not line.strip():
+            continue
+        try:
+            yield line_number, json.loads(line), None
+        except ValueError as e:
+            yield line_number, None, f"Invalid JSON: {e}"
+
+
+class LineFeed:
+    """Lines the csv reader pulls from, appended as they arrive from the request.
+
+    It only runs dry at the end of a record, where the reader stops on its own, so a
+    single reader parses the whole body including quoted fields spanning several lines.
+    """
+
+    def __init__(self):
+        self.lines: "deque[str]" = deque()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        if not self.lines:
+            raise StopIteration
+        return self.lines.popleft()
+
+
+async def parse_csv(lines: AsyncIterator[Tuple[int, Optional[str]]]
+                    ) -> AsyncIterator[Tuple[int, Optional[dict], Optional[str]]]:
+    """RFC 4180 records, the first one holds the column names.
+
+    A record ends with the first line leaving no quote open, records are reported with
+    the number of the line they start on.
+    """
+    feed = LineFeed()
+    reader = csv.reader(feed)
+    header: Optional[List[str]] = None
+    record_line, quotes = 0, 0
+    async for line_number, line in lines:
+        if line is None:
+            feed.lines.clear()
+            quotes = 0
+            if header is None:
+                yield line_number, None, "The CSV header is not valid UTF-8"
+                return
+            yield line_number, None, INVALID_UTF8
+            continue
+        if not feed.lines:
+            if not line.strip():
+                continue
+            record_line = line_number
+        feed.lines.append(line + "\n")
+        # Escaped quotes come in pairs, an odd count leaves a quoted field open
+        quotes += line.count('"')
+        if quotes % 2:
+            continue
+        quotes = 0
+        # Normally one record, more when a stray quote inside an unquoted field misled the count
+        while feed.lines:
+            try:
+                values = next(reader)
+            except csv.Error as e:
+                feed.lines.clear()
+                yield record_line, None, f"Invalid CSV: {e}"
+                break
+            if not values:
+                continue
+            if header is None:
+                header = values
+            elif len(values) != len(header):
+                yield record_line, None, f"Expected {len(header)} columns, got {len(values)}"
+            else:
+                yield record_line, {key: value for key, value in zip(header, values) if value != ""}, None
+    if feed.lines:
+        yield record_line, None, "Quoted field is not closed"
+
+
+class BulkImport:
+    """Validates records through the create schemas and upserts them in multi-row batches.
+
+    Every batch is a single INSERT ... ON DUPLICATE KEY UPDATE committed on its own, so an
+    interrupted import keeps the batches already written. Rejected rows are reported with
+    their line number.
+    """
+
+    def __init__(self, db: AsyncSession, kind: str, batch_size: int = settings.BULK_IMPORT_BATCH_SIZE):
+        self.db = db
+        self.importer = IMPORTERS[kind]
+        self.batch_size = batch_size
+        self.accepted = 0
+        self.rejected = 0
+        self.batches = 0
+        self.errors: List[dict] = []
+
+    def _reject(self, line_number: int, errors):
+        self.rejected += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line_number, "errors": errors})
+
+    async def _flush(self, batch: List[Tuple[int, dict]]):
+        if batch and self.importer.check_batch is not None:
+            errors = await self.importer.check_batch(self.db, [row for _, row in batch])
+            for (line_number, _), error in zip(batch, errors):
+                if error is not None:
+                    self._reject(line_number, [error])
+            batch = [item for item, error in zip(batch, errors) if error is None]
+        rows = [row for _, row in batch]
+        if not rows:
+            return
+        statement = insert(self.importer.model).values(rows)
+        statement = statement.on_duplicate_key_update(
+            {column: statement.inserted[column] for column in self.importer.update_columns})
+        try:
+            state = await self.importer.before_batch(self.db, rows) if self.importer.before_batch else None
+            await self.db.execute(statement)
+            if self.importer.after_batch is not None:
+                await self.importer.after_batch(self.db, rows, state)
+            await self.db.commit()
+        except (IntegrityError, DataError) as e:
+            # Such as a value too long for its column, the earlier batches stay committed
+            await self.db.rollback()
+            for line_number, _ in batch:
+                self._reject(line_number, [f"Batch rejected by the database: {e.orig}"])
+            return
+        if self.importer.after_commit is not None:
+            await self.importer.after_commit(self.db, rows, state)
+        self.accepted += len(rows)
+        self.batches += 1
+
+    async def run(self, records: AsyncIterator[Tuple[int, Optional[dict], Optional[str]]]) -> dict:
+        batch: List[Tuple[int, dict]] = []
+        async for line_number, record, error in records:
+            if error is not None:
+                self._reject(line_number, [error])
+                continue
+            try:
+                batch.append((line_number, self.importer.schema.parse_obj(record).dict()))
+            except ValidationError as e:
+                self._reject(line_number, e.errors())
+                continue
+            if len(batch) >= self.batch_size:
+                await self._flush(batch)
+                batch = []
+        await self._flush(batch)
+        return self.report()
+
+    def report(self) -> dict:
+        return {"accepted": self.accepted, "rejected": self.rejected, "batches": self.batches,
+                "errors": self.errors}
+
+
+def parse(lines: AsyncIterator[Tuple[int, Optional[str]]], content_format: str):
+    return parse_csv(lines) if content_format == "csv" else parse_ndjson(lines)
+
+
+def request_format(request: Request) -> str:
+    return "csv" if "csv" in request.headers.get("content-type", "") else "ndjson"
+
+
+async def import_request(db: AsyncSession, kind: str, request: Request, batch_size: int) -> dict:
+    return await BulkImport(db, kind, batch_size).run(parse(iter_lines(request.stream()), request_format(request)))
+
+
+async def read_file(path: str, chunk_size: int = 1024 * 1024) -> AsyncIterator[bytes]:
+    with open(path, "rb") as file:
+        loop = asyncio.get_running_loop()
+        while chunk := await loop.run_in_executor(None, file.read, chunk_size):
+            yield chunk
+
+
+async def import_file(kind: str, path: str, content_format: str, batch_size: int) -> dict:
+    async with AsyncSessionLocal() as db:
+        return await BulkImport(db, kind, batch_size).run(parse(iter_lines(read_file(path)), content_format))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk load books or writers from an NDJSON or CSV file")
+    parser.add_argument("kind", choices=sorted(IMPORTERS))
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=("ndjson", "csv"), default=None,
+                        help="defaults to the file extension")
+    parser.add_argument("--batch-size", type=int, default=settings.BULK_IMPORT_BATCH_SIZE)
+    args = parser.parse_args()
+    if not 1 <= args.batch_size <= MAX_BATCH_SIZE:
+        parser.error(f"--batch-size must be between 1 and {MAX_BATCH_SIZE}")
+    settings.configure_logging()
+
+    content_format = args.format or ("csv" if args.path.endswith(".csv") else "ndjson")
+    started = time.perf_counter()
+    report = asyncio.run(import_file(args.kind, args.path, content_format, args.batch_size))
+    elapsed = time.perf_counter() - started
+    for error in report.pop("errors"):
+        print(f"line {error['line']}: {error['errors']}")
+    print(json.dumps(report), f"{(report['accepted'] + report['rejected']) / elapsed:.0f} rows/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+import src.metrics as metrics
+
+cache_hits = metrics.counter("cache_hits_total", "Lookups answered from the cache", ["cache"])
+cache_misses = metrics.counter("cache_misses_total", "Lookups missing or expired in the cache", ["cache"])
+cache_evictions = metrics.counter("cache_evictions_total", "Entries dropped to respect the size bound", ["cache"])
+cache_size = metrics.gauge("cache_entries", "Entries currently held by the cache", ["cache"])
+
+
+class TTLCache:
+    """Bounded LRU cache whose entries expire `ttl` seconds after they were stored"""
+
+    def __init__(self, name: str, maxsize: int, ttl: float):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                    cache_size.set(len(self._data), cache=self.name)
+                cache_misses.inc(cache=self.name)
+                return default
+            self._data.move_to_end(key)
+        cache_hits.inc(cache=self.name)
+        return entry[1]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        if self.maxsize <= 0:
+            return
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                cache_evictions.inc(cache=self.name)
+            cache_size.set(len(self._data), cache=self.name)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.pop(key, None)
+            cache_size.set(len(self._data), cache=self.name)
+        return default if entry is None else entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            cache_size.set(0, cache=self.name)
+
+    def __len__(self) -> int:
+        return len(self._data)
@@ -1,87 +1,294 @@
-import shutil
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set
+import src.jobs as jobs
 import src.models as models
 import src.schemas as schemas
+import src.serializers as serializers
 import pyotp
-from sqlalchemy.orm import Session
-from fastapi import UploadFile
-from security import pwd_context
-
-
-def get_writers(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Writer).offset(skip).limit(limit).all()
-
-
-def get_writer_by_id(db: Session, writer_id: int):
-    return db.query(models.Writer).filter(models.Writer.id == writer_id).first()
-
-
-def delete_writer_by_id(db: Session, writer: models.Writer):
-    db.delete(writer)
-    db.commit()
+from sqlalchemy import case, delete, func, select, union, update
+from sqlalchemy.dialects.mysql import insert, match
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+from src.security import password_hasher
+from src.storage import media_storage
+from src.uploads import UploadedFile
+
+
+async def get_writers(db: AsyncSession, skip: int = 0, limit: int = 100, after_id: Optional[int] = None):
+    """Returns rows of WRITER_LIST_COLUMNS, see src.serializers.writer_row_dict"""
+    query = select(*serializers.WRITER_LIST_COLUMNS).order_by(models.Writer.id).limit(limit)
+    if after_id is not None:
+        query = query.filter(models.Writer.id > after_id)
+    else:
+        query = query.offset(skip)
+    result = await db.execute(query)
+    return result.all()
+
+
+async def get_writer_by_id(db: AsyncSession, writer_id: int):
+    result = await db.execute(select(models.Writer).filter(models.Writer.id == writer_id))
+    return result.scalars().first()
+
+
+async def delete_writer_by_id(db: AsyncSession, writer: models.Writer):
+    await db.delete(writer)
+    await db.commit()
     return True
 
 
-def get_writer_by_name(db: Session, name: str, lastname: str):
-    return db.query(models.Writer).filter(models.Writer.name == name, models.Writer.lastname == lastname).first()
-
-
-def get_books(db: Session, skip: int = 0, limit: int = 10):
-    return db.query(models.Book).offset(skip).limit(limit).all()
-
-
-def get_book_by_id(db: Session, book_id: int):
-    return db.query(models.Book).filter(models.Book.id == book_id).first()
-
-
-def delete_book_by_id(db: Session, book: models.Book):
-    db.delete(book)
-    db.commit()
+async def get_writer_by_name(db: AsyncSession, name: str, lastname: str):
+    result = await db.execute(
+        select(models.Writer).filter(models.Writer.name == name, models.Writer.lastname == lastname))
+    return result.scalars().first()
+
+
+def book_rows_query(with_writer: bool = False):
+    """Column-only select of books, see src.serializers.book_row_dict"""
+    if not with_writer:
+        return select(*serializers.BOOK_COLUMNS)
+    return (select(*serializers.BOOK_COLUMNS, *serializers.WRITER_COLUMNS)
+            .outerjoin(models.Writer, models.Writer.id == models.Book.writer_id))
+
+
+async def get_books(db: AsyncSession, skip: int = 0, limit: int = 10, after_id: Optional[int] = None,
+                    genres: Optional[List[str]] = None, with_writer: bool = False):
+    """Returns rows of BOOK_COLUMNS, plus WRITER_COLUMNS from the same query with `with_writer`"""
+    query = book_rows_query(with_writer).order_by(models.Book.id).limit(limit)
+    if genres:
+        # Semi-join through ix_book_genres_genre_id_book_id, books having any of the genres
+        query = query.filter(models.Book.id.in_(
+            select(models.book_genres.c.book_id)
+            .join(models.Genre, models.Genre.id == models.book_genres.c.genre_id)
+            .filter(models.Genre.name.in_(parse_genres(",".join(genres))))))
+    if after_id is not None:
+        query = query.filter(models.Book.id > after_id)
+    else:
+        query = query.offset(skip)
+    result = await db.execute(query)
+    return result.all()
+
+
+async def get_book_by_id(db: AsyncSession, book_id: int, with_writer: bool = False):
+    query = select(models.Book).filter(models.Book.id == book_id)
+    if with_writer:
+        query = query.options(joinedload(models.Book.writer))
+    result = await db.execute(query)
+    return result.scalars().first()
+
+
+async def get_writer_books(db: AsyncSession, writer_id: int, skip: int = 0, limit: int = 10,
+                           after_id: Optional[int] = None):
+    query = book_rows_query().filter(models.Book.writer_id == writer_id).order_by(models.Book.id).limit(limit)
+    if after_id is not None:
+        query = query.filter(models.Book.id > after_id)
+    else:
+        query = query.offset(skip)
+    result = await db.execute(query)
+    return result.all()
+
+
+async def writer_has_books(db: AsyncSession, writer_id: int) -> bool:
+    result = await db.execute(select(models.Book.id).filter(models.Book.writer_id == writer_id).limit(1))
+    return result.first() is not None
+
+
+async def delete_book_by_id(db: AsyncSession, book: models.Book):
+    await unlink_book_genres(db, [book.id])
+    await db.delete(book)
+    await db.commit()
     return True
 
 
-def get_book_by_title(db: Session, title: str):
-    return db.query(models.Book).filter(models.Book.title == title).first()
-
-
-def add_writer(db: Session, writer: schemas.WriterCreate):
+async def get_book_by_title(db: AsyncSession, title: str):
+    result = await db.execute(select(models.Book).filter(models.Book.title == title))
+    return result.scalars().first()
+
+
+async def search_books(db: AsyncSession, query: str, skip: int = 0, limit: int = 10, with_writer: bool = False):
+    """Ranked full-text search over title, description, genres and the writer name.
+
+    Candidates are collected by two branches of a UNION so each one is answered by its
+    FULLTEXT index (ix_books_fulltext, ix_writers_fulltext), returns rows of BOOK_COLUMNS
+    (plus WRITER_COLUMNS with `with_writer`) and their relevance, best match first.
+    """
+    book_relevance = match(models.Book.title, models.Book.description, models.Book.genres,
+                           against=query).in_natural_language_mode()
+    writer_relevance = match(models.Writer.name, models.Writer.lastname, against=query).in_natural_language_mode()
+    candidates = union(
+        select(models.Book.id).filter(book_relevance > 0),
+        select(models.Book.id).join(models.Writer, models.Writer.id == models.Book.writer_id)
+        .filter(writer_relevance > 0),
+    ).subquery("candidates")
+    relevance = (book_relevance + func.coalesce(writer_relevance, 0)).label("relevance")
+    result = await db.execute(
+        select(*serializers.BOOK_COLUMNS, *(serializers.WRITER_COLUMNS if with_writer else ()), relevance)
+        .join(candidates, candidates.c.id == models.Book.id)
+        .outerjoin(models.Writer, models.Writer.id == models.Book.writer_id)
+        .order_by(relevance.desc(), models.Book.id)
+        .offset(skip).limit(limit))
+    return result.all()
+
+
+async def add_writer(db: AsyncSession, writer: schemas.WriterCreate):
     db_writer = models.Writer(**writer.dict())
     db.add(db_writer)
-    db.commit()
-    db.refresh(db_writer)
+    await db.commit()
+    await db.refresh(db_writer)
     return db_writer
 
 
-def add_book(db: Session, book: schemas.BookCreate):
+async def add_book(db: AsyncSession, book: schemas.BookCreate):
     db_book = models.Book(**book.dict())
     db.add(db_book)
-    db.commit()
-    db.refresh(db_book)
+    await db.flush()
+    await link_book_genres(db, {db_book.id: db_book.genres})
+    await db.commit()
+    await db.refresh(db_book)
     return db_book
 
 
-def save_file(file: UploadFile):
-    with open(f'{file.filename}', "w+b") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-
-
-def get_user(db: Session, user_id: int):
-    return db.query(models.User).filter(models.User.id == user_id).first()
-
-
-def get_user_by_email(db: Session, email: str):
-    return db.query(models.User).filter(models.User.email == email).first()
-
-
-def get_user_by_username(db: Session, username: str):
-    return db.query(models.User).filter(models.User.username == username).first()
-
-
-def get_users(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.User).offset(skip).limit(limit).all()
-
-
-def create_user(db: Session, user: schemas.UserCreate):
-    hashed_password = pwd_context.hash(user.password)
+def parse_genres(genres: Optional[str]) -> List[str]:
+    """Splits the comma separated `genres` of a book into normalized genre names"""
+    names = []
+    for name in (genres or "").split(","):
+        name = " ".join(name.split()).lower()[:64]
+        if name and name not in names:
+            names.append(name)
+    return names
+
+
+async def _add_to_book_count(db: AsyncSession, counts: Dict[int, int], sign: int):
+    by_count: Dict[int, List[int]] = {}
+    for genre_id, count in sorted(counts.items()):
+        by_count.setdefault(count, []).append(genre_id)
+    for count, genre_ids in by_count.items():
+        await db.execute(update(models.Genre).where(models.Genre.id.in_(genre_ids))
+                         .values(book_count=models.Genre.book_count + sign * count))
+
+
+async def unlink_book_genres(db: AsyncSession, book_ids: Iterable[int]):
+    """Removes the genres of the books and decrements the facet counts, commit to keep it"""
+    book_ids = list(book_ids)
+    result = await db.execute(select(models.book_genres.c.genre_id, func.count())
+                              .filter(models.book_genres.c.book_id.in_(book_ids))
+                              .group_by(models.book_genres.c.genre_id))
+    counts = dict(result.all())
+    if not counts:
+        return
+    await _add_to_book_count(db, counts, -1)
+    await db.execute(models.book_genres.delete().where(models.book_genres.c.book_id.in_(book_ids)))
+
+
+async def link_book_genres(db: AsyncSession, genres_by_book: Dict[int, Optional[str]]):
+    """(Re)links books to the genres named in their `genres` text, commit to keep it.
+
+    The facet counts in genres.book_count are adjusted in the same transaction, so reading
+    them never needs a GROUP BY over book_genres.
+    """
+    await unlink_book_genres(db, genres_by_book)
+    names_by_book = {book_id: parse_genres(genres) for book_id, genres in genres_by_book.items()}
+    names = sorted({name for book_names in names_by_book.values() for name in book_names})
+    if not names:
+        return
+    statement = insert(models.Genre).values([{"name": name, "book_count": 0} for name in names])
+    await db.execute(statement.on_duplicate_key_update(name=statement.inserted.name))
+    result = await db.execute(select(models.Genre.name, models.Genre.id).filter(models.Genre.name.in_(names)))
+    genre_ids = {name.lower(): genre_id for name, genre_id in result.all()}
+    links = [{"book_id": book_id, "genre_id": genre_ids[name]}
+             for book_id, book_names in names_by_book.items() for name in book_names]
+    await db.execute(insert(models.book_genres), links)
+    await _add_to_book_count(db, Counter(link["genre_id"] for link in links), 1)
+
+
+async def get_genre_facets(db: AsyncSession):
+    result = await db.execute(select(models.Genre.name, models.Genre.book_count)
+                              .filter(models.Genre.book_count > 0)
+                              .order_by(models.Genre.book_count.desc(), models.Genre.name))
+    return result.all()
+
+
+async def acquire_media(db: AsyncSession, file: UploadedFile) -> str:
+    """Adds a reference to the stored copy of `file` and returns its media key, commit to keep it"""
+    key = media_storage.key_for(file)
+    statement = insert(models.MediaFile).values(path=key, sha256=file.sha256, size=file.size,
+                                                content_type=file.content_type, refcount=1)
+    await db.execute(statement.on_duplicate_key_update(refcount=models.MediaFile.refcount + 1))
+    return key
+
+
+async def save_file(file: UploadedFile, key: str):
+    await media_storage.save(file, key)
+
+
+async def lock_stored_media(db: AsyncSession, keys: Iterable[str]) -> Set[str]:
+    """The keys of `keys` naming stored files, their rows stay locked until the transaction ends"""
+    result = await db.execute(select(models.MediaFile.path)
+                              .filter(models.MediaFile.path.in_(list(keys)), models.MediaFile.refcount > 0)
+                              .with_for_update())
+    return set(result.scalars().all())
+
+
+async def add_media_references(db: AsyncSession, deltas: Dict[str, int]):
+    """Adds (or with a negative count drops) references to stored files, commit to keep it"""
+    by_delta: Dict[int, List[str]] = {}
+    for key, delta in sorted(deltas.items()):
+        if delta:
+            by_delta.setdefault(delta, []).append(key)
+    for delta, keys in by_delta.items():
+        # The refcount is unsigned, MySQL refuses an UPDATE computing a negative value
+        refcount = case((models.MediaFile.refcount > -delta, models.MediaFile.refcount + delta), else_=0) \
+            if delta < 0 else models.MediaFile.refcount + delta
+        await db.execute(update(models.MediaFile).where(models.MediaFile.path.in_(keys)).values(refcount=refcount))
+
+
+async def remove_unreferenced_media(db: AsyncSession, keys: Iterable[str]):
+    """Removes the files of `keys` left without references from disk, together with their rows"""
+    # The row lock makes a concurrent upload of the same content wait until the file is gone,
+    # it then inserts a fresh row and stores its own copy.
+    result = await db.execute(select(models.MediaFile)
+                              .filter(models.MediaFile.path.in_(list(keys)), models.MediaFile.refcount == 0)
+                              .with_for_update())
+    for media_file in result.scalars().all():
+        await media_storage.remove(media_file.path)
+        await db.delete(media_file)
+    await db.commit()
+
+
+async def release_media(db: AsyncSession, key: str):
+    """Drops a reference to a stored file and removes it from disk with the last one"""
+    await add_media_references(db, {key: -1})
+    await db.commit()
+    await remove_unreferenced_media(db, [key])
+
+
+async def get_user(db: AsyncSession, user_id: int):
+    result = await db.execute(select(models.User).filter(models.User.id == user_id))
+    return result.scalars().first()
+
+
+async def get_user_by_email(db: AsyncSession, email: str):
+    result = await db.execute(select(models.User).filter(models.User.email == email))
+    return result.scalars().first()
+
+
+async def get_user_by_username(db: AsyncSession, username: str):
+    result = await db.execute(select(models.User).filter(models.User.username == username))
+    return result.scalars().first()
+
+
+async def get_users(db: AsyncSession, skip: int = 0, limit: int = 100, after_id: Optional[int] = None):
+    query = select(models.User).order_by(models.User.id).limit(limit)
+    if after_id is not None:
+        query = query.filter(models.User.id > after_id)
+    else:
+        query = query.offset(skip)
+    result = await db.execute(query)
+    return result.scalars().all()
+
+
+async def create_user(db: AsyncSession, user: schemas.UserCreate):
+    hashed_password = await password_hasher.hash(user.password)
     db_user = models.User(
         username=user.username,
         email=user.email,
@@ -91,17 +298,74 @@ def create_user(db: Session, user: schemas.UserCreate):
         role=user.role
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.flush()
+    # Committed together with the user, so every account gets its welcome email exactly once queued
+    jobs.enqueue(db, "new_user_email", {"user_id": db_user.id}, priority=models.Job.PRIORITY_HIGH)
+    await db.commit()
+    await db.refresh(db_user)
     return db_user
 
 
-def update_user_self(db: Session, current_user: schemas.User, user_update: schemas.UserUpdate):
-    db_user = get_user(db, current_user.id)
+async def update_user_self(db: AsyncSession, current_user: schemas.User, user_update: schemas.UserUpdate):
+    db_user = await get_user(db, current_user.id)
     db_user.email = user_update.email
     db_user.username = user_update.username
     db_user.full_name = user_update.full_name
-    db_user.hashed_password = pwd_context.hash(user_update.password)
-    db.commit()
-    db.refresh(db_user)
+    db_user.hashed_password = await password_hasher.hash(user_update.password)
+    await db.commit()
+    await db.refresh(db_user)
     return db_user
+
+
+async def create_session(db: AsyncSession, user_id: int, token_hash: str, expires_at: datetime) -> models.UserSession:
+    db_session = models.UserSession(user_id=user_id, token_hash=token_hash, expires_at=expires_at)
+    db.add(db_session)
+    await db.commit()
+    return db_session
+
+
+async def get_session_with_user(db: AsyncSession, session_id: int):
+    """The session and its user in one primary key lookup, (None, None) if there is no such session"""
+    result = await db.execute(select(models.UserSession, models.User)
+                              .join(models.User, models.User.id == models.UserSession.user_id)
+                              .filter(models.UserSession.id == session_id))
+    return result.first() or (None, None)
+
+
+async def rotate_session(db: AsyncSession, db_session: models.UserSession, token_hash: str) -> bool:
+    """Replaces the token hash unless another request rotated or revoked the session meanwhile"""
+    result = await db.execute(update(models.UserSession)
+                              .where(models.UserSession.id == db_session.id,
+                                     models.UserSession.token_hash == db_session.token_hash,
+                                     models.UserSession.revoked_at.is_(None))
+                              .values(token_hash=token_hash, previous_token_hash=db_session.token_hash)
+                              .execution_options(synchronize_session=False))
+    await db.commit()
+    return result.rowcount == 1
+
+
+async def revoke_sessions(db: AsyncSession, user_id: int, session_id: Optional[int] = None) -> int:
+    """Revokes one session of the user, or all of them, and returns how many were still active"""
+    query = (update(models.UserSession)
+             .where(models.UserSession.user_id == user_id, models.UserSession.revoked_at.is_(None))
+             .values(revoked_at=datetime.utcnow())
+             .execution_options(synchronize_session=False))
+    if session_id is not None:
+        query = query.where(models.UserSession.id == session_id)
+    result = await db.execute(query)
+    await db.commit()
+    return result.rowcount
+
+
+async def delete_expired_sessions(db: AsyncSession, batch_size: int = 1000) -> int:
+    deleted = 0
+    while True:
+        ids = (await db.execute(select(models.UserSession.id)
+                                .filter(models.UserSession.expires_at < datetime.utcnow())
+                                .limit(batch_size))).scalars().all()
+        if not ids:
+            return deleted
+        await db.execute(delete(models.UserSession).where(models.UserSession.id.in_(ids))
+                         .execution_options(synchronize_session=False))
+        await db.commit()
+        deleted += len(ids)
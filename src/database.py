@@ -1,8 +1,129 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+import time
+
+from sqlalchemy import create_engine, event, exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine, AsyncSession
+from sqlalchemy.orm import Session, sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
-from helpers import mysql_connection_string
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+
+import settings
+import src.metrics as metrics
+from helpers import mysql_connection_string, mysql_async_connection_string
+
+pool_checkout_seconds = metrics.histogram("db_pool_checkout_seconds",
+                                          "Time spent waiting for a pooled connection", ["pool"])
+pool_checkouts = metrics.counter("db_pool_checkouts_total", "Connections checked out of the pool", ["pool"])
+pool_timeouts = metrics.counter("db_pool_timeouts_total", "Checkouts that hit DB_POOL_TIMEOUT", ["pool"])
+pool_connects = metrics.counter("db_pool_connects_total", "New DBAPI connections opened", ["pool"])
+pool_in_use = metrics.gauge("db_pool_in_use", "Connections currently checked out", ["pool"])
+
+
+class TimedPoolMixin:
+    """Records how long every checkout waited on the pool and how many of them timed out"""
+    label = ""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            pool_timeouts.inc(pool=self.label)
+            settings.logger.warning(f"Timed out waiting for a {self.label} DB connection: {self.status()}")
+            raise
+        finally:
+            pool_checkout_seconds.observe(time.perf_counter() - started, pool=self.label)
+
+
+class TimedQueuePool(TimedPoolMixin, QueuePool):
+    label = "sync"
+
+
+class TimedAsyncAdaptedQueuePool(TimedPoolMixin, AsyncAdaptedQueuePool):
+    label = "async"
+
+
+def pool_options() -> dict:
+    return dict(pool_size=settings.DB_POOL_SIZE,
+                max_overflow=settings.DB_MAX_OVERFLOW,
+                pool_recycle=settings.DB_POOL_RECYCLE,
+                pool_timeout=settings.DB_POOL_TIMEOUT,
+                pool_pre_ping=settings.DB_POOL_PRE_PING)
+
+
+def instrument_pool(pool, label: str):
+    event.listen(pool, "connect", lambda *args: pool_connects.inc(pool=label))
+    event.listen(pool, "checkin", lambda *args: pool_in_use.dec(pool=label))
+
+    @event.listens_for(pool, "checkout")
+    def on_checkout(*args):
+        pool_checkouts.inc(pool=label)
+        pool_in_use.inc(pool=label)
+
+
+def pool_status(db_engine) -> dict:
+    pool = db_engine.pool
+    return {"size": pool.size(), "checked_out": pool.checkedout(), "overflow": pool.overflow(),
+            "checked_in": pool.checkedin(), "timeout": pool.timeout()}
+
+
+class LazyBoundSession(Session):
+    """Session bound to the sync engine, which is only created by the first session"""
+
+    def __init__(self, bind=None, **kwargs):
+        super().__init__(bind=bind if bind is not None else get_engine(), **kwargs)
+
+
+class LazyBoundAsyncSession(AsyncSession):
+    """Session bound to the async engine, which is only created by the first session"""
+
+    def __init__(self, bind=None, **kwargs):
+        super().__init__(bind=bind if bind is not None else get_async_engine(), **kwargs)
+
+
+_engines = {}
+
+
+def get_engine() -> Engine:
+    """The sync engine, created on first use so importing the app never touches the DB driver"""
+    if "sync" not in _engines:
+        db_engine = create_engine(mysql_connection_string(), poolclass=TimedQueuePool, **pool_options())
+        instrument_pool(db_engine.pool, TimedQueuePool.label)
+        if settings.SQL_PROFILER:
+            from src.query_profiler import query_profiler
+
+            query_profiler.instrument(db_engine)
+        _engines["sync"] = db_engine
+    return _engines["sync"]
+
+
+def get_async_engine() -> AsyncEngine:
+    if "async" not in _engines:
+        db_engine = create_async_engine(mysql_async_connection_string(), poolclass=TimedAsyncAdaptedQueuePool,
+                                        **pool_options())
+        instrument_pool(db_engine.sync_engine.pool, TimedAsyncAdaptedQueuePool.label)
+        if settings.SQL_PROFILER:
+            from src.query_profiler import query_profiler
+
+            query_profiler.instrument(db_engine.sync_engine)
+        _engines["async"] = db_engine
+    return _engines["async"]
+
+
+def reset_engines():
+    """Drops the pooled connections inherited over fork without closing them, the parent still uses them"""
+    for db_engine in _engines.values():
+        getattr(db_engine, "sync_engine", db_engine).dispose(close=False)
+
+
+async def dispose_engines():
+    for db_engine in list(_engines.values()):
+        if isinstance(db_engine, AsyncEngine):
+            await db_engine.dispose()
+        else:
+            db_engine.dispose()
+
 
-engine = create_engine(mysql_connection_string())
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SessionLocal = sessionmaker(class_=LazyBoundSession, autocommit=False, autoflush=False)
+AsyncSessionLocal = sessionmaker(class_=LazyBoundAsyncSession, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
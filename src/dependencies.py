@@ -1,10 +1,7 @@
-from database import SessionLocal
+from src.database import AsyncSessionLocal
 
 
 # Dependency
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
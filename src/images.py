@@ -0,0 +1,186 @@
+import asyncio
+import multiprocessing
+import os
+import pathlib
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Optional, Tuple
+
+import anyio
+from PIL import Image
+
+import settings
+import src.metrics as metrics
+from settings import cwd
+
+# Suffix of the originals that can be resized and the Pillow format they are written back in
+IMAGE_FORMATS = {".png": "PNG", ".jpg": "JPEG", ".jpeg": "JPEG", ".webp": "WEBP"}
+VARIANT_FORMATS = {"webp": ".webp"}
+
+generation_seconds = metrics.histogram("image_variant_generation_seconds", "Time to resize one cover variant",
+                                       ["format"])
+bytes_saved = metrics.counter("image_variant_bytes_saved_total",
+                              "Bytes the generated variants are smaller than their originals", ["format"])
+variant_requests = metrics.counter("image_variant_requests_total", "Resized cover lookups by outcome", ["result"])
+cache_bytes = metrics.gauge("image_variant_cache_bytes", "Size of the resized cover disk cache after the last sweep")
+cache_evictions = metrics.counter("image_variant_evictions_total", "Cover variants removed by the LRU sweep")
+
+
+def resize(source: str, target: str, width: int, suffix: str) -> int:
+    """Writes `source` scaled down to `width` as `target`, runs in a worker process.
+
+    Aspect ratio is kept and images are never scaled up. Returns the size of the variant.
+    """
+    with Image.open(source) as image:
+        image_format = IMAGE_FORMATS[suffix]
+        # JPEG decoders can skip whole DCT scales when the target is much smaller
+        image.draft("RGB", (width, image.height * width // max(image.width, 1)))
+        if image.width > width:
+            image.thumbnail((width, image.height), Image.LANCZOS)
+        if image_format == "JPEG" and image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        temp = f"{target}.{uuid.uuid4().hex}.tmp"
+        try:
+            image.save(temp, image_format, optimize=True, **({"quality": 80} if image_format != "PNG" else {}))
+            os.replace(temp, target)
+        except BaseException:
+            if os.path.exists(temp):
+                os.remove(temp)
+            raise
+    return os.path.getsize(target)
+
+
+class CoverVariants:
+    """Resized covers kept in an LRU disk cache next to the media tree.
+
+    Variants are keyed by the content addressed key of the original, so they never go stale.
+    They are produced on a process pool, eagerly for the configured widths after an upload
+    and lazily for anything missing on first request. Hits bump the file mtime and a sweep
+    removes the least recently used files once the cache grows over `max_bytes`.
+    """
+
+    def __init__(self, media_root: pathlib.Path, cache_root: pathlib.Path, widths: Tuple[int, ...],
+                 max_bytes: int, workers: int):
+        self.media_root = media_root
+        self.cache_root = cache_root
+        self.widths = widths
+        self.max_bytes = max_bytes
+        self.workers = workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._generating: Dict[pathlib.Path, asyncio.Future] = {}
+        self._written_since_sweep = 0
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn: the worker processes must not inherit the event loop and DB connections
+            self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context("spawn"))
+        return self._executor
+
+    def _discard_pool(self, executor: ProcessPoolExecutor):
+        # Concurrent resizes all see the same broken pool, only the first one replaces it
+        if self._executor is executor:
+            self._executor = None
+            executor.shutdown(wait=False)
+
+    def width_for(self, width: int) -> int:
+        return next((allowed for allowed in self.widths if allowed >= width), self.widths[-1])
+
+    def path(self, key: str, width: int, variant_format: Optional[str] = None) -> pathlib.Path:
+        original = pathlib.PurePosixPath(key)
+        suffix = VARIANT_FORMATS[variant_format] if variant_format else original.suffix.lower()
+        return self.cache_root / original.parent / f"{original.stem}-w{width}{suffix}"
+
+    @staticmethod
+    def _lookup(source: pathlib.Path, target: pathlib.Path) -> Tuple[bool, bool]:
+        """Whether the original exists and whether its variant does, whose mtime is bumped for the LRU"""
+        if not source.is_file():
+            return False, False
+        try:
+            os.utime(target)
+        except FileNotFoundError:
+            return True, False
+        return True, True
+
+    async def get(self, key: str, width: int, variant_format: Optional[str] = None) -> Optional[pathlib.Path]:
+        """Returns the variant of the media file `key`, None when it is not a resizable image"""
+        source = self.media_root / key
+        if source.suffix.lower() not in IMAGE_FORMATS:
+            return None
+        target = self.path(key, self.width_for(width), variant_format)
+        exists, cached = await anyio.to_thread.run_sync(self._lookup, source, target)
+        if not exists:
+            return None
+        if cached:
+            variant_requests.inc(result="hit")
+            return target
+
+        variant_requests.inc(result="miss")
+        generating = self._generating.get(target)
+        if generating is None:
+            generating = asyncio.ensure_future(self._generate(source, target, self.width_for(width), variant_format))
+            self._generating[target] = generating
+            generating.add_done_callback(lambda _: self._generating.pop(target, None))
+        return await asyncio.shield(generating)
+
+    async def _generate(self, source: pathlib.Path, target: pathlib.Path, width: int,
+                        variant_format: Optional[str]) -> Optional[pathlib.Path]:
+        label = variant_format or "original"
+        await anyio.to_thread.run_sync(lambda: target.parent.mkdir(parents=True, exist_ok=True))
+        started = time.perf_counter()
+        executor = self._pool()
+        # The original is served instead whenever no variant can be made
+        try:
+            size = await asyncio.get_running_loop().run_in_executor(
+                executor, resize, str(source), str(target), width, target.suffix)
+        except (OSError, ValueError, Image.DecompressionBombError) as e:
+            settings.logger.warning(f"Could not resize {source} to {width}px {label}: {e}")
+            return None
+        except BrokenProcessPool as e:
+            # A worker died, such as killed for its memory use, the next resize starts a new pool
+            settings.logger.error(f"Image worker pool broke resizing {source} to {width}px {label}: {e}")
+            self._discard_pool(executor)
+            return None
+        generation_seconds.observe(time.perf_counter() - started, format=label)
+        original_size = await anyio.to_thread.run_sync(os.path.getsize, source)
+        bytes_saved.inc(max(original_size - size, 0), format=label)
+        self._written_since_sweep += size
+        if self._written_since_sweep > self.max_bytes // 10:
+            self._written_since_sweep = 0
+            await anyio.to_thread.run_sync(self.sweep)
+        return target
+
+    async def pregenerate(self, key: str):
+        """Produces every configured width, in the original format and as WebP"""
+        for width in self.widths:
+            for variant_format in (None, *VARIANT_FORMATS):
+                await self.get(key, width, variant_format)
+
+    def sweep(self):
+        """Removes the least recently used variants until the cache fits into `max_bytes`"""
+        files = []
+        for directory, _, names in os.walk(self.cache_root):
+            for name in names:
+                path = os.path.join(directory, name)
+                try:
+                    stat_result = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((stat_result.st_mtime, stat_result.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            cache_evictions.inc()
+        cache_bytes.set(total)
+
+
+cover_variants = CoverVariants(cwd / "media", cwd / "media_cache" / "covers", settings.COVER_WIDTHS,
+                               settings.COVER_CACHE_MAX_BYTES, settings.IMAGE_WORKERS)
@@ -1,2 +1,4 @@
 from .users import verify_password, get_current_user, get_user, get_current_active_user, get_current_active_admin_user, \
-    get_password_hash, send_email_background_new_user, create_qr_code_img
+    get_password_hash, send_new_user_email, provisioning_uri, get_qr_code_png, invalidate_cached_user, \
+    get_token_data, get_active_token_data, token_claims
+from .sessions import open_session, refresh_session, remove_expired_sessions
@@ -1,7 +1,56 @@
-from sqladmin import ModelView
+from typing import Any, List, Optional
+
+from sqladmin import Admin, ModelView
+from starlette.applications import Starlette
+from starlette.routing import BaseRoute
+from starlette.types import Receive, Scope, Send
 
 import src.models as models
+from src.database import get_engine
+from .tokens import revocations
+from .users import invalidate_cached_user
 
 
 class UserAdmin(ModelView, model=models.User):
     column_list = [models.User.id, models.User.username, models.User.email, models.User.role, models.User.disable]
+
+    async def on_model_change(self, data: dict, model: Any, is_created: bool) -> None:
+        if not is_created:
+            invalidate_cached_user(model.username)
+
+    async def after_model_change(self, data: dict, model: Any, is_created: bool) -> None:
+        invalidate_cached_user(model.username)
+        revocations.update(model)
+
+    async def after_model_delete(self, model: Any) -> None:
+        invalidate_cached_user(model.username)
+        revocations.forget(model.id)
+
+
+class LazyAdmin:
+    """ASGI app of the admin views, mounted at `base_url`.
+
+    sqladmin needs an engine up front and creating the sync one loads the MySQL driver, so the
+    views are only built for the first admin request or URL.
+    """
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+        self._app: Optional[Starlette] = None
+
+    @property
+    def app(self) -> Starlette:
+        if self._app is None:
+            # Admin mounts itself on the app it is given, only its inner app is kept
+            admin = Admin(Starlette(), get_engine(), base_url=self.base_url)
+            admin.add_view(UserAdmin)
+            self._app = admin.admin
+        return self._app
+
+    @property
+    def routes(self) -> List[BaseRoute]:
+        # Read by Mount.url_path_for, so url_for("admin:...") resolves through the mount
+        return self.app.routes
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        await self.app(scope, receive, send)
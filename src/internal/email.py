@@ -1,24 +1,167 @@
-from fastapi import BackgroundTasks
+import asyncio
+from email.encoders import encode_base64
+from email.mime.base import MIMEBase
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from email.utils import formatdate, make_msgid
+from typing import List, Optional
+
+import aiosmtplib
 from fastapi_mail import FastMail, MessageSchema, ConnectionConfig
+from fastapi_mail.fastmail import email_dispatched
+from jinja2 import Template
+
+from settings import MAIL_USERNAME, MAIL_PASSWORD, MAIL_FROM, MAIL_PORT, MAIL_SERVER, MAIL_FROM_NAME, SMTP_POOL_SIZE, \
+    MAIL_STARTTLS, MAIL_USE_CREDENTIALS, cwd
+
+
+def connection_config() -> ConnectionConfig:
+    # Validating it checks the template folder, so it is built on first use rather than at import
+    return ConnectionConfig(
+        MAIL_USERNAME=MAIL_USERNAME,
+        MAIL_PASSWORD=MAIL_PASSWORD,
+        MAIL_FROM=MAIL_FROM,
+        MAIL_PORT=MAIL_PORT,
+        MAIL_SERVER=MAIL_SERVER,
+        MAIL_FROM_NAME=MAIL_FROM_NAME,
+        MAIL_STARTTLS=MAIL_STARTTLS,
+        MAIL_SSL_TLS=False,
+        USE_CREDENTIALS=MAIL_USE_CREDENTIALS,
+        VALIDATE_CERTS=True,
+        TEMPLATE_FOLDER=cwd / 'templates' / 'email',
+    )
+
+
+# Server replies aiosmtplib resets the envelope after, the connection stays usable
+REUSABLE_ERRORS = (aiosmtplib.SMTPResponseException, aiosmtplib.SMTPRecipientsRefused)
+
+
+async def build_message(message: MessageSchema, sender: str, template: Optional[Template] = None) -> MIMEMultipart:
+    """The MIME message for `message`, with the body rendered from `template` when given"""
+    mime = MIMEMultipart(message.multipart_subtype.value)
+    mime.set_charset(message.charset)
+    mime["Date"] = formatdate(localtime=True)
+    mime["Message-ID"] = make_msgid()
+    mime["To"] = ", ".join(message.recipients)
+    mime["From"] = sender
+    if message.subject:
+        mime["Subject"] = message.subject
+    for header, addresses in (("Cc", message.cc), ("Bcc", message.bcc), ("Reply-To", message.reply_to)):
+        if addresses:
+            mime[header] = ", ".join(addresses)
+
+    body = message.body
+    if template is not None and message.template_body is not None:
+        if isinstance(message.template_body, list):
+            body = template.render({"body": message.template_body})
+        else:
+            body = template.render(**message.template_body)
+    elif isinstance(message.template_body, str) and message.template_body:
+        body = message.template_body
+    if body:
+        mime.attach(MIMEText(body, _subtype=message.subtype.value, _charset=message.charset))
+
+    # The schema validator turned every attachment into an (UploadFile, metadata) pair
+    for file, meta in message.attachments:
+        meta = meta or {}
+        part = MIMEBase(meta.get("mime_type", "application"), meta.get("mime_subtype", "octet-stream"))
+        part.set_payload(await file.read())
+        encode_base64(part)
+        for header, value in meta.get("headers", {}).items():
+            part.add_header(header, value)
+        if not part.get("Content-Disposition"):
+            part.add_header("Content-Disposition", "attachment", filename=("UTF8", "", file.filename))
+        mime.attach(part)
+
+    for header, value in (message.headers or {}).items():
+        mime.add_header(header, value)
+    return mime
+
+
+class PooledMail(FastMail):
+    """FastMail keeping up to `pool_size` logged in SMTP connections open between messages.
+
+    FastMail connects, starts TLS and logs in for every single message. The job workers send
+    many, so connections are reused and only opened again once the server dropped them.
+    """
+
+    def __init__(self, config: ConnectionConfig, pool_size: int = SMTP_POOL_SIZE):
+        super().__init__(config)
+        self.pool_size = pool_size
+        self._idle: List[aiosmtplib.SMTP] = []
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    @property
+    def sender(self) -> str:
+        if self.config.MAIL_FROM_NAME is not None:
+            return f"{self.config.MAIL_FROM_NAME} <{self.config.MAIL_FROM}>"
+        return self.config.MAIL_FROM
+
+    async def _connect(self) -> aiosmtplib.SMTP:
+        session = aiosmtplib.SMTP(hostname=self.config.MAIL_SERVER, port=self.config.MAIL_PORT,
+                                  timeout=self.config.TIMEOUT, use_tls=self.config.MAIL_SSL_TLS,
+                                  start_tls=self.config.MAIL_STARTTLS, validate_certs=self.config.VALIDATE_CERTS)
+        try:
+            await session.connect()
+            if self.config.USE_CREDENTIALS:
+                await session.login(self.config.MAIL_USERNAME, self.config.MAIL_PASSWORD)
+        except BaseException:
+            session.close()
+            raise
+        return session
+
+    async def send_message(self, message: MessageSchema, template_name: str = None) -> None:
+        template = None
+        if self.config.TEMPLATE_FOLDER and template_name:
+            template = await self.get_mail_template(self.config.template_engine(), template_name)
+        msg = await build_message(message, self.sender, template)
+        if self.config.SUPPRESS_SEND:
+            email_dispatched.send(msg)
+            return
+
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.pool_size)
+        async with self._slots:
+            session = self._idle.pop() if self._idle else None
+            reusable = False
+            try:
+                if session is None or not session.is_connected:
+                    session = await self._connect()
+                try:
+                    await session.send_message(msg)
+                except aiosmtplib.SMTPServerDisconnected:
+                    session = await self._connect()
+                    await session.send_message(msg)
+                reusable = True
+            except REUSABLE_ERRORS:
+                reusable = True
+                raise
+            finally:
+                # Every checked out session goes back to the pool or is closed, whatever was raised
+                if session is not None:
+                    if reusable and session.is_connected:
+                        self._idle.append(session)
+                    else:
+                        session.close()
+        email_dispatched.send(msg)
+
+    async def close(self):
+        while self._idle:
+            session = self._idle.pop()
+            if session.is_connected:
+                await session.quit()
+
+
+_mailer: Optional[PooledMail] = None
+
+
+def get_mailer() -> PooledMail:
+    global _mailer
+    if _mailer is None:
+        _mailer = PooledMail(connection_config())
+    return _mailer
+
 
-from settings import MAIL_USERNAME, MAIL_PASSWORD, MAIL_FROM, MAIL_PORT, MAIL_SERVER, MAIL_FROM_NAME, cwd
-
-conf = ConnectionConfig(
-    MAIL_USERNAME=MAIL_USERNAME,
-    MAIL_PASSWORD=MAIL_PASSWORD,
-    MAIL_FROM=MAIL_FROM,
-    MAIL_PORT=MAIL_PORT,
-    MAIL_SERVER=MAIL_SERVER,
-    MAIL_FROM_NAME=MAIL_FROM_NAME,
-    MAIL_STARTTLS=True,
-    MAIL_SSL_TLS=False,
-    USE_CREDENTIALS=True,
-    VALIDATE_CERTS=True,
-    TEMPLATE_FOLDER=cwd / 'templates' / 'email',
-)
-
-
-def send_email_background_task(background_tasks: BackgroundTasks, message: MessageSchema, template_name: str):
-    fm = FastMail(conf)
-    background_tasks.add_task(
-        fm.send_message, message, template_name=template_name)
+async def close_mailer():
+    if _mailer is not None:
+        await _mailer.close()
@@ -3,15 +3,16 @@ from typing import List
 from fastapi import HTTPException, Depends
 
 from src import schemas
-from src.internal import get_current_active_user
+from src.internal import get_active_token_data
 
 
 class RoleChecker:
     def __init__(self, allowed_roles: List):
         self.allowed_roles = allowed_roles
 
-    def __call__(self, user: schemas.User = Depends(get_current_active_user)):
-        if user.role not in self.allowed_roles:
+    def __call__(self, token_data: schemas.TokenData = Depends(get_active_token_data)):
+        # The role comes from the token claims, the revocation list catches later demotions
+        if token_data.role not in self.allowed_roles:
             raise HTTPException(status_code=403, detail="Operation not permitted")
 
 
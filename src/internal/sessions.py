@@ -0,0 +1,93 @@
+"""Refresh tokens backed by the `sessions` table.
+
+A login opens a session and returns a short-lived access token with a refresh token
+`<session id>.<secret>`. Refreshing looks the session up by primary key, compares the SHA-256
+of the secret and rotates it, so steady-state traffic pays for bcrypt and TOTP only once per
+session. Presenting a secret that was already rotated away revokes the session, the token
+was copied.
+"""
+import hashlib
+import hmac
+import secrets
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import src.crud as crud
+import src.jobs as jobs
+import src.metrics as metrics
+from src.database import AsyncSessionLocal
+from .tokens import revocations
+from .users import create_access_token, credentials_exception, token_claims
+from settings import ACCESS_TOKEN_EXPIRE_MINUTES, REFRESH_TOKEN_EXPIRE_DAYS, SESSION_CLEANUP_INTERVAL, logger
+
+token_refreshes = metrics.counter("auth_token_refreshes_total", "Refresh token uses by outcome", ["result"])
+
+
+def hash_secret(secret: str) -> str:
+    # The secrets are random, a fast hash is enough to keep the stored values unusable
+    return hashlib.sha256(secret.encode()).hexdigest()
+
+
+def parse_refresh_token(refresh_token: str) -> Optional[Tuple[int, str]]:
+    session_id, _, secret = refresh_token.partition(".")
+    if not session_id.isdigit() or not secret:
+        return None
+    return int(session_id), secret
+
+
+def token_response(user, session_id: int, secret: str) -> dict:
+    expires_in = ACCESS_TOKEN_EXPIRE_MINUTES * 60
+    access_token = create_access_token(data=token_claims(user), expires_delta=timedelta(seconds=expires_in))
+    return {"access_token": access_token, "token_type": "bearer", "expires_in": expires_in,
+            "refresh_token": f"{session_id}.{secret}"}
+
+
+async def open_session(db: AsyncSession, user) -> dict:
+    """Token response for an authenticated user, with the refresh token of a new session"""
+    secret = secrets.token_urlsafe(32)
+    expires_at = datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    db_session = await crud.create_session(db, user.id, hash_secret(secret), expires_at)
+    return token_response(user, db_session.id, secret)
+
+
+async def refresh_session(db: AsyncSession, refresh_token: str) -> dict:
+    """Token response with a new access token and the rotated refresh token, 401 if it is not valid"""
+    parsed = parse_refresh_token(refresh_token)
+    if parsed is None:
+        token_refreshes.inc(result="invalid")
+        raise credentials_exception()
+    session_id, secret = parsed
+    db_session, user = await crud.get_session_with_user(db, session_id)
+    if db_session is None or db_session.revoked_at is not None:
+        token_refreshes.inc(result="revoked" if db_session is not None else "invalid")
+        raise credentials_exception()
+    token_hash = hash_secret(secret)
+    if not hmac.compare_digest(token_hash, db_session.token_hash):
+        if db_session.previous_token_hash and hmac.compare_digest(token_hash, db_session.previous_token_hash):
+            await crud.revoke_sessions(db, user.id, session_id)
+            logger.warning(f"Refresh token of session {session_id} was reused, the session is revoked")
+            token_refreshes.inc(result="reused")
+        else:
+            token_refreshes.inc(result="invalid")
+        raise credentials_exception()
+    if db_session.expires_at <= datetime.utcnow() or user.disable:
+        token_refreshes.inc(result="revoked")
+        raise credentials_exception()
+    new_secret = secrets.token_urlsafe(32)
+    if not await crud.rotate_session(db, db_session, hash_secret(new_secret)):
+        # Refreshed or revoked by a concurrent request with the same token
+        token_refreshes.inc(result="conflict")
+        raise credentials_exception()
+    revocations.update(user)
+    token_refreshes.inc(result="refreshed")
+    return token_response(user, session_id, new_secret)
+
+
+@jobs.handler("remove_expired_sessions", every=SESSION_CLEANUP_INTERVAL)
+async def remove_expired_sessions(payload: dict):
+    """Deletes the sessions past their expiry, revoked ones are kept until then for reuse detection"""
+    async with AsyncSessionLocal() as db:
+        removed = await crud.delete_expired_sessions(db)
+    logger.info(f"Removed {removed} expired sessions")
@@ -0,0 +1,97 @@
+import hashlib
+import time
+from typing import Optional, Set
+
+from sqlalchemy import or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import src.metrics as metrics
+import src.models as models
+import src.schemas as schemas
+from src.cache import TTLCache
+from settings import TOKEN_CACHE_SIZE, REVOCATION_REFRESH_SECONDS
+
+# A token rejected by a list older than this reloads it first, admins promoted in another
+# worker would otherwise wait for the next refresh
+REVOCATION_RECHECK_SECONDS = 1.0
+
+token_verifications = metrics.counter("auth_token_verifications_total", "Bearer tokens checked by outcome",
+                                      ["result"])
+
+
+class VerifiedTokens:
+    """Claims of bearer tokens whose signature was already verified, until their `exp`.
+
+    Keyed by the SHA-256 of the token, so the cache never holds a usable credential.
+    """
+
+    def __init__(self, maxsize: int):
+        self._cache = TTLCache("tokens", maxsize=maxsize, ttl=0)
+
+    @staticmethod
+    def key(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def get(self, token: str) -> Optional[schemas.TokenData]:
+        return self._cache.get(self.key(token))
+
+    def set(self, token: str, claims: schemas.TokenData, expires_at: float):
+        ttl = expires_at - time.time()
+        if ttl > 0:
+            self._cache.set(self.key(token), claims, ttl=ttl)
+
+    def clear(self):
+        self._cache.clear()
+
+
+class RevocationList:
+    """Rejects tokens whose claims no longer hold: users disabled or admins demoted since.
+
+    Only disabled users and admins are tracked. Changes made in this worker apply at once,
+    both sets are reloaded from the users table every `refresh_seconds` to pick up the ones
+    made by other workers.
+    """
+
+    def __init__(self, refresh_seconds: float):
+        self.refresh_seconds = refresh_seconds
+        self._disabled: Set[int] = set()
+        self._admins: Set[int] = set()
+        self._refreshed_at = float("-inf")
+
+    def update(self, user):
+        """Applies a changed user record right away"""
+        (self._disabled.add if user.disable else self._disabled.discard)(user.id)
+        (self._admins.add if user.role == schemas.Role.admin else self._admins.discard)(user.id)
+
+    def forget(self, user_id: int):
+        """For deleted users, whose admin tokens are then rejected"""
+        self._disabled.discard(user_id)
+        self._admins.discard(user_id)
+
+    def is_revoked(self, token_data: schemas.TokenData) -> bool:
+        return token_data.id in self._disabled or (token_data.role == schemas.Role.admin
+                                                   and token_data.id not in self._admins)
+
+    def age(self) -> float:
+        return time.monotonic() - self._refreshed_at
+
+    def stale(self) -> bool:
+        return self.age() > self.refresh_seconds
+
+    async def refresh(self, db: AsyncSession):
+        # Marked first, concurrent requests keep using the current sets meanwhile
+        self._refreshed_at = time.monotonic()
+        try:
+            result = await db.execute(select(models.User.id, models.User.disable, models.User.role)
+                                      .filter(or_(models.User.disable.is_(True),
+                                                  models.User.role == schemas.Role.admin)))
+        except BaseException:
+            self._refreshed_at = float("-inf")
+            raise
+        rows = result.all()
+        self._disabled = {user_id for user_id, disable, _ in rows if disable}
+        self._admins = {user_id for user_id, _, role in rows if role == schemas.Role.admin}
+
+
+verified_tokens = VerifiedTokens(TOKEN_CACHE_SIZE)
+revocations = RevocationList(REVOCATION_REFRESH_SECONDS)
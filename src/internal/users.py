@@ -1,49 +1,69 @@
+import io
 from datetime import datetime, timedelta
 from typing import Optional
 
+import anyio
 import pyotp
 import qrcode
-from fastapi import Depends, HTTPException, status, BackgroundTasks
+from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from fastapi_mail import MessageSchema, MessageType
 from jose import JWTError, jwt
-from pydantic import EmailStr
-from sqlalchemy.orm import Session
+from starlette.datastructures import UploadFile
+from sqlalchemy.ext.asyncio import AsyncSession
 
 import src.crud as crud
 import src.dependencies as dependencies
+import src.jobs as jobs
 import src.schemas as schemas
-from .email import send_email_background_task
-from src.security import pwd_context
+from .email import get_mailer
+from src.cache import TTLCache
+from .tokens import verified_tokens, revocations, token_verifications, REVOCATION_RECHECK_SECONDS
+from src.database import AsyncSessionLocal
+from src.security import password_hasher
 from settings import *
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+user_cache = TTLCache("users", maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+qr_code_cache = TTLCache("qr_codes", maxsize=QR_CODE_CACHE_SIZE, ttl=QR_CODE_CACHE_TTL)
 
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+async def verify_password(plain_password, hashed_password):
+    return await password_hasher.verify(plain_password, hashed_password)
 
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+async def get_password_hash(password):
+    return await password_hasher.hash(password)
 
 
-def get_user(db: Session, username: str):
-    return crud.get_user_by_username(db, username)
+async def get_user(db: AsyncSession, username: str):
+    return await crud.get_user_by_username(db, username)
 
 
-def authenticate_user(db: Session, username: str, password: str):
-    user = get_user(db, username)
+def invalidate_cached_user(*usernames: str):
+    for username in usernames:
+        user_cache.pop(username)
+
+
+async def authenticate_user(db: AsyncSession, username: str, password: str):
+    user = await get_user(db, username)
     if not user:
         return False
-    if not verify_password(password[:-6], user.hashed_password):
+    if not await verify_password(password[:-6], user.hashed_password):
         return False
     totp = pyotp.TOTP(user.otp_secret)
     if not totp.verify(password[-6:]):
         return False
+    # The token claims are taken from this record, the revocation list must agree with them
+    revocations.update(user)
     return user
 
 
+def token_claims(user) -> dict:
+    """Claims identifying the user, so role checks need no DB lookup while the token is valid"""
+    return {"sub": user.username, "uid": user.id, "role": schemas.Role(user.role).value, "disable": bool(user.disable)}
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -55,24 +75,67 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 
-def get_current_user(token: str = Depends(oauth2_scheme),
-                     db: Session = Depends(dependencies.get_db)):
-    credentials_exception = HTTPException(
+def credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+
+
+async def get_cached_user(db: AsyncSession, username: str) -> Optional[schemas.User]:
+    user = user_cache.get(username)
+    if user is None:
+        db_user = await get_user(db, username=username)
+        if db_user is None:
+            return None
+        user = schemas.User.from_orm(db_user)
+        user_cache.set(username, user)
+    return user
+
+
+async def get_token_data(token: str = Depends(oauth2_scheme),
+                         db: AsyncSession = Depends(dependencies.get_db)) -> schemas.TokenData:
+    """Claims of the bearer token, the signature is verified once per token and worker"""
+    if revocations.stale():
+        await revocations.refresh(db)
+    token_data = verified_tokens.get(token)
+    if token_data is None:
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        except JWTError:
+            token_verifications.inc(result="invalid")
+            raise credentials_exception()
         username: str = payload.get("sub")
         if username is None:
-            raise credentials_exception
-        token_data = schemas.TokenData(username=username)
-    except JWTError:
-        raise credentials_exception
-    user = get_user(db, username=token_data.username)
+            token_verifications.inc(result="invalid")
+            raise credentials_exception()
+        if "uid" in payload:
+            token_data = schemas.TokenData(username=username, id=payload["uid"], role=payload.get("role"),
+                                           disable=payload.get("disable", False))
+        else:
+            # Issued before the claims were added, they come from the user record instead
+            user = await get_cached_user(db, username)
+            if user is None:
+                raise credentials_exception()
+            token_data = schemas.TokenData(username=username, id=user.id, role=user.role, disable=user.disable)
+        verified_tokens.set(token, token_data, payload["exp"])
+        token_verifications.inc(result="verified")
+    else:
+        token_verifications.inc(result="cached")
+    if revocations.is_revoked(token_data) and revocations.age() > REVOCATION_RECHECK_SECONDS:
+        await revocations.refresh(db)
+    if revocations.is_revoked(token_data):
+        token_verifications.inc(result="revoked")
+        raise credentials_exception()
+    return token_data
+
+
+async def get_current_user(token_data: schemas.TokenData = Depends(get_token_data),
+                           db: AsyncSession = Depends(dependencies.get_db)):
+    user = await get_cached_user(db, token_data.username)
     if user is None:
-        raise credentials_exception
+        raise credentials_exception()
     return user
 
 
@@ -83,6 +146,13 @@ def get_current_active_user(
     return current_user
 
 
+def get_active_token_data(token_data: schemas.TokenData = Depends(get_token_data)) -> schemas.TokenData:
+    """Like get_current_active_user, from the token claims alone"""
+    if token_data.disable:
+        raise HTTPException(status_code=400, detail="Inactive user")
+    return token_data
+
+
 def get_current_active_admin_user(
         current_user: schemas.User = Depends(get_current_active_user), ):
     if current_user.role != schemas.Role.admin:
@@ -91,40 +161,67 @@ def get_current_active_admin_user(
     return current_user
 
 
-def create_qr_code_img(uri_str: str, username: str):
-    qr = qrcode.QRCode(box_size=5)
-    qr.add_data(uri_str)
-    qr_code_img = qr.make_image()
-
-    current_datetime = datetime.now().strftime("%Y%m%d-%H%M%S")
-    qr_codes_path = cwd / "media_protected" / "qr_codes"
-    qr_codes_path.mkdir(parents=True, exist_ok=True)
-    qr_filename = qr_codes_path / f'{username}_{current_datetime}.png'
-    qr_code_img.save(qr_filename)
-    return qr_filename
+def provisioning_uri(db_user) -> str:
+    return pyotp.totp.TOTP(db_user.otp_secret).provisioning_uri(name=db_user.email, issuer_name='Library App')
 
 
-def send_email_background_new_user(background_tasks: BackgroundTasks,
-                                   subject: str,
-                                   email_to: EmailStr,
-                                   body: dict,
-                                   template_name: str):
+def render_qr_code_png(uri_str: str) -> bytes:
+    qr = qrcode.QRCode(box_size=5)
+    qr.add_data(uri_str)
+    buffer = io.BytesIO()
+    qr.make_image().save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+async def get_qr_code_png(uri_str: str) -> bytes:
+    """Renders the QR code of a provisioning URI in a worker thread, cached for QR_CODE_CACHE_TTL"""
+    png = qr_code_cache.get(uri_str)
+    if png is None:
+        png = await anyio.to_thread.run_sync(render_qr_code_png, uri_str)
+        qr_code_cache.set(uri_str, png)
+    return png
+
+
+@jobs.handler("new_user_email")
+async def send_new_user_email(payload: dict):
+    """Sends the welcome email with the OTP QR code, queued by crud.create_user"""
+    async with AsyncSessionLocal() as db:
+        db_user = await crud.get_user(db, payload["user_id"])
+    if db_user is None:
+        return
+    qr_code_png = await get_qr_code_png(provisioning_uri(db_user))
     message = MessageSchema(
-        subject=subject,
-        recipients=[email_to],
-        template_body=body,
+        subject='Hello there!',
+        recipients=[db_user.email],
+        template_body={'title': 'Hello dear user', 'name': db_user.full_name},
         subtype=MessageType.html,
         attachments=[
             {
-                "file": "{filepath}".format(filepath=body['qr_code_img']),
+                "file": UploadFile("qr_code.png", io.BytesIO(qr_code_png), content_type="image/png"),
                 "headers": {
                     "Content-ID": "<qr_image@fastapi-mail>",
-                    "Content-Disposition": "inline; filename=\"{filename}\"".format(
-                        filename=body['qr_code_img'].name),  # For inline images only
+                    "Content-Disposition": "inline; filename=\"qr_code.png\"",  # For inline images only
                 },
                 "mime_type": "image",
                 "mime_subtype": "png",
             }
         ],
     )
-    send_email_background_task(background_tasks=background_tasks, message=message, template_name=template_name)
+    await get_mailer().send_message(message, template_name='new_user_email.html')
+
+
+@jobs.handler("remove_legacy_qr_codes")
+async def remove_legacy_qr_codes(payload: dict):
+    """Deletes the QR code PNGs signups used to leave in media_protected/qr_codes"""
+    removed = await anyio.to_thread.run_sync(_remove_legacy_qr_codes, cwd / "media_protected" / "qr_codes")
+    logger.info(f"Removed {removed} legacy QR code files")
+
+
+def _remove_legacy_qr_codes(directory) -> int:
+    removed = 0
+    for path in directory.glob("*.png"):
+        path.unlink(missing_ok=True)
+        removed += 1
+    if directory.is_dir() and not any(directory.iterdir()):
+        directory.rmdir()
+    return removed
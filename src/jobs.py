@@ -0,0 +1,247 @@
+"""Persistent job queue on the `jobs` table, replacing in-process BackgroundTasks.
+
+Requests `enqueue` jobs inside their own transaction, worker processes claim them with
+SELECT ... FOR UPDATE SKIP LOCKED in priority order and retry failures with exponential
+backoff. Handlers registered with `every` are queued by the workers themselves, like the
+removal of expired sessions. Run the workers from the src directory (the mail templates are
+resolved from it):
+
+    python -m src.jobs --processes 2 --concurrency 4
+    python -m src.jobs --enqueue remove_legacy_qr_codes
+"""
+import argparse
+import asyncio
+import multiprocessing
+import random
+import signal
+import time
+import traceback
+from typing import Awaitable, Callable, Dict, List, Set
+
+from sqlalchemy import func, select, text, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import settings
+import src.metrics as metrics
+import src.models as models
+from src.database import AsyncSessionLocal, dispose_engines
+
+Job = models.Job
+HANDLERS: Dict[str, Callable[[dict], Awaitable[None]]] = {}
+# Kinds the workers queue by themselves, with the seconds between two runs
+PERIODIC: Dict[str, float] = {}
+
+jobs_processed = metrics.counter("jobs_processed_total", "Job runs by kind and outcome", ["kind", "result"])
+job_seconds = metrics.histogram("job_seconds", "Time spent running a job", ["kind"])
+
+
+def handler(kind: str, every: float = 0):
+    """Registers the coroutine running jobs of `kind`, it receives the job payload.
+
+    With `every` the running workers also queue such a job, without payload, every `every` seconds.
+    """
+
+    def register(func: Callable[[dict], Awaitable[None]]):
+        HANDLERS[kind] = func
+        if every:
+            PERIODIC[kind] = every
+        return func
+
+    return register
+
+
+def enqueue(db: AsyncSession, kind: str, payload: dict, priority: int = Job.PRIORITY_NORMAL,
+            delay: int = 0) -> models.Job:
+    """Adds a job to the session, it becomes visible to the workers once the caller commits"""
+    job = Job(kind=kind, payload=payload, priority=priority, attempt=0, status=Job.STATUS_INITAL)
+    if delay:
+        job.run_at = func.date_add(func.now(), text(f"INTERVAL {int(delay)} SECOND"))
+    db.add(job)
+    return job
+
+
+def retry_delay(attempt: int) -> int:
+    return int(settings.JOB_RETRY_BASE_SECONDS * 2 ** (attempt - 1) * random.uniform(0.8, 1.2))
+
+
+async def claim(db: AsyncSession, limit: int) -> List[models.Job]:
+    """Marks up to `limit` due jobs as in progress and returns them, highest priority first"""
+    result = await db.execute(select(Job)
+                              .filter(Job.status == Job.STATUS_INITAL, Job.run_at <= func.now())
+                              .order_by(Job.priority, Job.run_at, Job.id)
+                              .limit(limit)
+                              .with_for_update(skip_locked=True))
+    jobs = result.scalars().all()
+    if jobs:
+        await db.execute(update(Job).where(Job.id.in_([job.id for job in jobs]))
+                         .values(status=Job.STATUS_PROGRESS, attempt=Job.attempt + 1, locked_at=func.now()))
+        for job in jobs:
+            job.attempt = (job.attempt or 0) + 1
+    await db.commit()
+    return jobs
+
+
+async def complete(db: AsyncSession, job: models.Job):
+    await db.execute(update(Job).where(Job.id == job.id).values(status=Job.STATUS_SUCCESS, locked_at=None))
+    await db.commit()
+
+
+async def fail(db: AsyncSession, job: models.Job, error: str):
+    """Schedules the next attempt, or gives up with STATUS_ERROR after JOB_MAX_ATTEMPTS"""
+    values = {"exception": error, "locked_at": None}
+    if job.attempt >= settings.JOB_MAX_ATTEMPTS:
+        values["status"] = Job.STATUS_ERROR
+    else:
+        values["status"] = Job.STATUS_INITAL
+        values["run_at"] = func.date_add(func.now(), text(f"INTERVAL {retry_delay(job.attempt)} SECOND"))
+    await db.execute(update(Job).where(Job.id == job.id).values(**values))
+    await db.commit()
+
+
+async def release_abandoned(db: AsyncSession) -> int:
+    """Puts jobs back into the queue whose worker died while running them"""
+    result = await db.execute(
+        update(Job)
+        .where(Job.status == Job.STATUS_PROGRESS,
+               Job.locked_at < func.date_sub(func.now(), text(f"INTERVAL {settings.JOB_LOCK_TIMEOUT} SECOND")))
+        .values(status=Job.STATUS_INITAL, locked_at=None))
+    await db.commit()
+    return result.rowcount
+
+
+async def enqueue_periodic(db: AsyncSession, kind: str) -> bool:
+    """Queues a job of `kind` unless one is still waiting or running, the workers call it for PERIODIC"""
+    pending = await db.scalar(select(func.count()).select_from(Job)
+                              .filter(Job.kind == kind, Job.status.in_([Job.STATUS_INITAL, Job.STATUS_PROGRESS])))
+    if pending:
+        return False
+    enqueue(db, kind, {}, priority=Job.PRIORITY_LOW)
+    await db.commit()
+    return True
+
+
+async def queue_status(db: AsyncSession) -> dict:
+    names = {Job.STATUS_INITAL: "queued", Job.STATUS_PROGRESS: "running", Job.STATUS_SUCCESS: "done",
+             Job.STATUS_ERROR: "failed"}
+    result = await db.execute(select(Job.kind, Job.status, func.count()).group_by(Job.kind, Job.status))
+    status: Dict[str, Dict[str, int]] = {}
+    for kind, job_status, count in result.all():
+        status.setdefault(kind, {})[names.get(job_status, str(job_status))] = count
+    return status
+
+
+class Worker:
+    """Runs up to `concurrency` jobs at once in one process until SIGTERM / SIGINT"""
+
+    def __init__(self, concurrency: int = settings.JOB_WORKER_CONCURRENCY,
+                 poll_interval: float = settings.JOB_POLL_INTERVAL):
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.running: Set[asyncio.Task] = set()
+        self.stopping = asyncio.Event()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, self.stopping.set)
+        released_at = 0.0
+        scheduled_at: Dict[str, float] = {}
+        while not self.stopping.is_set():
+            if time.monotonic() - released_at > settings.JOB_LOCK_TIMEOUT / 2:
+                async with AsyncSessionLocal() as db:
+                    if released := await release_abandoned(db):
+                        settings.logger.warning(f"Released {released} abandoned jobs")
+                released_at = time.monotonic()
+            for kind, every in PERIODIC.items():
+                if time.monotonic() - scheduled_at.get(kind, float("-inf")) > every:
+                    async with AsyncSessionLocal() as db:
+                        await enqueue_periodic(db, kind)
+                    scheduled_at[kind] = time.monotonic()
+            jobs = []
+            if len(self.running) < self.concurrency:
+                async with AsyncSessionLocal() as db:
+                    jobs = await claim(db, self.concurrency - len(self.running))
+            for job in jobs:
+                task = asyncio.create_task(self.execute(job))
+                self.running.add(task)
+                task.add_done_callback(self.running.discard)
+            if not jobs:
+                try:
+                    await asyncio.wait_for(self.stopping.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+        if self.running:
+            await asyncio.wait(self.running)
+
+    async def execute(self, job: models.Job):
+        started = time.perf_counter()
+        try:
+            run = HANDLERS.get(job.kind)
+            if run is None:
+                raise LookupError(f"No handler registered for {job.kind!r} jobs")
+            await run(job.payload)
+        except Exception:
+            settings.logger.warning(f"Job {job.id} ({job.kind}) failed on attempt {job.attempt}")
+            jobs_processed.inc(kind=job.kind, result="failed")
+            async with AsyncSessionLocal() as db:
+                await fail(db, job, traceback.format_exc())
+        else:
+            jobs_processed.inc(kind=job.kind, result="done")
+            async with AsyncSessionLocal() as db:
+                await complete(db, job)
+        finally:
+            job_seconds.observe(time.perf_counter() - started, kind=job.kind)
+
+
+async def serve(concurrency: int):
+    from src.internal.email import close_mailer  # importing src.internal registers the job handlers
+
+    try:
+        await Worker(concurrency).run()
+    finally:
+        await close_mailer()
+        await dispose_engines()
+
+
+def run_worker(concurrency: int):
+    settings.configure_logging()
+    asyncio.run(serve(concurrency))
+
+
+async def enqueue_once(kind: str):
+    async with AsyncSessionLocal() as db:
+        job = enqueue(db, kind, {}, priority=Job.PRIORITY_LOW)
+        await db.commit()
+    await dispose_engines()
+    print(f"Queued job {job.id} ({kind})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run job queue workers")
+    parser.add_argument("--processes", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=settings.JOB_WORKER_CONCURRENCY,
+                        help="jobs run at once by each process")
+    parser.add_argument("--enqueue", metavar="KIND", help="queue one job without payload and exit, "
+                                                          "e.g. remove_legacy_qr_codes")
+    args = parser.parse_args()
+
+    if args.enqueue:
+        settings.configure_logging()
+        asyncio.run(enqueue_once(args.enqueue))
+        return
+
+    if args.processes == 1:
+        run_worker(args.concurrency)
+        return
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=run_worker, args=(args.concurrency,), name=f"job-worker-{i}")
+                 for i in range(args.processes)]
+    for process in processes:
+        process.start()
+    signal.signal(signal.SIGTERM, lambda *_: [process.terminate() for process in processes])
+    for process in processes:
+        process.join()
+
+
+if __name__ == "__main__":
+    main()
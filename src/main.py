@@ -1,56 +1,82 @@
-import pathlib
+import contextlib
+import os
 import uvicorn
-import src.models as models
 from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 
-from sqladmin import Admin
-from src.internal.admin import UserAdmin
-from src.routers import writers_router, books_router, users_router
-from database import engine
-from middleware import TimerMiddleware
+import settings
+from src.routers import writers_router, books_router, users_router, internal_router, metrics_router
+from src.middleware import MetricsMiddleware
+from src.storage import MediaStaticFiles
+from settings import DEBUG, METRICS_TOKEN, REQUEST_METRICS
 
 origins = ["http://localshost:8080", "http://localhost:3000"]
-cwd = pathlib.Path().cwd()
 
 
 def include_router(app):
     app.include_router(users_router)
     app.include_router(books_router)
     app.include_router(writers_router)
+    app.include_router(internal_router)
+    if REQUEST_METRICS and METRICS_TOKEN:
+        app.include_router(metrics_router)
 
 
 def include_middleware(app):
-    app.add_middleware(TimerMiddleware)
     app.add_middleware(CORSMiddleware, allow_origins=origins)
+    if REQUEST_METRICS:
+        # Added last so it wraps everything else and sees the final status
+        app.add_middleware(MetricsMiddleware)
 
 
 def configure_static(app):
-    app.mount("/media", StaticFiles(directory="media"), name="media")
+    # The directory is checked by the lifespan, building the app does not touch the file system
+    app.mount("/media", MediaStaticFiles(directory="media", check_dir=False), name="media")
 
 
-def create_tables():
-    models.Base.metadata.create_all(bind=engine)
+def configure_admin(app):
+    from src.internal.admin import LazyAdmin
 
+    # sqladmin is built by the first admin request, building the app needs no DB driver
+    app.mount("/admin", LazyAdmin("/admin"), name="admin")
 
-def start_application():
-    app = FastAPI(debug=True)
-    include_router(app)
-    configure_static(app)
-    create_tables()
-    admin = Admin(app, engine)
-    admin.add_view(UserAdmin)
-    return app
 
+@contextlib.asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Checks the media directory and the mail settings once per worker, closes the DB pools.
 
-application = start_application()
+    The schema is managed by alembic (`alembic upgrade head`), it is never created from here.
+    """
+    from src.database import dispose_engines
+    from src.internal.email import get_mailer
+
+    # Fails startup on a missing media directory or a broken mail configuration, not the
+    # first request needing them
+    if not os.path.isdir("media"):
+        raise RuntimeError(f"Directory 'media' does not exist in {os.getcwd()}")
+    get_mailer()
+    yield
+    await dispose_engines()
 
 
-@application.get("/")
 def root():
     return {"message": "Hello its your main page"}
 
 
+def create_app() -> FastAPI:
+    """Builds the app without side effects, serve it with `uvicorn --factory src.main:create_app`"""
+    settings.configure_logging()
+    app = FastAPI(debug=DEBUG)
+    # FastAPI 0.88 takes no lifespan argument, the router runs it
+    app.router.lifespan_context = lifespan
+    include_router(app)
+    include_middleware(app)
+    configure_static(app)
+    configure_admin(app)
+    app.get("/")(root)
+    return app
+
+
 if __name__ == "__main__":
-    uvicorn.run("src.main:application", host="127.0.0.1", port=8080, log_level="debug", reload=True)
+    # Development server, use src.server in production
+    uvicorn.run("src.main:create_app", factory=True, host="127.0.0.1", port=8080, log_level="debug", reload=True)
@@ -0,0 +1,266 @@
+import bisect
+import copy
+import itertools
+import json
+import math
+import os
+import threading
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Metric:
+    """Base class of the in-process metrics, values are kept per label combination"""
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], object] = {}
+
+    def key(self, **labels) -> Tuple[str, ...]:
+        """Label values in `labelnames` order, hot paths compute it once and use the *_key methods"""
+        return tuple([str(labels.get(name, "")) for name in self.labelnames])
+
+    def labels_of(self, key: Tuple[str, ...]) -> Dict[str, str]:
+        return dict(zip(self.labelnames, key))
+
+    def items(self):
+        with self._lock:
+            return list(self._values.items())
+
+    def snapshot(self) -> dict:
+        return {",".join(f"{k}={v}" for k, v in self.labels_of(key).items()): value for key, value in self.items()}
+
+    def samples(self) -> Iterator[Tuple[str, Dict[str, str], float]]:
+        """Yields (name, labels, value) for the Prometheus text exposition"""
+        for key, value in self.items():
+            yield self.name, self.labels_of(key), value
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        self.inc_key(self.key(**labels), amount)
+
+    def inc_key(self, key: Tuple[str, ...], amount: float = 1):
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self.key(**labels), 0)
+
+    def merge_key(self, key: Tuple[str, ...], value: float):
+        self.inc_key(key, value)
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self.key(**labels)] = value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        self.observe_key(self.key(**labels), value)
+
+    def observe_key(self, key: Tuple[str, ...], value: float):
+        # Only the bucket the value falls into is counted here, items() accumulates them
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"buckets": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0}
+            state["buckets"][index] += 1
+            state["sum"] += value
+            state["count"] += 1
+
+    def merge_key(self, key: Tuple[str, ...], value: dict):
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"buckets": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0}
+            state["buckets"] = [mine + theirs for mine, theirs in zip(state["buckets"], value["buckets"])]
+            state["sum"] += value["sum"]
+            state["count"] += value["count"]
+
+    def items(self):
+        with self._lock:
+            return [(key, {"buckets": list(itertools.accumulate(state["buckets"][:-1])), "sum": state["sum"],
+                           "count": state["count"]})
+                    for key, state in self._values.items()]
+
+    def snapshot(self) -> dict:
+        result = {}
+        for key, state in self.items():
+            state["mean"] = state["sum"] / state["count"] if state["count"] else 0.0
+            state["buckets"] = dict(zip(self.buckets, state["buckets"]))
+            result[",".join(f"{k}={v}" for k, v in self.labels_of(key).items())] = state
+        return result
+
+    def samples(self) -> Iterator[Tuple[str, Dict[str, str], float]]:
+        for key, state in self.items():
+            labels = self.labels_of(key)
+            for bound, count in zip(self.buckets, state["buckets"]):
+                yield f"{self.name}_bucket", {**labels, "le": format_value(bound)}, count
+            yield f"{self.name}_bucket", {**labels, "le": "+Inf"}, state["count"]
+            yield f"{self.name}_sum", labels, state["sum"]
+            yield f"{self.name}_count", labels, state["count"]
+
+
+class Registry:
+    """Process wide collection of metrics, every uvicorn worker reports its own values"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, Metric] = {}
+
+    def get_or_create(self, metric_class, name: str, documentation: str, labelnames: Iterable[str] = (), **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = metric_class(name, documentation, labelnames, **kwargs)
+            return metric
+
+    def metrics(self):
+        with self._lock:
+            return list(self._metrics.values())
+
+    def snapshot(self, prefix: str = "") -> dict:
+        return {"pid": os.getpid(),
+                "metrics": {m.name: m.snapshot() for m in self.metrics() if m.name.startswith(prefix)}}
+
+    def dump(self) -> dict:
+        """The raw values of every metric, `SharedRegistry` merges the dumps of all workers"""
+        dumped = {}
+        for metric in self.metrics():
+            with metric._lock:
+                values = [[list(key), copy.deepcopy(value)] for key, value in metric._values.items()]
+            dumped[metric.name] = {"type": metric.type, "documentation": metric.documentation,
+                                   "labelnames": list(metric.labelnames), "values": values,
+                                   "buckets": list(getattr(metric, "buckets", ()))}
+        return dumped
+
+    def exposition(self) -> str:
+        """All metrics in the Prometheus text format, version 0.0.4"""
+        lines = []
+        for metric in self.metrics():
+            documentation = metric.documentation.replace("\\", "\\\\").replace("\n", "\\n")
+            lines.append(f"# HELP {metric.name} {documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                if labels:
+                    label_text = ",".join(f'{key}="{escape_label(label)}"' for key, label in labels.items())
+                    lines.append(f"{name}{{{label_text}}} {format_value(value)}")
+                else:
+                    lines.append(f"{name} {format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if value == -math.inf:
+        return "-Inf"
+    if math.isnan(value):
+        return "NaN"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+METRIC_TYPES = {metric_class.type: metric_class for metric_class in (Counter, Gauge, Histogram)}
+
+
+def pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class SharedRegistry:
+    """The registries of all worker processes of src.server, dumped to `<directory>/<pid>.json`.
+
+    Every worker writes its dump periodically and before answering a scrape, which merges
+    all of them. Counters and histograms of exited workers are kept so the totals never go
+    backwards, gauges are summed over the workers still running.
+    """
+
+    def __init__(self, registry: Registry, directory: str):
+        self.registry = registry
+        self.directory = directory
+
+    def write(self):
+        path = os.path.join(self.directory, f"{os.getpid()}.json")
+        temp = f"{path}.tmp"
+        with open(temp, "w") as file:
+            json.dump(self.registry.dump(), file)
+        os.replace(temp, path)
+
+    def merged(self) -> Registry:
+        merged = Registry()
+        for name in sorted(os.listdir(self.directory)):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as file:
+                    dumped = json.load(file)
+            except (OSError, ValueError):
+                continue
+            alive = pid_alive(int(name[:-5]))
+            for metric_name, dump in dumped.items():
+                if dump["type"] == Gauge.type and not alive:
+                    continue
+                metric_class = METRIC_TYPES.get(dump["type"])
+                if metric_class is None:
+                    continue
+                kwargs = {"buckets": tuple(dump["buckets"])} if metric_class is Histogram else {}
+                metric = merged.get_or_create(metric_class, metric_name, dump["documentation"], dump["labelnames"],
+                                              **kwargs)
+                for key, value in dump["values"]:
+                    metric.merge_key(tuple(key), value)
+        return merged
+
+    def exposition(self) -> str:
+        self.write()
+        return self.merged().exposition()
+
+
+REGISTRY = Registry()
+# Set by src.server before it forks the workers
+shared: Optional[SharedRegistry] = None
+
+
+def counter(name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+    return REGISTRY.get_or_create(Counter, name, documentation, labelnames)
+
+
+def gauge(name: str, documentation: str, labelnames: Iterable[str] = ()) -> Gauge:
+    return REGISTRY.get_or_create(Gauge, name, documentation, labelnames)
+
+
+def histogram(name: str, documentation: str, labelnames: Iterable[str] = (),
+              buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY.get_or_create(Histogram, name, documentation, labelnames, buckets=buckets)
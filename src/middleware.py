@@ -1,14 +1,139 @@
+import contextvars
 import time
+from typing import Callable, Dict, Optional
 
-from starlette.middleware.base import BaseHTTPMiddleware
-from fastapi import Request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.routing import Mount
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
+import src.metrics as metrics
 
-class TimerMiddleware(BaseHTTPMiddleware):
-    async def dispatch(
-            self, request: Request, call_next):
-        start_time = time.time()
-        response = await call_next(request)
-        process_time = time.time() - start_time
-        response.headers["X-Process-Time"] = str(process_time)
-        return response
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+UNMATCHED_ROUTE = "<unmatched>"
+
+requests_total = metrics.counter("http_requests_total", "Finished HTTP requests", ["method", "route", "status"])
+request_seconds = metrics.histogram("http_request_duration_seconds", "Time until the response body was sent",
+                                    ["method", "route"])
+requests_in_flight = metrics.gauge("http_requests_in_flight", "HTTP requests currently being handled")
+request_bytes = metrics.counter("http_request_size_bytes_total", "Request body bytes received", ["route"])
+response_bytes = metrics.counter("http_response_size_bytes_total", "Response body bytes sent", ["route"])
+request_queries = metrics.histogram("http_request_db_queries", "SQL statements executed per request", ["route"],
+                                    buckets=QUERY_BUCKETS)
+request_query_seconds = metrics.histogram("http_request_db_seconds", "Time spent in SQL statements per request",
+                                          ["route"])
+
+
+class QueryStats:
+    __slots__ = ("count", "nanoseconds", "started", "route")
+
+    def __init__(self, route: Callable[[], str]):
+        self.count = 0
+        self.nanoseconds = 0
+        self.started = 0
+        # Resolves the route template, only known once the router matched the request
+        self.route = route
+
+
+# Set per request, the engine events below add to it from whatever engine the request used. The
+# annotation is quoted, ContextVar is only subscriptable from Python 3.9
+current_query_stats: "contextvars.ContextVar[Optional[QueryStats]]" = contextvars.ContextVar("query_stats",
+                                                                                              default=None)
+
+
+def current_route() -> Optional[str]:
+    """Route template of the request being handled, None outside of requests"""
+    stats = current_query_stats.get()
+    return stats.route() if stats is not None else None
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = current_query_stats.get()
+    if stats is not None:
+        stats.started = time.perf_counter_ns()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = current_query_stats.get()
+    if stats is not None:
+        stats.count += 1
+        stats.nanoseconds += time.perf_counter_ns() - stats.started
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware recording latency, status, body sizes and DB usage per route.
+
+    Routes are labelled with their path template (`/book/{book_id}/info`), so the number of
+    label combinations stays bounded. X-Process-Time is set to the time until the headers.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self._routes: Dict[object, str] = {}
+
+    def route_of(self, app, endpoint, path: str) -> str:
+        if endpoint is None:
+            return UNMATCHED_ROUTE
+        route = self._routes.get(endpoint)
+        if route is None:
+            # Starlette leaves the matched endpoint in the scope, its path template is looked up
+            # once. Endpoints of mounted apps are labelled with the mount path.
+            route = UNMATCHED_ROUTE
+            for candidate in app.routes:
+                if getattr(candidate, "endpoint", None) is endpoint:
+                    route = candidate.path
+                    break
+                if isinstance(candidate, Mount) and (path + "/").startswith(candidate.path + "/"):
+                    route = candidate.path
+                    break
+            self._routes[endpoint] = route
+        return route
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter_ns()
+        # Routing and mounted apps overwrite these in the shared scope
+        app, path = scope.get("app"), scope["path"]
+        received = sent = 0
+        status, finished = 500, None
+        stats = QueryStats(lambda: self.route_of(app, scope.get("endpoint"), path))
+        token = current_query_stats.set(stats)
+
+        async def receive_counted() -> Message:
+            nonlocal received
+            message = await receive()
+            received += len(message.get("body", b""))
+            return message
+
+        async def send_counted(message: Message):
+            nonlocal sent, status, finished
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                elapsed = (time.perf_counter_ns() - started) / 1e9
+                message["headers"] = [*message.get("headers", ()), (b"x-process-time", str(elapsed).encode())]
+            elif message["type"] == "http.response.body":
+                sent += len(message.get("body", b""))
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                finished = time.perf_counter_ns()
+
+        requests_in_flight.inc_key(())
+        try:
+            await self.app(scope, receive_counted, send_counted)
+        finally:
+            requests_in_flight.inc_key((), -1)
+            current_query_stats.reset(token)
+            # Label tuples are built directly in labelnames order, see metrics.Metric.key
+            route = self.route_of(app, scope.get("endpoint"), path)
+            method = scope["method"]
+            requests_total.inc_key((method, route, str(status)))
+            request_seconds.observe_key((method, route), ((finished or time.perf_counter_ns()) - started) / 1e9)
+            request_bytes.inc_key((route,), received)
+            response_bytes.inc_key((route,), sent)
+            request_queries.observe_key((route,), stats.count)
+            request_query_seconds.observe_key((route,), stats.nanoseconds / 1e9)
@@ -1,4 +1,8 @@
 from .book import Book, Base
 from .user import User, Base
 from .writer import Writer, Base
+from .media_file import MediaFile, Base
 
+from .genre import Genre, book_genres, Base
+from .job import Job, Base
+from .session import UserSession, Base
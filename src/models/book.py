@@ -2,8 +2,9 @@
 import datetime
 
 import sqlalchemy
-from sqlalchemy import Column
+from sqlalchemy import Column, ForeignKey, Index
 from sqlalchemy.dialects.mysql import BIGINT, VARCHAR, TEXT, DATE, TINYINT
+from sqlalchemy.orm import relationship
 
 from helpers.mixins import MysqlPrimaryKeyMixin, MysqlTimestampsMixin
 from src.database import Base
@@ -11,9 +12,13 @@ from src.database import Base
 
 class Book(Base, MysqlPrimaryKeyMixin, MysqlTimestampsMixin):
     __tablename__ = "books"
+    __table_args__ = (Index("ix_books_title_writer_id", "title", "writer_id", unique=True),
+                      Index("ix_books_fulltext", "title", "description", "genres", mysql_prefix="FULLTEXT"))
 
     title = Column("title", VARCHAR(255), nullable=False)
-    writer_id = Column("writer_id", BIGINT(unsigned=True), nullable=False)
+    writer_id = Column("writer_id", BIGINT(unsigned=True),
+                       ForeignKey("writers.id", name="fk_books_writer_id_writers", ondelete="RESTRICT"),
+                       nullable=False, index=True)
     description = Column("description", TEXT(), nullable=True)
     publish_date = Column("publish_date", DATE(), default=datetime.date.today(),
                           server_default=sqlalchemy.text('(CURRENT_DATE())'))
@@ -21,3 +26,6 @@ class Book(Base, MysqlPrimaryKeyMixin, MysqlTimestampsMixin):
     cover_file = Column("cover_file", VARCHAR(255), nullable=True)
     book_file = Column("book_file", VARCHAR(255), nullable=True)
     genres = Column("genres", TEXT(), nullable=True)
+
+    # Never lazy loaded, ask for it with selectinload / joinedload
+    writer = relationship("Writer", lazy="raise")
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+from sqlalchemy import Column, ForeignKey, Index, Table
+from sqlalchemy.dialects.mysql import BIGINT, VARCHAR, INTEGER
+
+from helpers.mixins import MysqlPrimaryKeyMixin, MysqlTimestampsMixin
+from src.database import Base
+
+book_genres = Table(
+    "book_genres", Base.metadata,
+    Column("book_id", BIGINT(unsigned=True), ForeignKey("books.id", ondelete="CASCADE"), primary_key=True),
+    Column("genre_id", BIGINT(unsigned=True), ForeignKey("genres.id", ondelete="CASCADE"), primary_key=True),
+    Index("ix_book_genres_genre_id_book_id", "genre_id", "book_id"),
+)
+
+
+class Genre(Base, MysqlPrimaryKeyMixin, MysqlTimestampsMixin):
+    __tablename__ = "genres"
+
+    name = Column("name", VARCHAR(64), nullable=False, unique=True, index=True)
+    # Facet count, kept in step with book_genres by crud.link_book_genres / crud.unlink_book_genres
+    book_count = Column("book_count", INTEGER(unsigned=True), nullable=False, default=0, server_default="0")
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+import sqlalchemy
+from sqlalchemy import Column, Index
+from sqlalchemy.dialects.mysql import VARCHAR, JSON, TIMESTAMP
+
+from helpers.mixins import MysqlPrimaryKeyMixin, MysqlTimestampsMixin, MysqlStatusMixin, MysqlPriorityAttemptMixin, \
+    MysqlExceptionMixin
+from src.database import Base
+
+
+class Job(Base, MysqlPrimaryKeyMixin, MysqlTimestampsMixin, MysqlStatusMixin, MysqlPriorityAttemptMixin,
+          MysqlExceptionMixin):
+    """Persistent background job, see src.jobs. Lower `priority` values run first"""
+    __tablename__ = "jobs"
+    __table_args__ = (Index("ix_jobs_status_priority_run_at", "status", "priority", "run_at"),)
+
+    PRIORITY_HIGH = 0
+    PRIORITY_NORMAL = 100
+    PRIORITY_LOW = 200
+
+    kind = Column("kind", VARCHAR(64), nullable=False)
+    payload = Column("payload", JSON(), nullable=False)
+    run_at = Column("run_at", TIMESTAMP, nullable=False, server_default=sqlalchemy.text("CURRENT_TIMESTAMP"))
+    locked_at = Column("locked_at", TIMESTAMP, nullable=True)
@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+from sqlalchemy import Column
+from sqlalchemy.dialects.mysql import BIGINT, VARCHAR, CHAR, INTEGER
+
+from helpers.mixins import MysqlPrimaryKeyMixin, MysqlTimestampsMixin
+from src.database import Base
+
+
+class MediaFile(Base, MysqlPrimaryKeyMixin, MysqlTimestampsMixin):
+    __tablename__ = "media_files"
+
+    path = Column("path", VARCHAR(255), nullable=False, unique=True, index=True)
+    sha256 = Column("sha256", CHAR(64), nullable=False)
+    size = Column("size", BIGINT(unsigned=True), nullable=False)
+    content_type = Column("content_type", VARCHAR(255), nullable=True)
+    refcount = Column("refcount", INTEGER(unsigned=True), nullable=False, default=0)
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+from sqlalchemy import Column, ForeignKey
+from sqlalchemy.dialects.mysql import BIGINT, CHAR, TIMESTAMP
+
+from helpers.mixins import MysqlPrimaryKeyMixin, MysqlTimestampsMixin
+from src.database import Base
+
+
+class UserSession(Base, MysqlPrimaryKeyMixin, MysqlTimestampsMixin):
+    """Login session behind a rotating refresh token, see src.internal.sessions.
+
+    Only SHA-256 hashes of the token secrets are stored. `previous_token_hash` is kept after
+    each rotation so a replayed old token can be recognized.
+    """
+    __tablename__ = "sessions"
+
+    user_id = Column("user_id", BIGINT(unsigned=True),
+                     ForeignKey("users.id", name="fk_sessions_user_id_users", ondelete="CASCADE"),
+                     nullable=False, index=True)
+    token_hash = Column("token_hash", CHAR(64), nullable=False)
+    previous_token_hash = Column("previous_token_hash", CHAR(64), nullable=True)
+    expires_at = Column("expires_at", TIMESTAMP, nullable=False, index=True)
+    revoked_at = Column("revoked_at", TIMESTAMP, nullable=True)
@@ -2,7 +2,7 @@
 import datetime
 
 import sqlalchemy
-from sqlalchemy import Column
+from sqlalchemy import Column, Index
 from sqlalchemy.dialects.mysql import VARCHAR, DATE
 
 from helpers.mixins import MysqlPrimaryKeyMixin, MysqlTimestampsMixin
@@ -11,6 +11,8 @@ from src.database import Base
 
 class Writer(Base, MysqlPrimaryKeyMixin, MysqlTimestampsMixin):
     __tablename__ = "writers"
+    __table_args__ = (Index("ix_writers_name_lastname_born", "name", "lastname", "born", unique=True),
+                      Index("ix_writers_fulltext", "name", "lastname", mysql_prefix="FULLTEXT"))
 
     name = Column("name", VARCHAR(255), nullable=False)
     lastname = Column("lastname", VARCHAR(255), nullable=False)
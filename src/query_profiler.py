@@ -0,0 +1,131 @@
+import re
+import threading
+import time
+from typing import Dict, List, Optional
+
+from sqlalchemy import event
+
+import settings
+import src.metrics as metrics
+from src.middleware import current_route
+
+OUTSIDE_REQUEST = "<no request>"
+
+slow_queries = metrics.counter("db_slow_queries_total", "Statements slower than SQL_SLOW_QUERY_MS", ["route"])
+
+# Expanded IN lists differ in length only, they are folded so they aggregate as one statement
+IN_LIST = re.compile(r"\((?:\s*(?:%s|\?|%\(\w+\)s)\s*,)+\s*(?:%s|\?|%\(\w+\)s)\s*\)")
+WHITESPACE = re.compile(r"\s+")
+
+
+def normalize(statement: str) -> str:
+    return IN_LIST.sub("(...)", WHITESPACE.sub(" ", statement).strip())
+
+
+class StatementStats:
+    __slots__ = ("statement", "count", "total_ns", "max_ns", "slow", "routes", "explain")
+
+    def __init__(self, statement: str):
+        self.statement = statement
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+        self.slow = 0
+        self.routes: Dict[str, int] = {}
+        self.explain: Optional[List[list]] = None
+
+    def report(self) -> dict:
+        return {"statement": self.statement, "count": self.count,
+                "total_ms": self.total_ns / 1e6, "mean_ms": self.total_ns / self.count / 1e6 if self.count else 0.0,
+                "max_ms": self.max_ns / 1e6, "slow": self.slow, "routes": dict(self.routes), "explain": self.explain}
+
+
+class QueryProfiler:
+    """Aggregates every SQL statement by its text and the route that ran it.
+
+    Statements slower than `slow_ms` are logged through settings.logger and, for SELECTs with
+    `explain` on, the EXPLAIN of their slowest run is kept with the statement. At most
+    `max_statements` statement texts are tracked, runs of any further ones are only counted
+    as dropped.
+    """
+
+    REPORT_ORDERS = ("total_ms", "mean_ms", "max_ms", "count", "slow")
+
+    def __init__(self, slow_ms: float, explain: bool, max_statements: int):
+        self.slow_ns = int(slow_ms * 1e6)
+        self.explain = explain
+        self.max_statements = max_statements
+        self.dropped = 0
+        self._lock = threading.Lock()
+        # Raw statement text -> stats, several texts can share the stats of their normalized form
+        self._statements: Dict[str, StatementStats] = {}
+        self._normalized: Dict[str, StatementStats] = {}
+
+    def instrument(self, db_engine):
+        event.listen(db_engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(db_engine, "after_cursor_execute", self._after_cursor_execute)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        # Kept on the execution context, a statement that raises leaves nothing behind on the connection
+        context._profiler_started = time.perf_counter_ns()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter_ns() - context._profiler_started
+        route = current_route() or OUTSIDE_REQUEST
+        slow = elapsed >= self.slow_ns
+        with self._lock:
+            stats = self._statements.get(statement)
+            if stats is None:
+                if len(self._statements) >= self.max_statements:
+                    self.dropped += 1
+                    return
+                # SQLAlchemy reuses the raw text of cached statements, so normalizing happens once per text
+                key = normalize(statement)
+                stats = self._normalized.get(key)
+                if stats is None:
+                    stats = self._normalized[key] = StatementStats(key)
+                self._statements[statement] = stats
+            stats.count += 1
+            stats.total_ns += elapsed
+            stats.routes[route] = stats.routes.get(route, 0) + 1
+            slowest = elapsed > stats.max_ns
+            stats.max_ns = max(stats.max_ns, elapsed)
+            if slow:
+                stats.slow += 1
+        if not slow:
+            return
+        slow_queries.inc(route=route)
+        settings.logger.warning(f"Slow query {elapsed / 1e6:.1f} ms on {route}: {stats.statement}")
+        if self.explain and slowest and statement.lstrip()[:6].upper() == "SELECT":
+            stats.explain = self._run_explain(conn, statement, parameters)
+            settings.logger.warning(f"EXPLAIN: {stats.explain}")
+
+    @staticmethod
+    def _run_explain(conn, statement: str, parameters) -> Optional[List[list]]:
+        # A raw DBAPI cursor, so the EXPLAIN itself is neither profiled nor counted per request
+        cursor = conn.connection.cursor()
+        try:
+            cursor.execute(f"EXPLAIN {statement}", parameters)
+            return [list(row) for row in cursor.fetchall()]
+        except Exception as e:
+            settings.logger.warning(f"EXPLAIN failed: {e}")
+            return None
+        finally:
+            cursor.close()
+
+    def report(self, limit: int = 20, order: str = "total_ms") -> dict:
+        with self._lock:
+            reports = [stats.report() for stats in self._normalized.values()]
+        reports.sort(key=lambda report: report[order], reverse=True)
+        return {"slow_query_ms": self.slow_ns / 1e6, "statements": len(reports), "dropped": self.dropped,
+                "top": reports[:limit]}
+
+    def reset(self):
+        with self._lock:
+            self._statements.clear()
+            self._normalized.clear()
+            self.dropped = 0
+
+
+query_profiler = QueryProfiler(settings.SQL_SLOW_QUERY_MS, settings.SQL_EXPLAIN_SLOW,
+                               settings.SQL_PROFILER_MAX_STATEMENTS)
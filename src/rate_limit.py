@@ -0,0 +1,178 @@
+import math
+import time
+from collections import OrderedDict
+from typing import List, NamedTuple, Tuple
+
+from fastapi import HTTPException, Request, status
+
+import settings
+import src.metrics as metrics
+
+rate_limited = metrics.counter("rate_limit_requests_total", "Requests checked against a rate limit by outcome",
+                               ["limit", "result"])
+rate_limit_keys = metrics.gauge("rate_limit_keys", "Clients tracked by the in-memory rate limiter")
+
+
+class Limit(NamedTuple):
+    name: str
+    limit: int
+    window: int
+
+    @classmethod
+    def parse(cls, name: str, spec: str) -> "Limit":
+        """`spec` is `<requests>/<seconds>`, such as 30/60"""
+        limit, window = spec.split("/")
+        return cls(name, int(limit), int(window))
+
+
+def sliding_count(previous: int, current: int, elapsed: float, window: int) -> float:
+    """Requests in the last `window` seconds, assuming the previous window's were evenly spread"""
+    return previous * (1 - elapsed / window) + current
+
+
+def retry_after(previous: int, current: int, elapsed: float, limit: Limit) -> int:
+    """Seconds until one more request fits under the limit"""
+    room = limit.limit - 1
+    if current > room:
+        # Only once this window has become the previous one and partly slid out
+        wait = limit.window - elapsed + limit.window * (1 - room / current)
+    else:
+        wait = limit.window * (1 - (room - current) / previous) - elapsed if previous else 0
+    return max(1, math.ceil(wait))
+
+
+class MemoryBackend:
+    """Counters of the current and previous window per key, for a single worker.
+
+    Each key holds three integers. At most `maxsize` keys are kept, the least recently seen
+    are dropped first, which can only let a forgotten client through early.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._counters: "OrderedDict[str, List[int]]" = OrderedDict()
+
+    async def counts(self, key: str, index: int) -> Tuple[int, int]:
+        entry = self._counters.get(key)
+        if entry is None:
+            return 0, 0
+        window_index, current, previous = entry
+        if window_index == index:
+            return previous, current
+        return (current if window_index == index - 1 else 0), 0
+
+    async def add(self, key: str, index: int, window: int):
+        entry = self._counters.get(key)
+        if entry is None:
+            self._counters[key] = [index, 1, 0]
+            while len(self._counters) > self.maxsize:
+                self._counters.popitem(last=False)
+            rate_limit_keys.set(len(self._counters))
+            return
+        if entry[0] != index:
+            entry[2] = entry[1] if entry[0] == index - 1 else 0
+            entry[0], entry[1] = index, 0
+        entry[1] += 1
+        self._counters.move_to_end(key)
+
+    async def reset(self, key: str, index: int):
+        self._counters.pop(key, None)
+        rate_limit_keys.set(len(self._counters))
+
+
+class RedisBackend:
+    """Counters shared by every worker, needs the optional `redis` package"""
+
+    def __init__(self, url: str):
+        try:
+            import redis.asyncio as aioredis
+        except ImportError:
+            raise RuntimeError("RATE_LIMIT_BACKEND=redis requires the `redis` package to be installed")
+        self._redis = aioredis.from_url(url)
+
+    async def counts(self, key: str, index: int) -> Tuple[int, int]:
+        previous, current = await self._redis.mget(f"rate:{key}:{index - 1}", f"rate:{key}:{index}")
+        return int(previous or 0), int(current or 0)
+
+    async def add(self, key: str, index: int, window: int):
+        async with self._redis.pipeline(transaction=False) as pipe:
+            pipe.incr(f"rate:{key}:{index}")
+            pipe.expire(f"rate:{key}:{index}", window * 2)
+            await pipe.execute()
+
+    async def reset(self, key: str, index: int):
+        # Only the current and previous window count, older ones have expired or are ignored
+        await self._redis.delete(f"rate:{key}:{index - 1}", f"rate:{key}:{index}")
+
+
+class RateLimiter:
+    """Sliding window rate limits, approximated from fixed windows of `Limit.window` seconds.
+
+    Rejected requests are not counted, so a client over the limit gets through again as
+    soon as its rate drops. Without a backend every request is allowed.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend
+
+    async def check(self, limit: Limit, key: str):
+        """Raises 429 with Retry-After when one more request would exceed `limit` for `key`"""
+        if self.backend is None:
+            return
+        now = time.time()
+        index, elapsed = divmod(now, limit.window)
+        previous, current = await self.backend.counts(f"{limit.name}:{key}", int(index))
+        if sliding_count(previous, current, elapsed, limit.window) + 1 > limit.limit:
+            rate_limited.inc(limit=limit.name, result="limited")
+            raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="Too many requests",
+                                headers={"Retry-After": str(retry_after(previous, current, elapsed, limit))})
+        rate_limited.inc(limit=limit.name, result="allowed")
+
+    async def hit(self, limit: Limit, key: str):
+        """Counts one request of `key` against `limit`"""
+        if self.backend is not None:
+            await self.backend.add(f"{limit.name}:{key}", int(time.time() // limit.window), limit.window)
+
+    async def acquire(self, limit: Limit, key: str):
+        await self.check(limit, key)
+        await self.hit(limit, key)
+
+    async def reset(self, limit: Limit, key: str):
+        """Forgets the requests of `key` counted against `limit`"""
+        if self.backend is not None:
+            await self.backend.reset(f"{limit.name}:{key}", int(time.time() // limit.window))
+
+
+def create_backend():
+    if settings.RATE_LIMIT_BACKEND == "memory":
+        return MemoryBackend(maxsize=settings.RATE_LIMIT_MAX_KEYS)
+    if settings.RATE_LIMIT_BACKEND == "redis":
+        return RedisBackend(settings.RATE_LIMIT_REDIS_URL)
+    return None
+
+
+rate_limiter = RateLimiter(create_backend())
+
+LOGIN_PER_IP = Limit.parse("login_ip", settings.RATE_LIMIT_LOGIN_PER_IP)
+LOGIN_FAILURES_PER_USERNAME = Limit.parse("login_failures_username", settings.RATE_LIMIT_LOGIN_FAILURES_PER_USERNAME)
+REFRESH_PER_IP = Limit.parse("refresh_ip", settings.RATE_LIMIT_REFRESH_PER_IP)
+SIGNUP_PER_IP = Limit.parse("signup_ip", settings.RATE_LIMIT_SIGNUP_PER_IP)
+
+
+def client_ip(request: Request) -> str:
+    # Behind a proxy run uvicorn with --proxy-headers, so this is the forwarded address
+    return request.client.host if request.client else "unknown"
+
+
+def per_ip(limit: Limit):
+    """Route dependency counting every request of a client address against `limit`"""
+
+    async def dependency(request: Request):
+        await rate_limiter.acquire(limit, client_ip(request))
+
+    return dependency
+
+
+limit_login = per_ip(LOGIN_PER_IP)
+limit_refresh = per_ip(REFRESH_PER_IP)
+limit_signup = per_ip(SIGNUP_PER_IP)
@@ -0,0 +1,158 @@
+import hashlib
+import json
+import re
+from typing import Any, Dict, NamedTuple, Optional
+
+from fastapi import Request, Response
+
+import settings
+import src.metrics as metrics
+from src.cache import TTLCache
+from src.serializers import dumps
+
+cache_requests = metrics.counter("response_cache_requests_total", "Cacheable responses by outcome",
+                                 ["namespace", "result"])
+
+entity_tag_regex = re.compile(r'(?:W/)?("[^"]*")')
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header matches `etag`, RFC 9110 13.1.2.
+
+    The header is `*` or a comma separated list of entity tags, compared weakly so a
+    `W/` prefix on either side is ignored.
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque_tag = entity_tag_regex.match(etag)
+    return opaque_tag is not None and opaque_tag.group(1) in entity_tag_regex.findall(if_none_match)
+
+
+class CachedResponse(NamedTuple):
+    body: bytes
+    etag: str
+    headers: Dict[str, str]
+
+    def dumps(self) -> bytes:
+        return json.dumps({"etag": self.etag, "headers": self.headers}).encode() + b"\n" + self.body
+
+    @classmethod
+    def loads(cls, raw: bytes) -> "CachedResponse":
+        meta, body = raw.split(b"\n", 1)
+        meta = json.loads(meta)
+        return cls(body=body, etag=meta["etag"], headers=meta["headers"])
+
+
+class MemoryBackend:
+    """Per-process LRU, the invalidations of other processes never reach it.
+
+    src.server turns it off when it runs several workers, use the redis backend there.
+    """
+
+    def __init__(self, maxsize: int, ttl: int):
+        self._cache = TTLCache("responses", maxsize=maxsize, ttl=ttl)
+        self._generations: Dict[str, int] = {}
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return self._cache.get(key)
+
+    async def set(self, key: str, value: bytes):
+        self._cache.set(key, value)
+
+    async def generation(self, namespace: str) -> int:
+        return self._generations.get(namespace, 0)
+
+    async def bump(self, namespace: str):
+        self._generations[namespace] = self._generations.get(namespace, 0) + 1
+
+
+class RedisBackend:
+    """Shared cache for multi-worker deployments, needs the optional `redis` package"""
+
+    def __init__(self, url: str, ttl: int):
+        try:
+            import redis.asyncio as aioredis
+        except ImportError:
+            raise RuntimeError("RESPONSE_CACHE_BACKEND=redis requires the `redis` package to be installed")
+        self._redis = aioredis.from_url(url)
+        self._ttl = ttl
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self._redis.get(f"response:{key}")
+
+    async def set(self, key: str, value: bytes):
+        await self._redis.set(f"response:{key}", value, ex=self._ttl)
+
+    async def generation(self, namespace: str) -> int:
+        return int(await self._redis.get(f"generation:{namespace}") or 0)
+
+    async def bump(self, namespace: str):
+        await self._redis.incr(f"generation:{namespace}")
+
+
+def render(request: Request, cached: CachedResponse) -> Response:
+    headers = {**cached.headers, "ETag": cached.etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), cached.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=cached.body, media_type="application/json", headers=headers)
+
+
+class CacheEntry:
+    """Lookup result of one request, `response` is set on a hit, otherwise call `store`"""
+
+    def __init__(self, backend, key: Optional[str], request: Request, response: Optional[Response] = None):
+        self.backend = backend
+        self.key = key
+        self.request = request
+        self.response = response
+
+    async def store(self, content: Any, headers: Optional[Dict[str, str]] = None) -> Response:
+        body = dumps(content)
+        cached = CachedResponse(body=body, etag=f'"{hashlib.md5(body).hexdigest()}"', headers=headers or {})
+        if self.backend is not None:
+            await self.backend.set(self.key, cached.dumps())
+        return render(self.request, cached)
+
+
+class ResponseCache:
+    """Serialized JSON responses keyed by URL, invalidated per namespace by the write endpoints.
+
+    Invalidation bumps a namespace generation which is part of every key. The key is fixed
+    at lookup time, so a response computed while a write lands is stored under the old
+    generation and never served.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend
+
+    async def lookup(self, namespace: str, request: Request) -> CacheEntry:
+        if self.backend is None:
+            return CacheEntry(None, None, request)
+        key = f"{namespace}:{await self.backend.generation(namespace)}:{request.url}"
+        raw = await self.backend.get(key)
+        if raw is None:
+            cache_requests.inc(namespace=namespace, result="miss")
+            return CacheEntry(self.backend, key, request)
+        cached = CachedResponse.loads(raw)
+        result = "not_modified" if etag_matches(request.headers.get("if-none-match"), cached.etag) else "hit"
+        cache_requests.inc(namespace=namespace, result=result)
+        return CacheEntry(self.backend, key, request, render(request, cached))
+
+    async def invalidate(self, *namespaces: str):
+        if self.backend is None:
+            return
+        for namespace in namespaces:
+            await self.backend.bump(namespace)
+
+
+def create_backend():
+    if settings.RESPONSE_CACHE_BACKEND == "memory":
+        return MemoryBackend(maxsize=settings.RESPONSE_CACHE_SIZE, ttl=settings.RESPONSE_CACHE_TTL)
+    if settings.RESPONSE_CACHE_BACKEND == "redis":
+        return RedisBackend(settings.RESPONSE_CACHE_REDIS_URL, ttl=settings.RESPONSE_CACHE_TTL)
+    return None
+
+
+response_cache = ResponseCache(create_backend())
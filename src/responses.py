@@ -0,0 +1,115 @@
+import os
+import re
+import stat
+from email.utils import formatdate
+from typing import Optional, Tuple
+from urllib.parse import quote
+
+import anyio
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+from src.response_cache import etag_matches
+
+CHUNK_SIZE = 256 * 1024
+range_regex = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def file_etag(stat_result: os.stat_result) -> str:
+    return f'"{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}"'
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Returns the inclusive (start, end) of a single byte range, None to serve the whole file.
+
+    Raises ValueError when the range can not be satisfied.
+    """
+    match = range_regex.match(header.replace(" ", ""))
+    if match is None:
+        return None
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if size == 0:
+        # No byte of an empty file can be selected, a suffix range would give (0, -1)
+        raise ValueError(header)
+    if not start:
+        length = int(end)
+        if length == 0:
+            raise ValueError(header)
+        return max(size - length, 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        raise ValueError(header)
+    return start, end
+
+
+class RangeFileResponse(Response):
+    """FileResponse with HTTP Range / If-Range and If-None-Match support.
+
+    Single byte ranges are answered with 206, multi-range requests fall back to the whole
+    file. The body is read in CHUNK_SIZE chunks off the event loop. uvicorn has no ASGI
+    zero-copy send, for os.sendfile serve media/ from the reverse proxy instead.
+    """
+
+    def __init__(self, path: str, stat_result: os.stat_result, request: Request,
+                 filename: Optional[str] = None, media_type: str = "application/octet-stream"):
+        super().__init__(media_type=media_type)
+        self.path = path
+        self.size = stat_result.st_size
+        self.start, self.end = 0, self.size - 1
+        etag = file_etag(stat_result)
+        self.headers["accept-ranges"] = "bytes"
+        self.headers["etag"] = etag
+        self.headers["last-modified"] = formatdate(stat_result.st_mtime, usegmt=True)
+        if filename:
+            self.headers["content-disposition"] = f"attachment; filename*=utf-8''{quote(filename)}"
+
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            # No Content-Length on a 304, it would describe the body that is not sent
+            self.status_code = 304
+            self.start, self.end = 0, -1
+            del self.headers["content-length"]
+            return
+        range_header = request.headers.get("range")
+        if_range = request.headers.get("if-range")
+        if range_header and (if_range is None or if_range == etag):
+            try:
+                byte_range = parse_range(range_header, self.size)
+            except ValueError:
+                self.status_code = 416
+                self.headers["content-range"] = f"bytes */{self.size}"
+                self.start, self.end = 0, -1
+            else:
+                if byte_range is not None:
+                    self.status_code = 206
+                    self.start, self.end = byte_range
+                    self.headers["content-range"] = f"bytes {self.start}-{self.end}/{self.size}"
+        self.headers["content-length"] = str(self.end - self.start + 1)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        count = self.end - self.start + 1
+        if count <= 0 or scope["method"].upper() == "HEAD":
+            await send({"type": "http.response.body", "body": b""})
+            return
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            await file.seek(self.start)
+            while count > 0:
+                chunk = await file.read(min(CHUNK_SIZE, count))
+                if not chunk:
+                    break
+                count -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": count > 0})
+        if count > 0:
+            await send({"type": "http.response.body", "body": b""})
+
+
+async def stat_regular_file(path: str) -> Optional[os.stat_result]:
+    try:
+        stat_result = await anyio.to_thread.run_sync(os.stat, path)
+    except FileNotFoundError:
+        return None
+    return stat_result if stat.S_ISREG(stat_result.st_mode) else None
@@ -1,4 +1,5 @@
 from .writers import writers_router
 from .books import books_router
 from .users import users_router
+from .internal import internal_router, metrics_router
 
@@ -1,130 +1,212 @@
-import datetime
-import pathlib
+import mimetypes
 from typing import Optional, List
 
-from fastapi import HTTPException, Depends, APIRouter, Form, UploadFile, File, Request
-from sqlalchemy.orm import Session
-from starlette.background import BackgroundTasks
-from starlette.responses import FileResponse
+from fastapi import HTTPException, Depends, APIRouter, BackgroundTasks, Query, Request
+from fastapi.exceptions import RequestValidationError
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
 
+import src.bulk as bulk
 import src.crud as crud
 import src.dependencies as dependencies
 import src.models as models
 import src.schemas as schemas
+import src.serializers as serializers
 from settings import *
+from src.images import cover_variants
 from src.internal.roles import allow_create_and_delete_resource
+from src.response_cache import response_cache
+from src.responses import RangeFileResponse, stat_regular_file
+from src.storage import media_storage
+from src.uploads import StreamingFormParser, UploadTarget
 
 books_router = APIRouter()
 
 
-@books_router.get("/book/{book_id}/info", response_model=schemas.Book, tags=[schemas.Tags.books])
-async def get_book_info(book_id: int, db: Session = Depends(dependencies.get_db)):
-    book = crud.get_book_by_id(db, book_id=book_id)
+@books_router.get("/book/{book_id}/info", response_model=schemas.BookWithWriter, tags=[schemas.Tags.books])
+async def get_book_info(book_id: int, request: Request,
+                        expand: Optional[schemas.BookExpand] = None,
+                        db: AsyncSession = Depends(dependencies.get_db)):
+    cached = await response_cache.lookup("books", request)
+    if cached.response:
+        return cached.response
+    book = await crud.get_book_by_id(db, book_id=book_id, with_writer=expand == schemas.BookExpand.writer)
     if book is None:
         raise HTTPException(status_code=404, detail="Book not found")
     else:
-        return book
+        return await cached.store(serializers.book_dict(book, expand))
 
 
 @books_router.get("/book/{book_id}/download", response_model=schemas.Book, tags=[schemas.Tags.books])
-async def download_book_by_id(book_id: int, db: Session = Depends(dependencies.get_db)):
-    book = crud.get_book_by_id(db, book_id=book_id)
+async def download_book_by_id(book_id: int, request: Request, db: AsyncSession = Depends(dependencies.get_db)):
+    book = await crud.get_book_by_id(db, book_id=book_id)
     if book is None:
         raise HTTPException(status_code=404, detail="Book not found")
-    file = pathlib.Path(book.book_file)
-    if file.exists():
-        return FileResponse(file, filename=file.name)
-    else:
+    file = media_storage.path(book.book_file)
+    stat_result = await stat_regular_file(str(file))
+    if stat_result is None:
         raise HTTPException(status_code=404, detail="Book file not found")
+    media_type = mimetypes.guess_type(file.name)[0] or "application/octet-stream"
+    return RangeFileResponse(str(file), stat_result, request, filename=f"{book.title}{file.suffix}",
+                             media_type=media_type)
 
 
-@books_router.get("/books/", response_model=List[schemas.Book], tags=[schemas.Tags.books])
+@books_router.get("/books/", response_model=List[schemas.BookWithWriter], tags=[schemas.Tags.books])
 async def get_books(request: Request,
                     params: schemas.PaginationQueryParams = Depends(),
-                    db: Session = Depends(dependencies.get_db)):
-    items = crud.get_books(db, skip=params.skip, limit=params.limit)
-    for item in items:
-        img_url = request.url_for('media', path=item.cover_file.replace('\\', '/'))
-        book_url = request.url_for('media', path=item.book_file.replace('\\', '/'))
-        item.cover_file = img_url
-        item.book_file = book_url
-    return items
+                    genre: Optional[List[str]] = Query(None, description="Only books of any of these genres"),
+                    expand: Optional[schemas.BookExpand] = None,
+                    db: AsyncSession = Depends(dependencies.get_db)):
+    cached = await response_cache.lookup("books", request)
+    if cached.response:
+        return cached.response
+    items = await crud.get_books(db, skip=params.skip, limit=params.limit, after_id=params.after_id, genres=genre,
+                                 with_writer=expand == schemas.BookExpand.writer)
+    cursor = schemas.next_cursor(items, params.limit)
+    headers = {schemas.NEXT_CURSOR_HEADER: cursor} if cursor else None
+    media_url = serializers.MediaUrls(request)
+    return await cached.store([serializers.book_row_dict(item, media_url, expand) for item in items], headers=headers)
+
+
+@books_router.get("/writer/{writer_id}/books", response_model=List[schemas.Book], tags=[schemas.Tags.writers],
+                  summary="Books of a writer")
+async def get_writer_books(writer_id: int, request: Request,
+                           params: schemas.PaginationQueryParams = Depends(),
+                           db: AsyncSession = Depends(dependencies.get_db)):
+    cached = await response_cache.lookup("books", request)
+    if cached.response:
+        return cached.response
+    if await crud.get_writer_by_id(db, writer_id=writer_id) is None:
+        raise HTTPException(status_code=404, detail="Writer not found")
+    items = await crud.get_writer_books(db, writer_id, skip=params.skip, limit=params.limit,
+                                        after_id=params.after_id)
+    cursor = schemas.next_cursor(items, params.limit)
+    headers = {schemas.NEXT_CURSOR_HEADER: cursor} if cursor else None
+    media_url = serializers.MediaUrls(request)
+    return await cached.store([serializers.book_row_dict(item, media_url) for item in items], headers=headers)
+
+
+@books_router.get("/books/genres", response_model=List[schemas.GenreFacet], tags=[schemas.Tags.books],
+                  summary="Genres with their number of books")
+async def get_genre_facets(request: Request, db: AsyncSession = Depends(dependencies.get_db)):
+    cached = await response_cache.lookup("books", request)
+    if cached.response:
+        return cached.response
+    facets = await crud.get_genre_facets(db)
+    return await cached.store([schemas.GenreFacet(name=name, count=count) for name, count in facets])
+
+
+@books_router.get("/books/search", response_model=List[schemas.BookSearchResult], tags=[schemas.Tags.books],
+                  summary="Full-text search over books")
+async def search_books(request: Request,
+                       q: str = Query(..., min_length=1, max_length=255,
+                                      description="Words to look for in title, description, genres and writer name"),
+                       skip: int = Query(0, ge=0),
+                       limit: int = Query(10, ge=1, le=100),
+                       expand: Optional[schemas.BookExpand] = None,
+                       db: AsyncSession = Depends(dependencies.get_db)):
+    cached = await response_cache.lookup("books", request)
+    if cached.response:
+        return cached.response
+    rows = await crud.search_books(db, query=q, skip=skip, limit=limit, with_writer=expand == schemas.BookExpand.writer)
+    media_url = serializers.MediaUrls(request)
+    return await cached.store([serializers.book_row_dict(row, media_url, expand, relevance=row.relevance)
+                               for row in rows])
 
 
 @books_router.post("/book/add_info", response_model=schemas.Book, tags=[schemas.Tags.books])
-async def add_book_info(book: schemas.BookCreate, db: Session = Depends(dependencies.get_db)):
-    is_book_reg = crud.get_book_by_title(db, title=book.title)
+async def add_book_info(book: schemas.BookCreate, db: AsyncSession = Depends(dependencies.get_db)):
+    is_book_reg = await crud.get_book_by_title(db, title=book.title)
     if is_book_reg:
         raise HTTPException(status_code=400, detail="Book already added")
-    return crud.add_book(db=db, book=book)
-
-
-@books_router.post("/book/add_form", response_model=schemas.Book, tags=[schemas.Tags.books])
-async def add_book_form(background_tasks: BackgroundTasks,
-                        title: str = Form(...),
-                        writer_id: Optional[int] = Form(default=None),
-                        description: Optional[str] = Form(default=None),
-                        publish_date: datetime.date = Form(default=datetime.date.today()),
-                        rating: Optional[int] = Form(default=None),
-                        cover_filename: Optional[str] = Form(default=None),
-                        book_filename: Optional[str] = Form(default=None),
-                        genres: Optional[str] = Form(default=None),
-                        cover_file: Optional[UploadFile] = File(default=None),
-                        book_file: UploadFile = File(...),
-                        db: Session = Depends(dependencies.get_db)):
-    if cover_filename is None:
-        cover_filepath = cwd / "media" / "covers" / f"{cover_file.filename}"
-        cover_file.filename = cover_filepath
-    else:
-        cover_file.filename = cwd / "media" / "covers" / f"{cover_filename}{pathlib.Path(cover_file.filename).suffix}"
+    if await crud.get_writer_by_id(db, writer_id=book.writer_id) is None:
+        raise HTTPException(status_code=400, detail="Writer not found")
+    db_book = await crud.add_book(db=db, book=book)
+    await response_cache.invalidate("books")
+    return db_book
 
-    if book_filename is None:
-        book_filepath = cwd / "media" / "books" / f"{book_file.filename}"
-        book_file.filename = book_filepath
-    else:
-        book_file.filename = cwd / "media" / "books" / f"{book_filename}{pathlib.Path(book_file.filename).suffix}"
 
-    if cover_file.content_type == 'image/png' \
-            or cover_file.content_type == 'image/jpeg':
-        background_tasks.add_task(crud.save_file, cover_file)
-    else:
-        raise HTTPException(status_code=418, detail="Unsupported format, must be .jpg or .png")
+def book_form_request_body() -> dict:
+    schema = schemas.BookForm.schema()
+    schema["properties"]["cover_file"] = {"title": "Cover File", "type": "string", "format": "binary"}
+    schema["properties"]["book_file"] = {"title": "Book File", "type": "string", "format": "binary"}
+    schema["required"].append("book_file")
+    return {"requestBody": {"required": True, "content": {"multipart/form-data": {"schema": schema}}}}
+
+
+@books_router.post("/book/add_form", response_model=schemas.Book, tags=[schemas.Tags.books],
+                   openapi_extra=book_form_request_body())
+async def add_book_form(request: Request, background_tasks: BackgroundTasks,
+                        db: AsyncSession = Depends(dependencies.get_db)):
+    incoming_dir = cwd / "media_protected" / "uploads"
+    form = StreamingFormParser(request, {
+        "cover_file": UploadTarget(incoming_dir, ("image/png", "image/jpeg"),
+                                   "Unsupported format, must be .jpg or .png"),
+        "book_file": UploadTarget(incoming_dir, ("application/epub+zip", "text/plain", "application/pdf"),
+                                  "Unsupported format, must be .epub / .txt / .pdf "),
+    })
+    fields, files = await form.parse()
+    try:
+        try:
+            book_form = schemas.BookForm(**{key: value for key, value in fields.items() if value != ""})
+        except ValidationError as e:
+            raise RequestValidationError(e.raw_errors)
+        if "book_file" not in files:
+            raise HTTPException(status_code=422, detail="Book file is required")
+
+        is_book_reg = await crud.get_book_by_title(db, title=book_form.title)
+        if is_book_reg:
+            raise HTTPException(status_code=400, detail="Book already added")
+        if book_form.writer_id is None or await crud.get_writer_by_id(db, writer_id=book_form.writer_id) is None:
+            raise HTTPException(status_code=400, detail="Writer not found")
+        keys = {field: await crud.acquire_media(db, file) for field, file in files.items()}
+        db_book = models.Book(title=book_form.title,
+                              writer_id=book_form.writer_id,
+                              description=book_form.description,
+                              publish_date=book_form.publish_date,
+                              rating=book_form.rating,
+                              cover_file=keys.get("cover_file"),
+                              book_file=keys["book_file"],
+                              genres=book_form.genres)
+        db.add(db_book)
+        await db.flush()
+        await crud.link_book_genres(db, {db_book.id: db_book.genres})
+        # Stored before the commit, a failed move then leaves no media_files row without its file.
+        # A failed commit can only leave an unreferenced file, the next identical upload reuses it.
+        for field, key in keys.items():
+            await crud.save_file(files[field], key)
+        await db.commit()
+    finally:
+        await form.discard()
+    if "cover_file" in keys:
+        background_tasks.add_task(cover_variants.pregenerate, keys["cover_file"])
+    await db.refresh(db_book)
+    await response_cache.invalidate("books")
+    return db_book
 
-    if book_file.content_type == 'application/epub+zip' \
-            or book_file.content_type == 'text/plain' \
-            or book_file.content_type == 'application/pdf':
-        book_file.filename = cwd / "media" / "books" / f"{book_file.filename}"
-        background_tasks.add_task(crud.save_file, book_file)
-    else:
-        raise HTTPException(status_code=418, detail="Unsupported format, must be .epub / .txt / .pdf ")
 
-    is_book_reg = crud.get_book_by_title(db, title=title)
-    if is_book_reg:
-        raise HTTPException(status_code=400, detail="Book already added")
-    cover_file_db_format_name = str(pathlib.Path(*cover_file.filename.parts[-2:]))
-    book_file_db_format_name = str(pathlib.Path(*book_file.filename.parts[-2:]))
-    db_book = models.Book(title=title,
-                          writer_id=writer_id,
-                          description=description,
-                          publish_date=publish_date,
-                          rating=rating,
-                          cover_file=cover_file_db_format_name,
-                          book_file=book_file_db_format_name,
-                          genres=genres)
-    db.add(db_book)
-    db.commit()
-    db.refresh(db_book)
-    return db_book
+@books_router.post("/books/bulk", dependencies=[Depends(allow_create_and_delete_resource)],
+                   tags=[schemas.Tags.books], summary="Bulk load books from NDJSON or CSV")
+async def bulk_add_books(request: Request,
+                         batch_size: int = Query(BULK_IMPORT_BATCH_SIZE, ge=1, le=bulk.MAX_BATCH_SIZE),
+                         db: AsyncSession = Depends(dependencies.get_db)):
+    report = await bulk.import_request(db, "books", request, batch_size)
+    await response_cache.invalidate("books")
+    return report
 
 
 @books_router.delete("/book/{book_id}", dependencies=[Depends(allow_create_and_delete_resource)],
                      tags=[schemas.Tags.books])
-async def delete_book(book_id: int, db: Session = Depends(dependencies.get_db)):
-    book = crud.get_book_by_id(db, book_id=book_id)
+async def delete_book(book_id: int, db: AsyncSession = Depends(dependencies.get_db)):
+    book = await crud.get_book_by_id(db, book_id=book_id)
     if book is None:
         raise HTTPException(status_code=404, detail="Book not found")
-    deleted = crud.delete_book_by_id(db, book)
+    deleted = await crud.delete_book_by_id(db, book)
     if deleted:
+        for key in (book.cover_file, book.book_file):
+            if key:
+                await crud.release_media(db, key)
+        await response_cache.invalidate("books")
         return {"deleted_book": book}
     else:
         raise HTTPException(status_code=404, detail="Unexpected error")
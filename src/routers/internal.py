@@ -0,0 +1,68 @@
+import hmac
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import src.dependencies as dependencies
+import src.jobs as jobs
+import src.metrics as metrics
+import src.schemas as schemas
+from src.database import get_engine, get_async_engine, pool_status
+from settings import METRICS_TOKEN, SQL_PROFILER
+from src.internal.roles import allow_create_and_delete_resource
+from src.query_profiler import QueryProfiler, query_profiler
+
+internal_router = APIRouter(prefix="/internal", dependencies=[Depends(allow_create_and_delete_resource)],
+                            tags=[schemas.Tags.internal])
+
+
+def verify_metrics_token(authorization: Optional[str] = Header(None)):
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token.encode(), METRICS_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Invalid metrics token", headers={"WWW-Authenticate": "Bearer"})
+
+
+# Scraped by Prometheus with the METRICS_TOKEN bearer token, only included when it is set
+metrics_router = APIRouter(dependencies=[Depends(verify_metrics_token)], tags=[schemas.Tags.internal])
+
+
+@internal_router.get("/pool", summary="Connection pool state and telemetry of this worker")
+async def get_pool_stats():
+    snapshot = metrics.REGISTRY.snapshot(prefix="db_pool_")
+    snapshot["pools"] = {"sync": pool_status(get_engine()), "async": pool_status(get_async_engine().sync_engine)}
+    return snapshot
+
+
+@internal_router.get("/metrics", summary="All in-process metrics of this worker")
+async def get_metrics():
+    return metrics.REGISTRY.snapshot()
+
+
+@internal_router.get("/jobs", summary="Job queue size per kind and status")
+async def get_jobs(db: AsyncSession = Depends(dependencies.get_db)):
+    return await jobs.queue_status(db)
+
+
+@internal_router.get("/queries", summary="Top SQL statements of this worker, needs SQL_PROFILER")
+async def get_query_profile(limit: int = Query(20, ge=1, le=500),
+                            order: str = Query("total_ms", regex="^(" + "|".join(QueryProfiler.REPORT_ORDERS) + ")$")):
+    if not SQL_PROFILER:
+        raise HTTPException(status_code=404, detail="SQL profiler is disabled")
+    return query_profiler.report(limit, order)
+
+
+@internal_router.delete("/queries", summary="Reset the SQL statement profile of this worker")
+async def reset_query_profile():
+    if not SQL_PROFILER:
+        raise HTTPException(status_code=404, detail="SQL profiler is disabled")
+    query_profiler.reset()
+    return {"detail": "SQL profile reset"}
+
+
+@metrics_router.get("/metrics", response_class=PlainTextResponse, summary="Metrics in the Prometheus text format")
+async def get_prometheus_metrics():
+    # Under src.server every worker answers for all of them
+    registry = metrics.shared or metrics.REGISTRY
+    return PlainTextResponse(registry.exposition(), media_type="text/plain; version=0.0.4")
@@ -1,13 +1,14 @@
-from datetime import timedelta
+from typing import List
 
-import pyotp
-from fastapi import Depends, HTTPException, status, Body, BackgroundTasks, APIRouter
+from fastapi import Depends, HTTPException, status, Body, APIRouter, Response, Form
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 import src.crud as crud
 import src.dependencies as dependencies
+import src.internal.sessions as int_sessions
 import src.internal.users as int_users
+import src.rate_limit as rate_limit
 import src.schemas as schemas
 from src.internal.roles import allow_create_and_delete_resource
 
@@ -16,20 +17,37 @@ from settings import *
 users_router = APIRouter()
 
 
-@users_router.post("/token", response_model=schemas.Token, tags=[schemas.Tags.users])
+@users_router.post("/token", response_model=schemas.Token, dependencies=[Depends(rate_limit.limit_login)],
+                   tags=[schemas.Tags.users])
 async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(),
-                                 db: Session = Depends(dependencies.get_db)):
-    user = int_users.authenticate_user(db, form_data.username, form_data.password)
+                                 db: AsyncSession = Depends(dependencies.get_db)):
+    # Failures are counted per username too, so guessing from many addresses is throttled as well.
+    # The attempt takes its slot before the bcrypt verify, concurrent guesses cannot all pass the
+    # check first, and a successful login clears the failures again.
+    username = form_data.username.lower()
+    await rate_limit.rate_limiter.acquire(rate_limit.LOGIN_FAILURES_PER_USERNAME, username)
+    user = await int_users.authenticate_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = int_users.create_access_token(data={"sub": user.username},
-                                                 expires_delta=access_token_expires)
-    return {"access_token": access_token, "token_type": "bearer"}
+    await rate_limit.rate_limiter.reset(rate_limit.LOGIN_FAILURES_PER_USERNAME, username)
+    return await int_sessions.open_session(db, user)
+
+
+@users_router.post("/token/refresh", response_model=schemas.Token, dependencies=[Depends(rate_limit.limit_refresh)],
+                   tags=[schemas.Tags.users])
+async def refresh_access_token(refresh_token: str = Form(), db: AsyncSession = Depends(dependencies.get_db)):
+    return await int_sessions.refresh_session(db, refresh_token)
+
+
+@users_router.delete("/users/me/sessions", tags=[schemas.Tags.users], summary="Log out everywhere")
+async def revoke_own_sessions(db: AsyncSession = Depends(dependencies.get_db),
+                              current_user: schemas.User = Depends(int_users.get_current_active_user)):
+    revoked = await crud.revoke_sessions(db, current_user.id)
+    return {"detail": f"{revoked} sessions revoked"}
 
 
 @users_router.get("/users/me/", response_model=schemas.User, tags=[schemas.Tags.users])
@@ -38,32 +56,65 @@ async def read_users_me(
     return current_user
 
 
+@users_router.get("/users/me/qr", response_class=Response, tags=[schemas.Tags.users],
+                  summary="OTP QR code of the current user", responses={200: {"content": {"image/png": {}}}})
+async def read_users_me_qr_code(db: AsyncSession = Depends(dependencies.get_db),
+                                current_user: schemas.User = Depends(int_users.get_current_active_user)):
+    db_user = await crud.get_user(db, current_user.id)
+    if db_user is None:
+        # Deleted since its record was cached, like get_current_user
+        raise int_users.credentials_exception()
+    png = await int_users.get_qr_code_png(int_users.provisioning_uri(db_user))
+    return Response(content=png, media_type="image/png",
+                    headers={"Cache-Control": f"private, max-age={QR_CODE_CACHE_TTL}"})
+
+
 @users_router.put("/users/me/", response_model=schemas.User, tags=[schemas.Tags.users])
 async def user_update_own_record(user_update: schemas.UserUpdate,
-                                 db: Session = Depends(dependencies.get_db),
+                                 db: AsyncSession = Depends(dependencies.get_db),
                                  current_user: schemas.User = Depends(int_users.get_current_active_user)):
-    db_user = crud.update_user_self(db, current_user, user_update)
-    db_user.qr_code_link = pyotp.totp.TOTP(db_user.otp_secret).provisioning_uri(
-        name=db_user.email, issuer_name='Library App')
+    db_user = await crud.update_user_self(db, current_user, user_update)
+    int_users.invalidate_cached_user(current_user.username, db_user.username)
+    # The password was replaced, refresh tokens issued for the old one stop working
+    await crud.revoke_sessions(db, db_user.id)
+    db_user.qr_code_link = int_users.provisioning_uri(db_user)
     logger.debug(f"User {db_user.username} was updated")
     return db_user
 
 
+@users_router.get("/users/", response_model=List[schemas.User],
+                  dependencies=[Depends(allow_create_and_delete_resource)], tags=[schemas.Tags.users])
+async def get_users(response: Response,
+                    params: schemas.PaginationQueryParams = Depends(),
+                    db: AsyncSession = Depends(dependencies.get_db)):
+    items = await crud.get_users(db, skip=params.skip, limit=params.limit, after_id=params.after_id)
+    cursor = schemas.next_cursor(items, params.limit)
+    if cursor:
+        response.headers[schemas.NEXT_CURSOR_HEADER] = cursor
+    return items
+
+
 @users_router.get("/users/{user_id}", response_model=schemas.User,
                   dependencies=[Depends(allow_create_and_delete_resource)], tags=[schemas.Tags.users])
 async def get_user_by_id(
         user_id: int,
-        db: Session = Depends(dependencies.get_db),
+        db: AsyncSession = Depends(dependencies.get_db),
         current_user: schemas.User = Depends(int_users.get_current_active_admin_user)):
-    db_user = crud.get_user(db, user_id)
-    db_user.qr_code_link = pyotp.totp.TOTP(db_user.otp_secret).provisioning_uri(
-        name=db_user.email, issuer_name='Library App')
+    db_user = await crud.get_user(db, user_id)
+    db_user.qr_code_link = int_users.provisioning_uri(db_user)
     return db_user
 
 
-@users_router.post("/users/", response_model=schemas.User, tags=[schemas.Tags.users])
+@users_router.delete("/users/{user_id}/sessions",
+                     dependencies=[Depends(allow_create_and_delete_resource)], tags=[schemas.Tags.users])
+async def revoke_user_sessions(user_id: int, db: AsyncSession = Depends(dependencies.get_db)):
+    revoked = await crud.revoke_sessions(db, user_id)
+    return {"detail": f"{revoked} sessions revoked"}
+
+
+@users_router.post("/users/", response_model=schemas.User, dependencies=[Depends(rate_limit.limit_signup)],
+                   tags=[schemas.Tags.users])
 async def create_new_user(
-        background_tasks: BackgroundTasks,
         user: schemas.UserCreate = Body(
             example={
                 "username": "test_user",
@@ -73,18 +124,11 @@ async def create_new_user(
                 "role": "user",
             }
         ),
-        db: Session = Depends(dependencies.get_db)):
-    if crud.get_user_by_username(db, user.username):
+        db: AsyncSession = Depends(dependencies.get_db)):
+    if await crud.get_user_by_username(db, user.username):
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Username is taken")
-    if crud.get_user_by_email(db, user.email):
+    if await crud.get_user_by_email(db, user.email):
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Email is used")
-    db_user = crud.create_user(db, user)
-    db_user.qr_code_link = pyotp.totp.TOTP(db_user.otp_secret).provisioning_uri(
-        name=db_user.email, issuer_name='Library App')
-    qr_code_img = int_users.create_qr_code_img(uri_str=db_user.qr_code_link, username=db_user.username)
-    int_users.send_email_background_new_user(background_tasks,
-                                             subject='Hello there!',
-                                             email_to=db_user.email,
-                                             body={'title': 'Hello dear user', 'name': db_user.full_name,
-                                                   'qr_code_img': qr_code_img}, template_name='new_user_email.html')
+    db_user = await crud.create_user(db, user)
+    db_user.qr_code_link = int_users.provisioning_uri(db_user)
     return db_user
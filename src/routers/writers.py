@@ -1,47 +1,76 @@
 from typing import List
 
-from fastapi import HTTPException, Depends, APIRouter
-from sqlalchemy.orm import Session
+from fastapi import HTTPException, Depends, APIRouter, Query, Request
+from sqlalchemy.ext.asyncio import AsyncSession
 from src.internal.roles import allow_create_and_delete_resource
+import src.bulk as bulk
 import src.crud as crud
 import src.dependencies as dependencies
 import src.schemas as schemas
+import src.serializers as serializers
+from settings import BULK_IMPORT_BATCH_SIZE
+from src.response_cache import response_cache
 
 writers_router = APIRouter()
 
 
 @writers_router.get("/writer/{writer_id}/info", response_model=schemas.Writer, tags=[schemas.Tags.writers],
                     summary="Get writer")
-def get_writer(writer_id: int, db: Session = Depends(dependencies.get_db)):
-    writer = crud.get_writer_by_id(db, writer_id=writer_id)
+async def get_writer(writer_id: int, request: Request, db: AsyncSession = Depends(dependencies.get_db)):
+    cached = await response_cache.lookup("writers", request)
+    if cached.response:
+        return cached.response
+    writer = await crud.get_writer_by_id(db, writer_id=writer_id)
     if writer is None:
         raise HTTPException(status_code=404, detail="Writer not found")
-    return writer
+    return await cached.store(schemas.Writer.from_orm(writer))
 
 
 @writers_router.post("/writer/add", response_model=schemas.Writer, tags=[schemas.Tags.writers], summary="Add writer")
-def add_writer(writer: schemas.WriterCreate, db: Session = Depends(dependencies.get_db)):
-    is_writer_reg = crud.get_writer_by_name(db, name=writer.name, lastname=writer.lastname)
+async def add_writer(writer: schemas.WriterCreate, db: AsyncSession = Depends(dependencies.get_db)):
+    is_writer_reg = await crud.get_writer_by_name(db, name=writer.name, lastname=writer.lastname)
     if is_writer_reg:
         raise HTTPException(status_code=400, detail="Writer already added")
-    return crud.add_writer(db=db, writer=writer)
+    db_writer = await crud.add_writer(db=db, writer=writer)
+    await response_cache.invalidate("writers")
+    return db_writer
 
 
 @writers_router.get("/writers/", response_model=List[schemas.Writer], tags=[schemas.Tags.writers])
-def get_writers(params: schemas.PaginationQueryParams = Depends(),
-                db: Session = Depends(dependencies.get_db)):
-    items = crud.get_writers(db, skip=params.skip, limit=params.limit)
-    return items
+async def get_writers(request: Request,
+                      params: schemas.PaginationQueryParams = Depends(),
+                      db: AsyncSession = Depends(dependencies.get_db)):
+    cached = await response_cache.lookup("writers", request)
+    if cached.response:
+        return cached.response
+    items = await crud.get_writers(db, skip=params.skip, limit=params.limit, after_id=params.after_id)
+    cursor = schemas.next_cursor(items, params.limit)
+    headers = {schemas.NEXT_CURSOR_HEADER: cursor} if cursor else None
+    return await cached.store([serializers.writer_row_dict(item) for item in items], headers=headers)
+
+
+@writers_router.post("/writers/bulk", dependencies=[Depends(allow_create_and_delete_resource)],
+                     tags=[schemas.Tags.writers], summary="Bulk load writers from NDJSON or CSV")
+async def bulk_add_writers(request: Request,
+                           batch_size: int = Query(BULK_IMPORT_BATCH_SIZE, ge=1, le=bulk.MAX_BATCH_SIZE),
+                           db: AsyncSession = Depends(dependencies.get_db)):
+    report = await bulk.import_request(db, "writers", request, batch_size)
+    # Upserts can change writers embedded into book responses
+    await response_cache.invalidate("writers", "books")
+    return report
 
 
 @writers_router.delete("/writer/{writer_id}", dependencies=[Depends(allow_create_and_delete_resource)],
                        tags=[schemas.Tags.writers])
-def delete_writer(writer_id: int, db: Session = Depends(dependencies.get_db)):
-    writer = crud.get_writer_by_id(db, writer_id=writer_id)
+async def delete_writer(writer_id: int, db: AsyncSession = Depends(dependencies.get_db)):
+    writer = await crud.get_writer_by_id(db, writer_id=writer_id)
     if writer is None:
         raise HTTPException(status_code=404, detail="Book not found")
-    deleted = crud.delete_book_by_id(db, writer)
+    if await crud.writer_has_books(db, writer_id=writer_id):
+        raise HTTPException(status_code=400, detail="Writer still has books")
+    deleted = await crud.delete_writer_by_id(db, writer)
     if deleted:
+        await response_cache.invalidate("writers")
         return {"deleted_writer": writer}
     else:
         raise HTTPException(status_code=404, detail="Unexpected error")
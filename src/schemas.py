@@ -1,9 +1,14 @@
+import base64
+import binascii
 import datetime
+import json
 from enum import Enum
 from typing import Optional, Union, List
+from fastapi import HTTPException
 from pydantic import BaseModel, EmailStr, Field
 
 password_regex = "[A-Za-z0-9@#$%^&+_=]{8,}"
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
 
 
 class EmailSchema(BaseModel):
@@ -13,16 +18,15 @@ class EmailSchema(BaseModel):
 class Token(BaseModel):
     access_token: str
     token_type: str
-
-
-class TokenData(BaseModel):
-    username: Optional[str] = None
+    expires_in: Optional[int] = None
+    refresh_token: Optional[str] = None
 
 
 class Tags(Enum):
     books = "books"
     writers = "writers"
     users = "users"
+    internal = "internal"
 
 
 class Role(str, Enum):
@@ -30,10 +34,44 @@ class Role(str, Enum):
     user = 'user'
 
 
+class TokenData(BaseModel):
+    username: Optional[str] = None
+    id: Optional[int] = None
+    role: Optional[Role] = None
+    disable: bool = False
+
+
+def encode_cursor(last_id: int) -> str:
+    """Returns an opaque cursor pointing right after the row with `last_id`"""
+    return base64.urlsafe_b64encode(json.dumps({"id": last_id}).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> int:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return int(payload["id"])
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def next_cursor(items: list, limit: int) -> Optional[str]:
+    """Returns the cursor of the following page or None when `items` is the last one"""
+    if not items or len(items) < limit:
+        return None
+    return encode_cursor(items[-1].id)
+
+
 class PaginationQueryParams:
-    def __init__(self, skip: int = 0, limit: int = 100):
+    """Offset pagination by default, keyset (seek on id) pagination when `cursor` is given.
+
+    The cursor of the next page is returned in the X-Next-Cursor response header.
+    """
+
+    def __init__(self, skip: int = 0, limit: int = 100, cursor: Optional[str] = None):
         self.skip = skip
         self.limit = limit
+        self.cursor = cursor
+        self.after_id = decode_cursor(cursor) if cursor else None
 
 
 class UserBase(BaseModel):
@@ -63,7 +101,7 @@ class User(UserBase):
 
 class BookBase(BaseModel):
     title: str
-    writer_id: str
+    writer_id: int
     description: Union[str, None] = None
     publish_date: datetime.date
     rating: int
@@ -87,9 +125,18 @@ class BookCreate(BookBase):
     book_file: str
 
 
+class BookForm(BaseModel):
+    title: str
+    writer_id: Optional[int] = None
+    description: Optional[str] = None
+    publish_date: datetime.date = Field(default_factory=datetime.date.today)
+    rating: Optional[int] = None
+    genres: Optional[str] = None
+
+
 class Book(BookBase):
     id: int
-    cover_file: str
+    cover_file: Optional[str] = None
     book_file: str
 
     class Config:
@@ -122,3 +169,21 @@ class Writer(WriterBase):
 
     class Config:
         orm_mode = True
+
+
+class BookWithWriter(Book):
+    """Book of an `expand=writer` request, `writer` is only present when it was asked for"""
+    writer: Optional[Writer] = None
+
+
+class BookSearchResult(BookWithWriter):
+    relevance: float
+
+
+class GenreFacet(BaseModel):
+    name: str
+    count: int
+
+
+class BookExpand(str, Enum):
+    writer = 'writer'
@@ -1,3 +1,64 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import HTTPException, status
 from passlib.context import CryptContext
 
+import settings
+import src.metrics as metrics
+
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+hash_seconds = metrics.histogram("password_hash_seconds", "Time spent in bcrypt per operation", ["operation"])
+hash_wait_seconds = metrics.histogram("password_hash_wait_seconds", "Time queued before a hash worker picked it up",
+                                      ["operation"])
+hash_pending = metrics.gauge("password_hash_pending", "Password operations queued or running")
+hash_rejected = metrics.counter("password_hash_rejected_total", "Password operations rejected with 503",
+                                ["operation"])
+
+
+class PasswordHasher:
+    """Runs bcrypt on a bounded thread pool, so logins never block the event loop.
+
+    At most `max_pending` operations may be queued or running at once, any request over
+    that limit is rejected with 503 instead of growing the queue without bound.
+    """
+
+    def __init__(self, workers: int, max_pending: int):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+        self._max_pending = max_pending
+        self._pending = 0
+
+    async def _run(self, operation: str, func, *args):
+        if self._pending >= self._max_pending:
+            hash_rejected.inc(operation=operation)
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                detail="Too many concurrent password operations, try again later",
+                                headers={"Retry-After": "1"})
+        queued = time.perf_counter()
+
+        def timed():
+            started = time.perf_counter()
+            hash_wait_seconds.observe(started - queued, operation=operation)
+            try:
+                return func(*args)
+            finally:
+                hash_seconds.observe(time.perf_counter() - started, operation=operation)
+
+        self._pending += 1
+        hash_pending.set(self._pending)
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, timed)
+        finally:
+            self._pending -= 1
+            hash_pending.set(self._pending)
+
+    async def hash(self, password: str) -> str:
+        return await self._run("hash", pwd_context.hash, password)
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        return await self._run("verify", pwd_context.verify, password, hashed_password)
+
+
+password_hasher = PasswordHasher(settings.PASSWORD_HASH_WORKERS, settings.PASSWORD_HASH_MAX_PENDING)
@@ -0,0 +1,84 @@
+import json
+from typing import Any, Callable, Optional
+
+from fastapi import Request
+from fastapi.encoders import jsonable_encoder
+
+import settings
+import src.models as models
+import src.schemas as schemas
+
+# Column-only selects for list endpoints, rows come back as plain tuples without
+# identity map bookkeeping and are never flushed back
+BOOK_COLUMNS = (models.Book.id, models.Book.title, models.Book.writer_id, models.Book.description,
+                models.Book.publish_date, models.Book.rating, models.Book.genres, models.Book.cover_file,
+                models.Book.book_file)
+WRITER_LIST_COLUMNS = (models.Writer.id, models.Writer.name, models.Writer.lastname, models.Writer.born,
+                       models.Writer.died)
+# Labelled for selects joining writers to books
+WRITER_COLUMNS = (models.Writer.name.label("writer_name"), models.Writer.lastname.label("writer_lastname"),
+                  models.Writer.born.label("writer_born"), models.Writer.died.label("writer_died"))
+
+
+class MediaUrls:
+    """Turns media keys into absolute /media URLs, the route is resolved once per request"""
+    __slots__ = ("base",)
+
+    def __init__(self, request: Request):
+        self.base = request.url_for("media", path="")
+
+    def __call__(self, key: Optional[str]) -> Optional[str]:
+        return self.base + key.replace("\\", "/") if key else None
+
+
+def book_row_dict(row, media_url: MediaUrls, expand: Optional[schemas.BookExpand] = None, **extra) -> dict:
+    """Response body of a BOOK_COLUMNS row in the wire format of schemas.Book.
+
+    With `expand=writer` the row must also carry WRITER_COLUMNS.
+    """
+    data = {"title": row.title, "writer_id": row.writer_id, "description": row.description,
+            "publish_date": row.publish_date, "rating": row.rating, "genres": row.genres, "id": row.id,
+            "cover_file": media_url(row.cover_file), "book_file": media_url(row.book_file)}
+    if expand == schemas.BookExpand.writer:
+        data["writer"] = {"name": row.writer_name, "lastname": row.writer_lastname, "born": row.writer_born,
+                          "died": row.writer_died, "id": row.writer_id}
+    if extra:
+        data.update(extra)
+    return data
+
+
+def writer_row_dict(row) -> dict:
+    """Response body of a WRITER_LIST_COLUMNS row in the wire format of schemas.Writer"""
+    return {"name": row.name, "lastname": row.lastname, "born": row.born, "died": row.died, "id": row.id}
+
+
+def book_dict(book: models.Book, expand: Optional[schemas.BookExpand] = None) -> dict:
+    """Response body of a single ORM book, the writer must be eager loaded for `expand=writer`"""
+    data = schemas.Book.from_orm(book).dict()
+    if expand == schemas.BookExpand.writer:
+        data["writer"] = schemas.Writer.from_orm(book.writer) if book.writer is not None else None
+    return data
+
+
+def encode_json(content: Any) -> bytes:
+    return json.dumps(jsonable_encoder(content), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def create_encoder() -> Callable[[Any], bytes]:
+    """Returns the JSON encoder of cached responses.
+
+    The orjson encoder serializes the row dicts (dates, enums, None) natively in one C pass
+    and only falls back to jsonable_encoder for anything else, like pydantic models. Both
+    produce the same compact UTF-8 body.
+    """
+    if settings.JSON_RESPONSE_ENCODER == "orjson":
+        try:
+            import orjson
+        except ImportError:
+            raise RuntimeError("JSON_RESPONSE_ENCODER=orjson requires the `orjson` package to be installed")
+        # json.dumps turns int, float and date keys into strings as well
+        return lambda content: orjson.dumps(content, default=jsonable_encoder, option=orjson.OPT_NON_STR_KEYS)
+    return encode_json
+
+
+dumps = create_encoder()
@@ -0,0 +1,220 @@
+"""Production entry point: a preloaded app served by forked uvicorn worker processes.
+
+The master imports the app once, binds the socket and forks `--workers` processes that
+accept on it. Each worker runs the app lifespan and opens its own DB connection pools.
+On SIGTERM / SIGINT the workers stop accepting and finish their in-flight requests, those
+still busy after `--graceful-timeout` are killed. Workers that die are replaced. Each
+worker keeps its own metrics, GET /metrics merges those of all of them (metrics.SharedRegistry).
+Run it from the src directory, like the dev server:
+
+    python -m src.server --workers 4 --port 8080
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import signal
+import tempfile
+import time
+from typing import Dict
+
+import uvicorn
+
+import settings
+import src.database as database
+import src.metrics as metrics
+
+RESPAWN_DELAY = 1.0
+# How stale the values of the other workers can be in a scrape of GET /metrics
+METRICS_WRITE_INTERVAL = 5.0
+STOP_SIGNALS = {signal.SIGTERM, signal.SIGINT}
+
+
+def available(module: str) -> bool:
+    try:
+        __import__(module)
+    except ImportError:
+        return False
+    return True
+
+
+def exit_code(status: int) -> int:
+    """os.waitstatus_to_exitcode, which needs Python 3.9: the exit code, -signal when killed"""
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+def implementation(choice: str, module: str, fallback: str) -> str:
+    """Resolves `auto` for --loop and --http to the optional module when it is installed"""
+    if choice == "auto":
+        return module if available(module) else fallback
+    return choice
+
+
+def disable_worker_local_cache(workers: int):
+    """Turns off the memory response cache with several workers, an invalidation only reaches its own worker"""
+    from src.response_cache import MemoryBackend, response_cache
+
+    if workers > 1 and isinstance(response_cache.backend, MemoryBackend):
+        settings.logger.warning("The memory response cache is per worker and would serve responses another worker "
+                                "invalidated, it is off. Set RESPONSE_CACHE_BACKEND=redis to cache with "
+                                f"{workers} workers.")
+        response_cache.backend = None
+
+
+async def write_metrics():
+    while True:
+        await asyncio.sleep(METRICS_WRITE_INTERVAL)
+        metrics.shared.write()
+
+
+async def serve(server: uvicorn.Server, sockets: list):
+    writer = asyncio.create_task(write_metrics()) if metrics.shared else None
+    try:
+        await server.serve(sockets=sockets)
+    finally:
+        if writer is not None:
+            writer.cancel()
+            metrics.shared.write()
+        await database.dispose_engines()
+
+
+def run_worker(config: uvicorn.Config, sockets: list):
+    # Engines are created lazily in the workers, any the master created must not be shared
+    database.reset_engines()
+    server = uvicorn.Server(config)
+    config.setup_event_loop()
+    asyncio.run(serve(server, sockets))
+
+
+class Supervisor:
+    """Forks the workers, replaces the ones that exit and stops all of them on SIGTERM / SIGINT"""
+
+    def __init__(self, config: uvicorn.Config, workers: int, graceful_timeout: float):
+        self.config = config
+        self.workers = workers
+        self.graceful_timeout = graceful_timeout
+        self.children: Dict[int, int] = {}
+        self.stopping = False
+
+    def spawn(self, slot: int):
+        # Blocked across the fork, so a stop signal never runs the master's handler in a worker
+        # that has not restored the default one yet. The master gets it once unblocked.
+        signal.pthread_sigmask(signal.SIG_BLOCK, STOP_SIGNALS)
+        try:
+            pid = os.fork()
+        except OSError:
+            signal.pthread_sigmask(signal.SIG_UNBLOCK, STOP_SIGNALS)
+            raise
+        if pid == 0:
+            code = 0
+            try:
+                # Out of the terminal's process group, Ctrl+C reaches the master only and the
+                # workers get a single SIGTERM from it, a second one would skip the drain
+                os.setpgid(0, 0)
+                for sig in STOP_SIGNALS:
+                    signal.signal(sig, signal.SIG_DFL)
+                signal.pthread_sigmask(signal.SIG_UNBLOCK, STOP_SIGNALS)
+                run_worker(self.config, [self.sock])
+            except BaseException:
+                settings.logger.exception(f"Worker {os.getpid()} crashed")
+                code = 1
+            finally:
+                os._exit(code)
+        signal.pthread_sigmask(signal.SIG_UNBLOCK, STOP_SIGNALS)
+        self.children[pid] = slot
+        settings.logger.info(f"Started worker {pid}")
+
+    def reap(self):
+        while self.children:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if pid == 0:
+                return
+            slot = self.children.pop(pid, None)
+            if slot is not None and not self.stopping:
+                settings.logger.warning(f"Worker {pid} exited with status {exit_code(status)}, "
+                                        f"replacing it")
+                time.sleep(RESPAWN_DELAY)
+                self.spawn(slot)
+
+    def stop(self, *_):
+        self.stopping = True
+
+    def signal_children(self, sig: int):
+        for pid in self.children:
+            try:
+                os.kill(pid, sig)
+            except ProcessLookupError:
+                pass
+
+    def run(self):
+        # Installed before the first fork, a signal during startup still stops the workers
+        for sig in STOP_SIGNALS:
+            signal.signal(sig, self.stop)
+        self.sock = self.config.bind_socket()
+        for slot in range(self.workers):
+            if self.stopping:
+                break
+            self.spawn(slot)
+        while not self.stopping:
+            self.reap()
+            time.sleep(0.2)
+
+        settings.logger.info(f"Stopping {len(self.children)} workers")
+        self.signal_children(signal.SIGTERM)
+        # New connections are refused once no process holds the listening socket anymore
+        self.sock.close()
+        deadline = time.monotonic() + self.graceful_timeout
+        while self.children and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.1)
+        if self.children:
+            settings.logger.warning(f"Killing {len(self.children)} workers still busy after "
+                                    f"{self.graceful_timeout} s")
+            self.signal_children(signal.SIGKILL)
+            while self.children:
+                pid, _ = os.waitpid(-1, 0)
+                self.children.pop(pid, None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the API with several worker processes")
+    parser.add_argument("--host", default=settings.SERVER_HOST)
+    parser.add_argument("--port", type=int, default=settings.SERVER_PORT)
+    parser.add_argument("--workers", type=int, default=settings.WEB_CONCURRENCY)
+    parser.add_argument("--graceful-timeout", type=float, default=settings.GRACEFUL_TIMEOUT,
+                        help="seconds workers get to finish in-flight requests on shutdown")
+    parser.add_argument("--loop", choices=["auto", "asyncio", "uvloop"], default="auto",
+                        help="auto uses uvloop when it is installed")
+    parser.add_argument("--http", choices=["auto", "h11", "httptools"], default="auto",
+                        help="auto uses httptools when it is installed")
+    parser.add_argument("--access-log", action="store_true", help="per request logs, the metrics cover them")
+    args = parser.parse_args()
+    for option, module in (("loop", "uvloop"), ("http", "httptools")):
+        if getattr(args, option) == module and not available(module):
+            parser.error(f"--{option} {module} needs the optional `{module}` package installed")
+    settings.configure_logging()
+    loop = implementation(args.loop, "uvloop", "asyncio")
+    http = implementation(args.http, "httptools", "h11")
+
+    # Preloaded, every worker shares the imported modules instead of importing them again. The
+    # app is started by each worker, the DB engines connect there on first use.
+    from src.main import create_app
+
+    application = create_app()
+    disable_worker_local_cache(args.workers)
+    # X-Forwarded-For is trusted from FORWARDED_ALLOW_IPS (127.0.0.1 by default), see rate_limit.client_ip
+    config = uvicorn.Config(application, host=args.host, port=args.port, loop=loop, http=http,
+                            access_log=args.access_log, log_level="info")
+    settings.logger.info(f"Serving on {args.host}:{args.port} with {args.workers} workers, loop {loop}, http {http}")
+    # Each worker keeps its own registry, GET /metrics merges them through this directory
+    metrics.shared = metrics.SharedRegistry(metrics.REGISTRY, tempfile.mkdtemp(prefix="library-metrics-"))
+    try:
+        Supervisor(config, args.workers, args.graceful_timeout).run()
+    finally:
+        shutil.rmtree(metrics.shared.directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+import abc
+import os
+import pathlib
+from urllib.parse import parse_qs
+
+import aiofiles.os
+import anyio
+from fastapi.staticfiles import StaticFiles
+from starlette.exceptions import HTTPException
+from starlette.responses import Response
+from starlette.types import Scope
+
+from settings import cwd
+from src.images import VARIANT_FORMATS, cover_variants
+from src.uploads import UploadedFile
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+class MediaStorage(abc.ABC):
+    """Interface of the backends storing uploaded covers and books below the /media mount"""
+
+    def __init__(self, root: pathlib.Path):
+        self.root = root
+
+    @abc.abstractmethod
+    def key_for(self, file: UploadedFile) -> str:
+        """Returns the media relative path the file will be stored at"""
+
+    def path(self, key: str) -> pathlib.Path:
+        return self.root / key
+
+    @abc.abstractmethod
+    async def save(self, file: UploadedFile, key: str):
+        """Moves the uploaded temporary file to `key`"""
+
+    async def remove(self, key: str):
+        try:
+            await aiofiles.os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+
+class ContentAddressedStorage(MediaStorage):
+    """Stores files under their SHA-256 in a sharded `cas/ab/cd/<sha256><suffix>` layout.
+
+    Identical uploads share one file and the content of a key never changes, which is
+    what makes the immutable cache headers of `MediaStaticFiles` safe.
+    """
+    prefix = "cas"
+
+    def key_for(self, file: UploadedFile) -> str:
+        suffix = pathlib.Path(file.filename).suffix.lower()
+        return f"{self.prefix}/{file.sha256[:2]}/{file.sha256[2:4]}/{file.sha256}{suffix}"
+
+    async def save(self, file: UploadedFile, key: str):
+        path = self.path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(file.temp_path, path)
+
+
+class MediaStaticFiles(StaticFiles):
+    """The /media mount, content addressed files are served as immutable.
+
+    Images below cas/ can be requested resized with `?w=<width>` and re-encoded with
+    `&format=webp`, the variant comes from `cover_variants` and is generated on first use.
+    """
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        if "w" not in query or pathlib.PurePath(path).parts[:1] != (ContentAddressedStorage.prefix,):
+            return await super().get_response(path, scope)
+        if scope["method"] not in ("GET", "HEAD"):
+            raise HTTPException(status_code=405)
+        variant_format = query.get("format", [None])[0]
+        try:
+            width = int(query["w"][0])
+        except ValueError:
+            width = 0
+        if width <= 0 or (variant_format is not None and variant_format not in VARIANT_FORMATS):
+            raise HTTPException(status_code=400)
+        variant = await cover_variants.get(pathlib.PurePath(path).as_posix(), width, variant_format)
+        try:
+            stat_result = await anyio.to_thread.run_sync(os.stat, variant) if variant else None
+        except FileNotFoundError:
+            # Evicted by a concurrent sweep, the next request generates it again
+            stat_result = None
+        if stat_result is None:
+            return await super().get_response(path, scope)
+        return self.file_response(str(variant), stat_result, scope)
+
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200) -> Response:
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        if pathlib.PurePath(scope["path"]).parts[1:2] == (ContentAddressedStorage.prefix,):
+            response.headers["cache-control"] = IMMUTABLE_CACHE_CONTROL
+        return response
+
+
+media_storage = ContentAddressedStorage(cwd / "media")
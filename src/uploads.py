@@ -0,0 +1,136 @@
+import hashlib
+import pathlib
+import uuid
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import aiofiles
+import aiofiles.os
+import multipart
+from fastapi import HTTPException, Request, status
+from multipart.multipart import parse_options_header
+
+import settings
+
+
+class UploadTarget(NamedTuple):
+    directory: pathlib.Path
+    content_types: Tuple[str, ...]
+    unsupported_detail: str
+
+
+class UploadedFile(NamedTuple):
+    filename: str
+    content_type: str
+    temp_path: pathlib.Path
+    size: int
+    sha256: str
+
+
+class StreamingFormParser:
+    """Parses a multipart/form-data body chunk by chunk, straight from the socket.
+
+    File parts are written with async I/O to hidden temporary files inside their target
+    directory while size and SHA-256 are computed on the fly, so the body is never spooled
+    nor copied a second time. Move the temporary files into the media storage once the
+    request succeeded and call `discard` to remove whatever is left.
+    """
+
+    def __init__(self, request: Request, targets: Dict[str, UploadTarget], max_size: int = settings.MAX_UPLOAD_SIZE):
+        self.request = request
+        self.targets = targets
+        self.max_size = max_size
+        self.fields: Dict[str, str] = {}
+        self.files: Dict[str, UploadedFile] = {}
+        self._events: List[Tuple[str, bytes]] = []
+        self._open_paths: List[pathlib.Path] = []
+        self._part: Optional[dict] = None
+
+    def _callback(self, name: str):
+        def on_event(data: bytes = b"", start: int = 0, end: int = 0):
+            self._events.append((name, data[start:end]))
+
+        return on_event
+
+    async def parse(self) -> Tuple[Dict[str, str], Dict[str, UploadedFile]]:
+        content_length = int(self.request.headers.get("content-length") or 0)
+        if content_length > self.max_size:
+            raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="Upload is too large")
+        _, params = parse_options_header(self.request.headers.get("content-type", ""))
+        if b"boundary" not in params:
+            raise HTTPException(status_code=400, detail="Missing boundary in multipart")
+        callbacks = {f"on_{name}": self._callback(name) for name in
+                     ("part_begin", "part_data", "part_end", "header_field", "header_value", "header_end",
+                      "headers_finished", "end")}
+        parser = multipart.MultipartParser(params[b"boundary"], callbacks)
+        try:
+            await self._consume(parser)
+        except BaseException:
+            await self.discard()
+            raise
+        return self.fields, self.files
+
+    async def _consume(self, parser):
+        header_field = header_value = data = b""
+        headers: Dict[bytes, bytes] = {}
+        name, received = "", 0
+        async for chunk in self.request.stream():
+            parser.write(chunk)
+            events, self._events = self._events, []
+            for event, value in events:
+                if event == "part_begin":
+                    headers, data, self._part = {}, b"", None
+                elif event == "header_field":
+                    header_field += value
+                elif event == "header_value":
+                    header_value += value
+                elif event == "header_end":
+                    headers[header_field.lower()] = header_value
+                    header_field = header_value = b""
+                elif event == "headers_finished":
+                    _, options = parse_options_header(headers.get(b"content-disposition", b""))
+                    name = options.get(b"name", b"").decode()
+                    if options.get(b"filename") and name in self.targets:
+                        self._part = await self._open_part(name, options[b"filename"].decode(),
+                                                           headers.get(b"content-type", b"").decode("latin-1"))
+                elif event == "part_data":
+                    received += len(value)
+                    if received > self.max_size:
+                        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                                            detail="Upload is too large")
+                    if self._part is None:
+                        data += value
+                    else:
+                        await self._part["file"].write(value)
+                        self._part["hash"].update(value)
+                        self._part["size"] += len(value)
+                elif event == "part_end":
+                    if self._part is None:
+                        self.fields[name] = data.decode()
+                    else:
+                        part, self._part = self._part, None
+                        await part["file"].close()
+                        self.files[name] = UploadedFile(filename=part["filename"], content_type=part["content_type"],
+                                                        temp_path=part["path"], size=part["size"],
+                                                        sha256=part["hash"].hexdigest())
+        parser.finalize()
+
+    async def _open_part(self, name: str, filename: str, content_type: str) -> dict:
+        target = self.targets[name]
+        if content_type not in target.content_types:
+            raise HTTPException(status_code=418, detail=target.unsupported_detail)
+        target.directory.mkdir(parents=True, exist_ok=True)
+        path = target.directory / f".upload-{uuid.uuid4().hex}.part"
+        self._open_paths.append(path)
+        return {"file": await aiofiles.open(path, "wb"), "path": path, "hash": hashlib.sha256(), "size": 0,
+                "filename": pathlib.Path(filename).name, "content_type": content_type}
+
+    async def discard(self):
+        if self._part is not None:
+            await self._part["file"].close()
+            self._part = None
+        for path in self._open_paths:
+            try:
+                await aiofiles.os.remove(path)
+            except FileNotFoundError:
+                pass
+        self._open_paths.clear()
@@ -0,0 +1,61 @@
+import hashlib
+import uuid
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine
+
+import src.crud as crud
+import src.database as database
+from src.database import AsyncSessionLocal
+from src.storage import media_storage
+from src.uploads import UploadedFile
+from tests.sqlite import sqlite_metadata
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def db_engines(tmp_path, monkeypatch):
+    """SQLite engines in place of the MySQL ones, every session of the app binds to them"""
+    path = tmp_path / "library.db"
+    engines = {"sync": create_engine(f"sqlite:///{path}"),
+               "async": create_async_engine(f"sqlite+aiosqlite:///{path}")}
+    monkeypatch.setattr(database, "_engines", engines)
+    yield engines
+    engines["sync"].dispose()
+
+
+@pytest.fixture
+async def db(db_engines):
+    """Session on an SQLite copy of the whole schema"""
+    sqlite_metadata().create_all(db_engines["sync"])
+    async with AsyncSessionLocal() as session:
+        yield session
+    await db_engines["async"].dispose()
+
+
+@pytest.fixture
+def media_root(tmp_path, monkeypatch):
+    """Media storage below tmp_path instead of src/media"""
+    root = tmp_path / "media"
+    monkeypatch.setattr(media_storage, "root", root)
+    return root
+
+
+@pytest.fixture
+def store_media(db, media_root, tmp_path):
+    """Stores `content` like an upload of /book/add_form and returns its media key, uncommitted"""
+    async def store(content: bytes, filename: str) -> str:
+        temp_path = tmp_path / f"upload-{uuid.uuid4().hex}"
+        temp_path.write_bytes(content)
+        file = UploadedFile(filename, "application/octet-stream", temp_path, len(content),
+                            hashlib.sha256(content).hexdigest())
+        key = await crud.acquire_media(db, file)
+        await crud.save_file(file, key)
+        return key
+
+    return store
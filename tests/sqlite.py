@@ -0,0 +1,46 @@
+"""SQLite stand-ins for the MySQL schema, so the crud functions run against a file DB in the tests"""
+from sqlalchemy import BigInteger, Integer, MetaData, literal_column, text
+from sqlalchemy.dialects.mysql.dml import OnDuplicateClause
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql import elements, visitors
+
+import src.models  # noqa: F401, registers every table on Base.metadata
+from src.database import Base
+
+
+@compiles(OnDuplicateClause, "sqlite")
+def on_duplicate_key_update(on_duplicate, compiler, **kw):
+    """INSERT ... ON DUPLICATE KEY UPDATE of the MySQL dialect as an SQLite upsert"""
+    def replace(obj):
+        if isinstance(obj, elements.ColumnClause) and obj.table is on_duplicate.inserted_alias:
+            return literal_column(f"excluded.{compiler.preparer.quote(obj.name)}")
+        return None
+
+    clauses = []
+    for column in compiler.current_executable.table.c:
+        if column.key in on_duplicate.update:
+            value = visitors.replacement_traverse(on_duplicate.update[column.key], {}, replace)
+            clauses.append(f"{compiler.preparer.quote(column.name)} = {compiler.process(value.self_group(), **kw)}")
+    return "ON CONFLICT DO UPDATE SET " + ", ".join(clauses)
+
+
+def sqlite_metadata(*names: str) -> MetaData:
+    """Copies of the tables (all by default) with generic column types and SQLite server defaults"""
+    metadata = MetaData()
+    for table in Base.metadata.sorted_tables:
+        if names and table.name not in names:
+            continue
+        table = table.to_metadata(metadata)
+        for column in table.columns:
+            column.type = column.type.as_generic()
+            # Only an INTEGER PRIMARY KEY aliases the rowid and autoincrements
+            if column.primary_key and isinstance(column.type, BigInteger) and len(table.primary_key) == 1:
+                column.type = Integer()
+            default = getattr(column.server_default, "arg", None)
+            default = getattr(default, "text", default)
+            if isinstance(default, str) and "CURRENT_TIMESTAMP" in default:
+                column.server_default.arg = text("CURRENT_TIMESTAMP")
+            elif isinstance(default, str) and "CURRENT_DATE" in default:
+                column.server_default.arg = text("CURRENT_DATE")
+            column.server_onupdate = None
+    return metadata
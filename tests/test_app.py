@@ -0,0 +1,65 @@
+import pytest
+from starlette.testclient import TestClient
+
+import src.database as database
+import src.main as main
+import src.models as models
+import src.schemas as schemas
+import src.routers.internal as internal
+from src.database import SessionLocal
+from src.main import create_app
+from tests.sqlite import sqlite_metadata
+
+
+def test_routes_exist_without_the_lifespan(monkeypatch):
+    monkeypatch.setattr(database, "_engines", {})
+    app = create_app()
+    paths = {route.path for route in app.routes}
+    assert {"/media", "/admin", "/books/", "/token"} <= paths
+    assert app.url_path_for("media", path="cas/ab/cd/file.png") == "/media/cas/ab/cd/file.png"
+    assert TestClient(app).get("/").status_code == 200
+    # No engine, and so no DB driver, until a request needs one
+    assert database._engines == {}
+
+
+def test_admin_is_built_by_its_first_request(db_engines):
+    sqlite_metadata().create_all(db_engines["sync"])
+    with SessionLocal() as db:
+        db.add(models.User(username="root", email="root@example.com", hashed_password="-", otp_secret="-",
+                           disable=False, role=schemas.Role.admin))
+        db.commit()
+    app = create_app()
+    assert app.url_path_for("admin:index") == "/admin/"
+    response = TestClient(app).get("/admin/user/list")
+    assert response.status_code == 200
+    assert "root@example.com" in response.text
+    assert 'href="http://testserver/admin/statics/css/tabler.min.css"' in response.text
+
+
+def test_startup_fails_without_the_media_directory(db_engines, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with pytest.raises(RuntimeError, match="media"):
+        with TestClient(create_app()):
+            pass
+
+
+@pytest.mark.parametrize("query", ["skip=-1", "limit=0", "limit=-1", "limit=101"])
+def test_search_rejects_out_of_range_pages(db_engines, query):
+    response = TestClient(create_app()).get(f"/books/search?q=dune&{query}")
+    assert response.status_code == 422
+
+
+def test_prometheus_endpoint_is_off_without_a_token(db_engines, monkeypatch):
+    monkeypatch.setattr(main, "METRICS_TOKEN", "")
+    assert TestClient(create_app()).get("/metrics").status_code == 404
+
+
+def test_prometheus_endpoint_needs_the_token(db_engines, monkeypatch):
+    monkeypatch.setattr(main, "METRICS_TOKEN", "secret")
+    monkeypatch.setattr(internal, "METRICS_TOKEN", "secret")
+    client = TestClient(create_app())
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code == 401
+    response = client.get("/metrics", headers={"Authorization": "Bearer secret"})
+    assert response.status_code == 200
+    assert "# TYPE http_requests_total counter" in response.text
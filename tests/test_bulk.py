@@ -0,0 +1,141 @@
+import datetime
+import json
+
+import pytest
+from sqlalchemy import select
+
+import src.crud as crud
+import src.models as models
+from src.bulk import INVALID_UTF8, BulkImport, iter_lines, parse_csv, parse_ndjson
+
+pytestmark = pytest.mark.anyio
+
+
+async def chunks(*parts: bytes):
+    for part in parts:
+        yield part
+
+
+async def collect(records) -> list:
+    return [record async for record in records]
+
+
+async def test_iter_lines_joins_lines_split_across_chunks():
+    lines = await collect(iter_lines(chunks(b"first\r\nsec", b"ond\n\nthi", b"rd")))
+    assert lines == [(1, "first"), (2, "second"), (3, ""), (4, "third")]
+
+
+async def test_iter_lines_marks_invalid_utf8_lines():
+    lines = await collect(iter_lines(chunks("café\n".encode(), b"caf\xe9\nok\n")))
+    assert lines == [(1, "café"), (2, None), (3, "ok")]
+
+
+async def test_parse_ndjson():
+    records = await collect(parse_ndjson(iter_lines(chunks(b'{"name": "a"}\n\n{broken\n\xff\n'))))
+    assert records[0] == (1, {"name": "a"}, None)
+    assert records[1][0] == 3 and records[1][2].startswith("Invalid JSON")
+    assert records[2] == (4, None, INVALID_UTF8)
+
+
+async def test_parse_csv_keeps_quoted_newlines_in_one_record():
+    body = b'title,description\r\n"A","first line\r\nsecond, line"\r\nB,"say ""hi"""\r\n\r\nC,\r\n'
+    records = await collect(parse_csv(iter_lines(chunks(body[:20], body[20:]))))
+    assert records == [
+        (2, {"title": "A", "description": "first line\nsecond, line"}, None),
+        (4, {"title": "B", "description": 'say "hi"'}, None),
+        (6, {"title": "C"}, None),
+    ]
+
+
+async def test_parse_csv_rejects_bad_records_and_goes_on():
+    body = b'title,rating\nA,1,extra\n\xff,2\nB,2\nC,"unterminated\nD,4\n'
+    records = await collect(parse_csv(iter_lines(chunks(body))))
+    assert records == [
+        (2, None, "Expected 2 columns, got 3"),
+        (3, None, INVALID_UTF8),
+        (4, {"title": "B", "rating": "2"}, None),
+        (5, None, "Quoted field is not closed"),
+    ]
+
+
+async def test_parse_csv_stops_on_an_invalid_header():
+    records = await collect(parse_csv(iter_lines(chunks(b"t\xefitle\nA\n"))))
+    assert records == [(1, None, "The CSV header is not valid UTF-8")]
+
+
+async def import_books(db, *books: dict) -> dict:
+    records = chunks(*(json.dumps(book).encode() + b"\n" for book in books))
+    return await BulkImport(db, "books").run(parse_ndjson(iter_lines(records)))
+
+
+def book(**fields) -> dict:
+    return {"title": "Dune", "writer_id": 1, "publish_date": "1965-08-01", "rating": 5, "genres": "sci-fi",
+            **fields}
+
+
+async def refcounts(db) -> dict:
+    result = await db.execute(select(models.MediaFile.path, models.MediaFile.refcount))
+    return dict(result.all())
+
+
+@pytest.fixture
+async def writer(db):
+    db.add(models.Writer(id=1, name="Frank", lastname="Herbert", born=datetime.date(1920, 10, 8)))
+    await db.commit()
+
+
+async def test_upsert_moves_media_references_to_the_new_keys(db, writer, store_media, media_root):
+    cover, pdf, new_cover = (await store_media(b"cover", "a.png"), await store_media(b"pdf", "a.pdf"),
+                             await store_media(b"new cover", "b.png"))
+    await db.commit()
+    # Every stored file starts with the reference of its upload, the imported book adds one
+    report = await import_books(db, book(cover_file=cover, book_file=pdf))
+    assert report["accepted"] == 1
+    assert await refcounts(db) == {cover: 2, pdf: 2, new_cover: 1}
+
+    await crud.release_media(db, cover)
+    report = await import_books(db, book(cover_file=new_cover, book_file=pdf))
+    assert report["accepted"] == 1
+    assert await refcounts(db) == {pdf: 2, new_cover: 2}
+    assert not (media_root / cover).exists()
+    assert (media_root / new_cover).read_bytes() == b"new cover"
+    result = await db.execute(select(models.Book.cover_file))
+    assert result.scalars().all() == [new_cover]
+
+
+async def test_book_listed_twice_in_a_batch_keeps_its_last_keys(db, writer, store_media):
+    cover, other, pdf = (await store_media(b"cover", "a.png"), await store_media(b"other", "b.png"),
+                         await store_media(b"pdf", "a.pdf"))
+    await db.commit()
+    await import_books(db, book(cover_file=cover, book_file=pdf), book(cover_file=other, book_file=pdf))
+    assert await refcounts(db) == {cover: 1, other: 2, pdf: 2}
+
+
+async def test_rows_with_unknown_writers_or_media_are_rejected(db, writer, store_media):
+    pdf = await store_media(b"pdf", "a.pdf")
+    await db.commit()
+    report = await import_books(db, book(cover_file="cas/missing.png", book_file=pdf),
+                                book(writer_id=2, cover_file=pdf, book_file=pdf))
+    assert report["accepted"] == 0
+    assert [error["errors"] for error in report["errors"]] == [["Media file cas/missing.png not found"],
+                                                               ["Writer 2 not found"]]
+    assert await refcounts(db) == {pdf: 1}
+
+
+async def genre_counts(db) -> dict:
+    result = await db.execute(select(models.Genre.name, models.Genre.book_count))
+    return dict(result.all())
+
+
+async def test_upsert_moves_the_genre_counts(db, writer, store_media):
+    pdf = await store_media(b"pdf", "a.pdf")
+    await db.commit()
+    await import_books(db, book(cover_file=pdf, book_file=pdf, genres="sci-fi, drama"),
+                       book(title="Dune Messiah", cover_file=pdf, book_file=pdf))
+    assert await genre_counts(db) == {"sci-fi": 2, "drama": 1}
+
+    # Same title and writer, the row is replaced
+    report = await import_books(db, book(cover_file=pdf, book_file=pdf, genres="sci-fi, politics"))
+    assert report["accepted"] == 1
+    assert await genre_counts(db) == {"sci-fi": 2, "drama": 0, "politics": 1}
+    assert [tuple(facet) for facet in await crud.get_genre_facets(db)] == [("sci-fi", 2), ("politics", 1)]
@@ -0,0 +1,52 @@
+import pytest
+
+import src.cache as cache
+from src.cache import TTLCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    class Clock:
+        now = 1000.0
+
+    monkeypatch.setattr(cache.time, "monotonic", lambda: Clock.now)
+    return Clock
+
+
+def test_entries_expire_after_their_ttl(clock):
+    users = TTLCache("test", maxsize=10, ttl=60)
+    users.set("a", 1)
+    users.set("b", 2, ttl=5)
+    clock.now += 5
+    assert users.get("a") == 1
+    assert users.get("b") is None
+    clock.now += 55
+    assert users.get("a", "missing") == "missing"
+    assert len(users) == 0
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    users = TTLCache("test", maxsize=2, ttl=60)
+    users.set("a", 1)
+    users.set("b", 2)
+    users.get("a")
+    users.set("c", 3)
+    assert users.get("b") is None
+    assert users.get("a") == 1
+    assert users.get("c") == 3
+
+
+def test_pop_and_clear(clock):
+    users = TTLCache("test", maxsize=10, ttl=60)
+    users.set("a", 1)
+    users.set("b", 2)
+    assert users.pop("a") == 1
+    assert users.pop("a", "missing") == "missing"
+    users.clear()
+    assert users.get("b") is None
+
+
+def test_zero_maxsize_disables_the_cache(clock):
+    users = TTLCache("test", maxsize=0, ttl=60)
+    users.set("a", 1)
+    assert users.get("a") is None
@@ -0,0 +1,105 @@
+import io
+
+import aiosmtplib
+import pytest
+from fastapi_mail import ConnectionConfig, MessageSchema, MessageType
+from jinja2 import Template
+from starlette.datastructures import UploadFile
+
+from src.internal.email import PooledMail, build_message
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeSession:
+    def __init__(self, error: Exception = None):
+        self.error = error
+        self.is_connected = True
+        self.sent = []
+
+    async def send_message(self, msg):
+        if self.error is not None:
+            error, self.error = self.error, None
+            if isinstance(error, aiosmtplib.SMTPServerDisconnected):
+                self.is_connected = False
+            raise error
+        self.sent.append(msg)
+
+    def close(self):
+        self.is_connected = False
+
+    async def quit(self):
+        self.is_connected = False
+
+
+@pytest.fixture
+def mailer(monkeypatch):
+    config = ConnectionConfig(MAIL_USERNAME="", MAIL_PASSWORD="", MAIL_FROM="library@example.com",
+                              MAIL_FROM_NAME="Library", MAIL_PORT=25, MAIL_SERVER="localhost",
+                              MAIL_STARTTLS=False, MAIL_SSL_TLS=False)
+    mailer = PooledMail(config, pool_size=2)
+    mailer.opened = []
+    mailer.first_error = None
+
+    async def connect():
+        # Only the first connection fails its first message
+        session = FakeSession(None if mailer.opened else mailer.first_error)
+        mailer.opened.append(session)
+        return session
+
+    monkeypatch.setattr(mailer, "_connect", connect)
+    return mailer
+
+
+def message(**kwargs) -> MessageSchema:
+    return MessageSchema(subject="Hi", recipients=["reader@example.com"], body="Hello",
+                         subtype=MessageType.plain, **kwargs)
+
+
+async def test_build_message_renders_the_template_and_attaches_files():
+    attachment = {"file": UploadFile("qr.png", io.BytesIO(b"png")), "mime_type": "image", "mime_subtype": "png",
+                  "headers": {"Content-ID": "<qr>"}}
+    msg = await build_message(message(template_body={"name": "Ann"}, attachments=[attachment], cc=["c@example.com"]),
+                              "Library <library@example.com>", Template("<p>{{ name }}</p>"))
+    assert msg["From"] == "Library <library@example.com>"
+    assert msg["To"] == "reader@example.com"
+    assert msg["Cc"] == "c@example.com"
+    text, image = msg.get_payload()
+    assert text.get_content_type() == "text/html"
+    assert text.get_payload(decode=True) == b"<p>Ann</p>"
+    assert image.get_content_type() == "image/png"
+    assert image["Content-ID"] == "<qr>"
+    assert image.get_filename() == "qr.png"
+    assert image.get_payload(decode=True) == b"png"
+
+
+async def test_sessions_are_reused(mailer):
+    await mailer.send_message(message())
+    await mailer.send_message(message())
+    assert len(mailer.opened) == 1
+    assert len(mailer.opened[0].sent) == 2
+    assert mailer._idle == mailer.opened
+
+
+async def test_dropped_session_is_replaced(mailer):
+    mailer.first_error = aiosmtplib.SMTPServerDisconnected("gone")
+    await mailer.send_message(message())
+    assert len(mailer.opened) == 2
+    assert mailer._idle == [mailer.opened[1]]
+
+
+async def test_session_survives_refused_recipients(mailer):
+    mailer.first_error = aiosmtplib.SMTPRecipientsRefused([])
+    with pytest.raises(aiosmtplib.SMTPRecipientsRefused):
+        await mailer.send_message(message())
+    assert mailer._idle == mailer.opened
+    await mailer.send_message(message())
+    assert len(mailer.opened) == 1
+
+
+async def test_session_is_closed_on_other_errors(mailer):
+    mailer.first_error = aiosmtplib.SMTPTimeoutError("slow")
+    with pytest.raises(aiosmtplib.SMTPTimeoutError):
+        await mailer.send_message(message())
+    assert mailer._idle == []
+    assert not mailer.opened[0].is_connected
@@ -0,0 +1,81 @@
+import datetime
+
+import pytest
+from sqlalchemy import select
+
+import src.crud as crud
+import src.models as models
+import src.schemas as schemas
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.mark.parametrize("genres, names", [
+    ("Fantasy, drama", ["fantasy", "drama"]),
+    (" Science   Fiction ,,FANTASY, fantasy", ["science fiction", "fantasy"]),
+    ("", []),
+    (None, []),
+])
+def test_parse_genres(genres, names):
+    assert crud.parse_genres(genres) == names
+
+
+@pytest.fixture
+async def writer(db):
+    db.add(models.Writer(id=1, name="Frank", lastname="Herbert", born=datetime.date(1920, 10, 8)))
+    await db.commit()
+
+
+async def add_book(db, title: str, genres: str) -> models.Book:
+    return await crud.add_book(db, schemas.BookCreate(title=title, writer_id=1, publish_date=datetime.date(1965, 8, 1),
+                                                      rating=5, genres=genres, cover_file="", book_file=""))
+
+
+async def book_counts(db) -> dict:
+    result = await db.execute(select(models.Genre.name, models.Genre.book_count))
+    return dict(result.all())
+
+
+async def linked_genres(db, book_id: int) -> list:
+    result = await db.execute(select(models.Genre.name)
+                              .join(models.book_genres, models.book_genres.c.genre_id == models.Genre.id)
+                              .filter(models.book_genres.c.book_id == book_id)
+                              .order_by(models.Genre.name))
+    return result.scalars().all()
+
+
+async def test_added_books_count_in_their_genres(db, writer):
+    dune = await add_book(db, "Dune", "Sci-Fi, Drama")
+    await add_book(db, "Dune Messiah", "sci-fi")
+
+    assert await linked_genres(db, dune.id) == ["drama", "sci-fi"]
+    assert await book_counts(db) == {"sci-fi": 2, "drama": 1}
+    assert [tuple(facet) for facet in await crud.get_genre_facets(db)] == [("sci-fi", 2), ("drama", 1)]
+
+
+async def test_relinking_moves_the_counts(db, writer):
+    dune = await add_book(db, "Dune", "sci-fi, drama")
+    await add_book(db, "Dune Messiah", "sci-fi")
+
+    await crud.link_book_genres(db, {dune.id: "sci-fi, politics"})
+    await db.commit()
+    assert await linked_genres(db, dune.id) == ["politics", "sci-fi"]
+    assert await book_counts(db) == {"sci-fi": 2, "drama": 0, "politics": 1}
+
+
+async def test_genre_drops_to_zero_on_delete(db, writer):
+    dune = await add_book(db, "Dune", "sci-fi, drama")
+    await add_book(db, "Dune Messiah", "sci-fi")
+
+    await crud.delete_book_by_id(db, dune)
+    assert await linked_genres(db, dune.id) == []
+    assert await book_counts(db) == {"sci-fi": 1, "drama": 0}
+    # Genres left without books are kept, but no longer offered as a facet
+    assert [tuple(facet) for facet in await crud.get_genre_facets(db)] == [("sci-fi", 1)]
+
+
+async def test_unlinking_books_without_genres_changes_nothing(db, writer):
+    dune = await add_book(db, "Dune", "")
+    await crud.unlink_book_genres(db, [dune.id, 999])
+    await db.commit()
+    assert await book_counts(db) == {}
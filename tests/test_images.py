@@ -0,0 +1,63 @@
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+from PIL import Image
+
+from src.images import CoverVariants
+
+pytestmark = pytest.mark.anyio
+
+KEY = "cas/ab/cd/cover.png"
+
+
+@pytest.fixture
+def covers(tmp_path):
+    source = tmp_path / "media" / KEY
+    source.parent.mkdir(parents=True)
+    Image.new("RGB", (800, 1200), "red").save(source)
+    variants = CoverVariants(tmp_path / "media", tmp_path / "cache", widths=(160, 320), max_bytes=10 ** 9,
+                             workers=1)
+    # Threads instead of processes, so the tests can change Pillow settings
+    variants._executor = ThreadPoolExecutor(max_workers=1)
+    yield variants
+    if variants._executor is not None:
+        variants._executor.shutdown()
+
+
+async def test_variant_is_generated_once_then_served_from_the_cache(covers):
+    variant = await covers.get(KEY, 200)
+    assert variant == covers.path(KEY, 320)
+    with Image.open(variant) as image:
+        assert image.size == (320, 480)
+    mtime = variant.stat().st_mtime_ns
+    variant.touch()
+    assert await covers.get(KEY, 320) == variant
+    assert variant.stat().st_mtime_ns >= mtime
+
+
+async def test_webp_variant(covers):
+    variant = await covers.get(KEY, 160, "webp")
+    with Image.open(variant) as image:
+        assert (image.format, image.width) == ("WEBP", 160)
+
+
+async def test_missing_and_non_image_originals_have_no_variant(covers):
+    assert await covers.get("cas/00/00/missing.png", 160) is None
+    assert await covers.get("cas/00/00/book.pdf", 160) is None
+
+
+async def test_decompression_bomb_falls_back_to_the_original(covers, monkeypatch):
+    monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", 1000)
+    assert await covers.get(KEY, 160) is None
+
+
+async def test_broken_pool_falls_back_to_the_original_and_is_replaced(covers):
+    class BrokenPool(ThreadPoolExecutor):
+        def submit(self, *args, **kwargs):
+            raise BrokenProcessPool("A child process terminated abruptly")
+
+    covers._executor.shutdown()
+    covers._executor = BrokenPool()
+    assert await covers.get(KEY, 160) is None
+    assert covers._executor is None
@@ -0,0 +1,84 @@
+import datetime
+
+import httpx
+import pytest
+from sqlalchemy import select
+
+import src.crud as crud
+import src.models as models
+from src.internal.roles import allow_create_and_delete_resource
+from src.main import create_app
+from src.response_cache import response_cache
+
+pytestmark = pytest.mark.anyio
+
+
+async def refcounts(db) -> dict:
+    result = await db.execute(select(models.MediaFile.path, models.MediaFile.refcount))
+    return dict(result.all())
+
+
+async def test_duplicate_upload_adds_a_reference_to_one_file(db, store_media, media_root):
+    key = await store_media(b"cover", "a.png")
+    await db.commit()
+    assert await store_media(b"cover", "b.PNG") == key
+    await db.commit()
+
+    assert await refcounts(db) == {key: 2}
+    assert [path for path in media_root.rglob("*") if path.is_file()] == [media_root / key]
+    assert (media_root / key).read_bytes() == b"cover"
+
+
+async def test_release_keeps_the_file_until_the_last_reference(db, store_media, media_root):
+    key = await store_media(b"cover", "a.png")
+    other = await store_media(b"other", "b.png")
+    await store_media(b"cover", "a.png")
+    await db.commit()
+
+    await crud.release_media(db, key)
+    assert await refcounts(db) == {key: 1, other: 1}
+    assert (media_root / key).exists()
+
+    await crud.release_media(db, key)
+    assert await refcounts(db) == {other: 1}
+    assert not (media_root / key).exists()
+    assert (media_root / other).exists()
+
+
+async def test_releasing_an_unknown_key_changes_nothing(db, store_media, media_root):
+    key = await store_media(b"cover", "a.png")
+    await db.commit()
+
+    await crud.release_media(db, "cas/00/00/missing.png")
+    assert await refcounts(db) == {key: 1}
+
+
+async def test_upload_after_the_last_release_stores_a_fresh_copy(db, store_media, media_root):
+    key = await store_media(b"cover", "a.png")
+    await db.commit()
+    await crud.release_media(db, key)
+
+    assert await store_media(b"cover", "a.png") == key
+    await db.commit()
+    assert await refcounts(db) == {key: 1}
+    assert (media_root / key).read_bytes() == b"cover"
+
+
+async def test_deleted_book_releases_its_media(db, store_media, media_root, monkeypatch):
+    cover, pdf = await store_media(b"cover", "a.png"), await store_media(b"pdf", "a.pdf")
+    # A second book shares the cover
+    await store_media(b"cover", "a.png")
+    db.add(models.Writer(id=1, name="Frank", lastname="Herbert", born=datetime.date(1920, 10, 8)))
+    db.add(models.Book(id=1, title="Dune", writer_id=1, publish_date=datetime.date(1965, 8, 1), rating=5,
+                       genres="", cover_file=cover, book_file=pdf))
+    await db.commit()
+    monkeypatch.setattr(response_cache, "backend", None)
+    app = create_app()
+    app.dependency_overrides[allow_create_and_delete_resource] = lambda: None
+
+    async with httpx.AsyncClient(app=app, base_url="http://testserver") as client:
+        response = await client.delete("/book/1")
+    assert response.status_code == 200, response.text
+    assert await refcounts(db) == {cover: 1}
+    assert (media_root / cover).exists()
+    assert not (media_root / pdf).exists()
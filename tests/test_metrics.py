@@ -0,0 +1,94 @@
+import json
+import math
+import os
+import subprocess
+
+from src.metrics import Counter, Gauge, Histogram, Registry, SharedRegistry, escape_label, format_value
+
+
+def test_histogram_buckets_are_cumulative_with_inclusive_upper_bounds():
+    latency = Histogram("latency_seconds", "Latency", ["route"], buckets=(1, 0.1, 0.5))
+    for value in (0.05, 0.1, 0.3, 0.5, 0.7, 2):
+        latency.observe(value, route="/books")
+
+    (key, state), = latency.items()
+    assert key == ("/books",)
+    assert latency.buckets == (0.1, 0.5, 1)
+    assert state["buckets"] == [2, 4, 5]
+    assert state["count"] == 6
+    assert math.isclose(state["sum"], 3.65)
+
+
+def test_histogram_samples_end_with_inf_sum_and_count():
+    latency = Histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+    latency.observe(0.5)
+    assert list(latency.samples()) == [
+        ("latency_seconds_bucket", {"le": "0.1"}, 0),
+        ("latency_seconds_bucket", {"le": "1.0"}, 1),
+        ("latency_seconds_bucket", {"le": "+Inf"}, 1),
+        ("latency_seconds_sum", {}, 0.5),
+        ("latency_seconds_count", {}, 1),
+    ]
+
+
+def test_histogram_snapshot():
+    latency = Histogram("latency_seconds", "Latency", ["route"], buckets=(1.0,))
+    latency.observe(0.5, route="/")
+    latency.observe(1.5, route="/")
+    assert latency.snapshot() == {"route=/": {"buckets": {1.0: 1}, "sum": 2.0, "count": 2, "mean": 1.0}}
+
+
+def test_exposition_text_format():
+    registry = Registry()
+    requests = registry.get_or_create(Counter, "requests_total", "Finished requests\nper route", ["route"])
+    registry.get_or_create(Histogram, "size_bytes", "Sizes", buckets=(10,)).observe(3)
+    requests.inc(route='/say "hi"\\')
+    assert registry.get_or_create(Counter, "requests_total", "ignored") is requests
+
+    assert registry.exposition() == (
+        "# HELP requests_total Finished requests\\nper route\n"
+        "# TYPE requests_total counter\n"
+        'requests_total{route="/say \\"hi\\"\\\\"} 1\n'
+        "# HELP size_bytes Sizes\n"
+        "# TYPE size_bytes histogram\n"
+        'size_bytes_bucket{le="10"} 1\n'
+        'size_bytes_bucket{le="+Inf"} 1\n'
+        "size_bytes_sum 3.0\n"
+        "size_bytes_count 1\n"
+    )
+
+
+def test_format_value():
+    assert format_value(3) == "3"
+    assert format_value(0.25) == "0.25"
+    assert format_value(math.inf) == "+Inf"
+    assert format_value(-math.inf) == "-Inf"
+    assert format_value(math.nan) == "NaN"
+
+
+def test_escape_label():
+    assert escape_label('a\\b"c\nd') == 'a\\\\b\\"c\\nd'
+
+
+def worker_registry(requests: int, in_flight: int, latency: float) -> Registry:
+    registry = Registry()
+    registry.get_or_create(Counter, "requests_total", "Requests", ["route"]).inc(requests, route="/")
+    registry.get_or_create(Gauge, "in_flight", "In flight").set(in_flight)
+    registry.get_or_create(Histogram, "latency_seconds", "Latency", buckets=(1.0,)).observe(latency)
+    return registry
+
+
+def test_shared_registry_merges_the_workers(tmp_path):
+    exited = subprocess.Popen(["true"])
+    exited.wait()
+    (tmp_path / f"{exited.pid}.json").write_text(json.dumps(worker_registry(5, 7, 2.0).dump()))
+    shared = SharedRegistry(worker_registry(3, 1, 0.5), str(tmp_path))
+
+    text = shared.exposition()
+    assert (tmp_path / f"{os.getpid()}.json").exists()
+    # Counters of the exited worker still count, its gauges are gone
+    assert 'requests_total{route="/"} 8' in text
+    assert "in_flight 1" in text
+    assert 'latency_seconds_bucket{le="1.0"} 1' in text
+    assert "latency_seconds_count 2" in text
+    assert "latency_seconds_sum 2.5" in text
@@ -0,0 +1,28 @@
+import pytest
+from fastapi import HTTPException
+
+from src.schemas import decode_cursor, encode_cursor, next_cursor
+
+
+@pytest.mark.parametrize("last_id", [0, 1, 42, 2 ** 40])
+def test_cursor_round_trip(last_id):
+    cursor = encode_cursor(last_id)
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == last_id
+
+
+@pytest.mark.parametrize("cursor", ["", "not a cursor", "e30", encode_cursor(1)[:-2] + "!!", "WyJpZCJd"])
+def test_invalid_cursor_is_a_400(cursor):
+    with pytest.raises(HTTPException) as error:
+        decode_cursor(cursor)
+    assert error.value.status_code == 400
+
+
+def test_next_cursor_points_after_the_last_item_of_a_full_page():
+    class Row:
+        def __init__(self, id):
+            self.id = id
+
+    assert decode_cursor(next_cursor([Row(3), Row(7)], limit=2)) == 7
+    assert next_cursor([Row(3)], limit=2) is None
+    assert next_cursor([], limit=2) is None
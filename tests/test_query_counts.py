@@ -0,0 +1,87 @@
+"""Statements per request of the read endpoints, counted by the metrics middleware.
+
+Every endpoint has a budget that must hold for any page size, so a lazy load sneaking
+into a loop (N+1) fails. The endpoints run against an SQLite copy of the tables they read;
+full-text search needs MySQL and is left out.
+"""
+import datetime
+
+import httpx
+import pytest
+from sqlalchemy import insert
+
+import src.models as models
+from src.database import dispose_engines
+from src.main import create_app
+from src.middleware import request_queries
+from src.response_cache import response_cache
+from tests.sqlite import sqlite_metadata
+
+pytestmark = pytest.mark.anyio
+
+READ_TABLES = ("writers", "books", "genres", "book_genres")
+BOOKS = 30
+
+# (path, statements allowed), filled with the page size and the first book and writer
+BUDGETS = (
+    ("/books/?limit={limit}", 1),
+    ("/books/?limit={limit}&expand=writer", 1),
+    ("/books/?limit={limit}&genre=fantasy&expand=writer", 1),
+    ("/books/genres", 1),
+    ("/book/1/info", 1),
+    ("/book/1/info?expand=writer", 1),
+    ("/writer/1/info", 1),
+    ("/writer/1/books?limit={limit}", 2),
+    ("/writers/?limit={limit}", 1),
+)
+
+
+def seed(db_engine):
+    sqlite_metadata(*READ_TABLES).create_all(db_engine)
+    now = datetime.datetime(2020, 1, 1)
+    with db_engine.begin() as connection:
+        connection.execute(insert(models.Writer), [
+            {"id": i, "name": f"Name {i}", "lastname": f"Lastname {i}", "born": datetime.date(1900, 1, 1),
+             "created_at": now, "updated_at": now} for i in range(1, 4)])
+        connection.execute(insert(models.Book), [
+            {"id": i, "title": f"Book {i}", "writer_id": i % 3 + 1, "publish_date": datetime.date(2000, 1, 1),
+             "rating": 3, "genres": "fantasy, drama", "cover_file": f"cas/{i}.png", "book_file": f"cas/{i}.pdf",
+             "created_at": now, "updated_at": now}
+            for i in range(1, BOOKS + 1)])
+        connection.execute(insert(models.Genre), [
+            {"id": 1, "name": "fantasy", "book_count": BOOKS, "created_at": now, "updated_at": now},
+            {"id": 2, "name": "drama", "book_count": BOOKS, "created_at": now, "updated_at": now}])
+        connection.execute(insert(models.book_genres), [
+            {"book_id": book_id, "genre_id": genre_id} for book_id in range(1, BOOKS + 1) for genre_id in (1, 2)])
+
+
+@pytest.fixture
+async def client(db_engines, monkeypatch):
+    seed(db_engines["sync"])
+    monkeypatch.setattr(response_cache, "backend", None)
+    async with httpx.AsyncClient(app=create_app(), base_url="http://testserver") as client:
+        yield client
+    await dispose_engines()
+
+
+def statements_counted() -> int:
+    return sum(state["sum"] for _, state in request_queries.items())
+
+
+@pytest.mark.parametrize("template, budget", BUDGETS)
+async def test_statements_per_request_stay_within_budget(client, template, budget):
+    for limit in (1, 10, BOOKS):
+        before = statements_counted()
+        response = await client.get(template.format(limit=limit))
+        assert response.status_code == 200, response.text
+        # Never 0, that would mean REQUEST_METRICS is off and nothing was counted
+        assert 0 < statements_counted() - before <= budget, template.format(limit=limit)
+        if "{limit}" not in template:
+            break
+
+
+async def test_pages_are_filled(client):
+    response = await client.get(f"/books/?limit={BOOKS}&expand=writer&genre=fantasy")
+    books = response.json()
+    assert len(books) == BOOKS
+    assert all(book["writer"]["id"] == book["writer_id"] for book in books)
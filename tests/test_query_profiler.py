@@ -0,0 +1,66 @@
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from src.query_profiler import OUTSIDE_REQUEST, QueryProfiler, normalize
+
+
+@pytest.mark.parametrize("statement, normalized", [
+    ("SELECT *\n  FROM books\tWHERE id = ?", "SELECT * FROM books WHERE id = ?"),
+    ("SELECT * FROM books WHERE id IN (?, ?, ?)", "SELECT * FROM books WHERE id IN (...)"),
+    ("SELECT * FROM books WHERE id IN (%s,%s)", "SELECT * FROM books WHERE id IN (...)"),
+    ("SELECT * FROM books WHERE id IN (%(id_1_1)s, %(id_1_2)s)", "SELECT * FROM books WHERE id IN (...)"),
+    # A single placeholder in parentheses is not an expanded list
+    ("SELECT * FROM books WHERE id IN (?)", "SELECT * FROM books WHERE id IN (?)"),
+    ("INSERT INTO genres (name, slug) VALUES ('a', 'b')", "INSERT INTO genres (name, slug) VALUES ('a', 'b')"),
+])
+def test_normalize(statement, normalized):
+    assert normalize(statement) == normalized
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine("sqlite://")
+    yield engine
+    engine.dispose()
+
+
+def test_statements_are_aggregated_by_their_normalized_text(engine):
+    profiler = QueryProfiler(slow_ms=10_000, explain=False, max_statements=10)
+    profiler.instrument(engine)
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1 WHERE 1 IN (1, 2)"))
+        conn.execute(text("SELECT 1  WHERE 1 IN (1, 2)"))
+
+    report = profiler.report()
+    # Literal values are not placeholders, only the whitespace differs
+    assert report["statements"] == 1
+    (top,) = report["top"]
+    assert top["count"] == 2
+    assert top["routes"] == {OUTSIDE_REQUEST: 2}
+    assert top["slow"] == 0
+
+
+def test_failing_statement_leaves_no_state_behind(engine):
+    profiler = QueryProfiler(slow_ms=10_000, explain=False, max_statements=10)
+    profiler.instrument(engine)
+    with engine.connect() as conn:
+        for _ in range(3):
+            with pytest.raises(OperationalError):
+                conn.execute(text("SELECT * FROM missing"))
+        conn.execute(text("SELECT 1"))
+        assert not any(key.startswith("profiler") for key in conn.info)
+
+    assert [top["statement"] for top in profiler.report()["top"]] == ["SELECT 1"]
+
+
+def test_statements_over_the_limit_are_dropped(engine):
+    profiler = QueryProfiler(slow_ms=0, explain=False, max_statements=1)
+    profiler.instrument(engine)
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+        conn.execute(text("SELECT 2"))
+
+    report = profiler.report()
+    assert report["dropped"] == 1
+    assert report["top"][0]["slow"] == 1
@@ -0,0 +1,107 @@
+import pytest
+from fastapi import HTTPException
+
+import src.rate_limit as rate_limit
+from src.rate_limit import Limit, MemoryBackend, RateLimiter, retry_after, sliding_count
+
+pytestmark = pytest.mark.anyio
+
+LIMIT = Limit("test", limit=5, window=60)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Frozen time.time for the limiter, assign `clock.now` to move it"""
+
+    class Clock:
+        now = 6000.0
+
+    monkeypatch.setattr(rate_limit.time, "time", lambda: Clock.now)
+    return Clock
+
+
+def test_limit_parse():
+    assert Limit.parse("login", "30/60") == Limit("login", 30, 60)
+
+
+def test_sliding_count_weights_previous_window_by_the_part_still_inside():
+    assert sliding_count(previous=10, current=3, elapsed=0, window=60) == 13
+    assert sliding_count(previous=10, current=3, elapsed=30, window=60) == 8
+    assert sliding_count(previous=10, current=3, elapsed=60, window=60) == 3
+
+
+@pytest.mark.parametrize("previous, current, elapsed", [(0, 5, 10), (0, 7, 59), (10, 2, 30), (5, 4, 0), (4, 0, 50)])
+def test_retry_after_is_the_first_second_one_more_request_fits(previous, current, elapsed):
+    wait = retry_after(previous, current, elapsed, LIMIT)
+
+    def fits(after: float) -> bool:
+        moment = elapsed + after
+        if moment >= LIMIT.window:
+            # The current window has become the previous one
+            return sliding_count(current, 0, moment - LIMIT.window, LIMIT.window) + 1 <= LIMIT.limit
+        return sliding_count(previous, current, moment, LIMIT.window) + 1 <= LIMIT.limit
+
+    assert wait >= 1
+    assert fits(wait)
+    assert wait == 1 or not fits(wait - 1)
+
+
+async def test_memory_backend_rolls_windows_over():
+    backend = MemoryBackend(maxsize=10)
+    for _ in range(3):
+        await backend.add("key", 100, 60)
+    assert await backend.counts("key", 100) == (0, 3)
+    # The next window sees them as the previous one, the one after that not at all
+    assert await backend.counts("key", 101) == (3, 0)
+    assert await backend.counts("key", 102) == (0, 0)
+    await backend.add("key", 101, 60)
+    assert await backend.counts("key", 101) == (3, 1)
+    await backend.add("key", 105, 60)
+    assert await backend.counts("key", 105) == (0, 1)
+
+
+async def test_memory_backend_drops_least_recently_seen_keys():
+    backend = MemoryBackend(maxsize=2)
+    await backend.add("a", 1, 60)
+    await backend.add("b", 1, 60)
+    await backend.add("a", 1, 60)
+    await backend.add("c", 1, 60)
+    assert await backend.counts("b", 1) == (0, 0)
+    assert await backend.counts("a", 1) == (0, 2)
+    assert await backend.counts("c", 1) == (0, 1)
+
+
+async def test_limiter_rejects_over_the_limit_with_retry_after(clock):
+    limiter = RateLimiter(MemoryBackend(maxsize=10))
+    for _ in range(LIMIT.limit):
+        await limiter.acquire(LIMIT, "client")
+    with pytest.raises(HTTPException) as error:
+        await limiter.acquire(LIMIT, "client")
+    assert error.value.status_code == 429
+    assert int(error.value.headers["Retry-After"]) >= 1
+    # Other keys are counted on their own
+    await limiter.acquire(LIMIT, "other")
+
+
+async def test_limiter_lets_the_client_through_again_after_retry_after(clock):
+    limiter = RateLimiter(MemoryBackend(maxsize=10))
+    for _ in range(LIMIT.limit):
+        await limiter.acquire(LIMIT, "client")
+    with pytest.raises(HTTPException) as error:
+        await limiter.check(LIMIT, "client")
+    clock.now += int(error.value.headers["Retry-After"])
+    await limiter.check(LIMIT, "client")
+
+
+async def test_limiter_reset_forgets_the_key(clock):
+    limiter = RateLimiter(MemoryBackend(maxsize=10))
+    for _ in range(LIMIT.limit):
+        await limiter.acquire(LIMIT, "client")
+    await limiter.reset(LIMIT, "client")
+    await limiter.acquire(LIMIT, "client")
+
+
+async def test_limiter_without_backend_allows_everything():
+    limiter = RateLimiter()
+    for _ in range(LIMIT.limit * 2):
+        await limiter.acquire(LIMIT, "client")
@@ -0,0 +1,59 @@
+import pytest
+from starlette.requests import Request
+
+from src.response_cache import CachedResponse, MemoryBackend, ResponseCache, etag_matches, response_cache
+from src.server import disable_worker_local_cache
+
+ETAG = '"5d41402abc4b2a76b9719d911017c592"'
+
+
+@pytest.mark.parametrize("header", [
+    ETAG,
+    f"W/{ETAG}",
+    f'"other", {ETAG}',
+    f'"other",W/{ETAG} , "third"',
+    "*",
+    " * ",
+])
+def test_if_none_match_matches(header):
+    assert etag_matches(header, ETAG)
+
+
+@pytest.mark.parametrize("header", [None, "", '"other"', '"other", W/"different"', ETAG[1:-1], '"a,b"'])
+def test_if_none_match_misses(header):
+    assert not etag_matches(header, ETAG)
+
+
+def test_weak_etag_of_the_response_matches_its_strong_form():
+    assert etag_matches(ETAG, f"W/{ETAG}")
+
+
+def test_cached_response_round_trip():
+    cached = CachedResponse(body=b'{"a":\n1}', etag=ETAG, headers={"X-Next-Cursor": "abc"})
+    assert CachedResponse.loads(cached.dumps()) == cached
+
+
+def books_request() -> Request:
+    return Request({"type": "http", "method": "GET", "scheme": "http", "server": ("testserver", 80),
+                    "path": "/books/", "query_string": b"", "headers": []})
+
+
+@pytest.mark.anyio
+async def test_memory_backend_invalidation_stays_in_its_process():
+    # Two workers, each with its own memory backend
+    first, second = (ResponseCache(MemoryBackend(maxsize=10, ttl=60)) for _ in range(2))
+    for cache in (first, second):
+        await (await cache.lookup("books", books_request())).store([{"title": "Dune"}])
+
+    await first.invalidate("books")
+    assert (await first.lookup("books", books_request())).response is None
+    assert (await second.lookup("books", books_request())).response is not None
+
+
+def test_server_turns_the_memory_cache_off_with_several_workers(monkeypatch):
+    backend = MemoryBackend(maxsize=10, ttl=60)
+    monkeypatch.setattr(response_cache, "backend", backend)
+    disable_worker_local_cache(1)
+    assert response_cache.backend is backend
+    disable_worker_local_cache(2)
+    assert response_cache.backend is None
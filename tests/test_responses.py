@@ -0,0 +1,98 @@
+import os
+
+import pytest
+from starlette.applications import Starlette
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from src.responses import RangeFileResponse, file_etag, parse_range
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-99", (0, 99)),
+    ("bytes=100-", (100, 999)),
+    ("bytes=-100", (900, 999)),
+    ("bytes=-5000", (0, 999)),
+    ("bytes=990-5000", (990, 999)),
+    ("bytes = 5 - 9", (5, 9)),
+    ("bytes=-", None),
+    ("bytes=0-1,5-9", None),
+    ("items=0-9", None),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=1000-", "bytes=5-4", "bytes=-0"])
+def test_unsatisfiable_range(header):
+    with pytest.raises(ValueError):
+        parse_range(header, 1000)
+
+
+@pytest.mark.parametrize("header", ["bytes=0-", "bytes=0-0", "bytes=-1", "bytes=-100"])
+def test_any_range_of_an_empty_file_is_unsatisfiable(header):
+    with pytest.raises(ValueError):
+        parse_range(header, 0)
+
+
+@pytest.fixture
+def client(tmp_path):
+    path = tmp_path / "book.txt"
+    path.write_bytes(bytes(range(256)) * 4)
+
+    async def download(request):
+        return RangeFileResponse(str(path), os.stat(path), request, filename="book.txt")
+
+    with TestClient(Starlette(routes=[Route("/book", download)])) as client:
+        client.etag = file_etag(os.stat(path))
+        client.content = path.read_bytes()
+        yield client
+
+
+def test_whole_file(client):
+    response = client.get("/book")
+    assert response.status_code == 200
+    assert response.content == client.content
+    assert response.headers["content-length"] == "1024"
+    assert response.headers["etag"] == client.etag
+
+
+def test_byte_range(client):
+    response = client.get("/book", headers={"Range": "bytes=10-19"})
+    assert response.status_code == 206
+    assert response.content == client.content[10:20]
+    assert response.headers["content-range"] == "bytes 10-19/1024"
+
+
+def test_unsatisfiable_range_is_a_416(client):
+    response = client.get("/book", headers={"Range": "bytes=2000-"})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == "bytes */1024"
+
+
+def test_range_of_an_empty_file_is_a_416(tmp_path):
+    path = tmp_path / "empty.txt"
+    path.touch()
+
+    async def download(request):
+        return RangeFileResponse(str(path), os.stat(path), request)
+
+    with TestClient(Starlette(routes=[Route("/empty", download)])) as client:
+        response = client.get("/empty", headers={"Range": "bytes=-1"})
+        assert response.status_code == 416
+        assert response.headers["content-range"] == "bytes */0"
+        assert response.headers["content-length"] == "0"
+        assert client.get("/empty").status_code == 200
+
+
+def test_if_range_with_another_etag_sends_the_whole_file(client):
+    response = client.get("/book", headers={"Range": "bytes=10-19", "If-Range": '"changed"'})
+    assert response.status_code == 200
+    assert response.content == client.content
+
+
+def test_not_modified_has_no_content_length(client):
+    response = client.get("/book", headers={"If-None-Match": f'"other", W/{client.etag}'})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert "content-length" not in response.headers
@@ -0,0 +1,60 @@
+import datetime
+import json
+from decimal import Decimal
+from types import SimpleNamespace
+
+import pytest
+
+import settings
+import src.models as models
+import src.schemas as schemas
+import src.serializers as serializers
+from src.serializers import book_dict, create_encoder
+
+
+def orm_book(writer=None) -> models.Book:
+    return models.Book(id=1, title="Dune", writer_id=7, description=None, publish_date=datetime.date(1965, 8, 1),
+                       rating=9, genres="sci-fi", cover_file=None, book_file="cas/ab/cd/dune.epub", writer=writer)
+
+
+def test_book_dict_expands_the_writer():
+    writer = models.Writer(id=7, name="Frank", lastname="Herbert", born=datetime.date(1920, 10, 8), died=None)
+    data = book_dict(orm_book(writer), schemas.BookExpand.writer)
+    assert data["writer"] == schemas.Writer(id=7, name="Frank", lastname="Herbert", born=datetime.date(1920, 10, 8))
+
+
+def test_book_dict_without_a_writer():
+    assert book_dict(orm_book(), schemas.BookExpand.writer)["writer"] is None
+    assert "writer" not in book_dict(orm_book())
+
+
+def media_url(key):
+    return f"http://testserver/media/{key}" if key else None
+
+
+@pytest.fixture
+def orjson_dumps(monkeypatch):
+    pytest.importorskip("orjson")
+    monkeypatch.setattr(settings, "JSON_RESPONSE_ENCODER", "orjson")
+    return create_encoder()
+
+
+def test_orjson_body_matches_the_json_encoder(orjson_dumps):
+    row = SimpleNamespace(id=1, title="Dünë", writer_id=7, description=None, publish_date=datetime.date(1965, 8, 1),
+                          rating=Decimal("9.5"), genres="sci-fi", cover_file="cas/ab/cd/dune.png", book_file=None,
+                          writer_name="Frank", writer_lastname="Herbert", writer_born=datetime.date(1920, 10, 8),
+                          writer_died=datetime.date(1986, 2, 11))
+    checked_at = datetime.datetime(2024, 5, 1, 12, 30, 1, 5)
+    content = [serializers.book_row_dict(row, media_url, schemas.BookExpand.writer, relevance=1.2345678,
+                                         role=schemas.Role.admin, checked_at=checked_at, votes={1: 2, 10: 3}),
+               book_dict(orm_book(), schemas.BookExpand.writer)]
+
+    body = orjson_dumps(content)
+    assert body == serializers.encode_json(content)
+    book, _ = json.loads(body)
+    assert book["publish_date"] == "1965-08-01"
+    assert book["rating"] == 9.5
+    assert book["role"] == "admin"
+    assert book["votes"] == {"1": 2, "10": 3}
+    assert book["checked_at"] == "2024-05-01T12:30:01.000005"
+    assert book["writer"]["died"] == "1986-02-11"
@@ -0,0 +1,73 @@
+import os
+import signal
+import socket
+
+import pytest
+
+import src.server as server
+from src.server import Supervisor, exit_code
+
+
+class Config:
+    def bind_socket(self) -> socket.socket:
+        return socket.socket()
+
+
+@pytest.fixture
+def restore_signals():
+    handlers = {sig: signal.getsignal(sig) for sig in server.STOP_SIGNALS}
+    yield
+    for sig, handler in handlers.items():
+        signal.signal(sig, handler)
+    signal.pthread_sigmask(signal.SIG_UNBLOCK, server.STOP_SIGNALS)
+
+
+def wait(pid: int) -> int:
+    _, status = os.waitpid(pid, 0)
+    return exit_code(status)
+
+
+def test_exit_code():
+    pid = os.fork()
+    if pid == 0:
+        os._exit(3)
+    assert wait(pid) == 3
+    pid = os.fork()
+    if pid == 0:
+        os.kill(os.getpid(), signal.SIGKILL)
+    assert wait(pid) == -signal.SIGKILL
+
+
+def test_stop_handlers_are_installed_before_the_first_worker(restore_signals, monkeypatch):
+    supervisor = Supervisor(Config(), workers=2, graceful_timeout=1)
+    handlers = []
+
+    def spawn(slot):
+        handlers.append(signal.getsignal(signal.SIGTERM))
+        # A SIGTERM during startup stops the remaining spawns and the supervisor, it would kill
+        # the test run with the default handler still in place
+        if handlers[-1] == supervisor.stop:
+            os.kill(os.getpid(), signal.SIGTERM)
+        else:
+            supervisor.stop()
+
+    monkeypatch.setattr(supervisor, "spawn", spawn)
+    supervisor.run()
+    assert handlers == [supervisor.stop]
+    assert supervisor.stopping
+
+
+def test_worker_restores_default_signal_handling(restore_signals, monkeypatch):
+    def run_worker(config, sockets):
+        blocked = signal.pthread_sigmask(signal.SIG_BLOCK, [])
+        if signal.getsignal(signal.SIGTERM) is not signal.SIG_DFL or blocked & server.STOP_SIGNALS:
+            raise RuntimeError("stop signals not restored")
+
+    monkeypatch.setattr(server, "run_worker", run_worker)
+    supervisor = Supervisor(Config(), workers=1, graceful_timeout=1)
+    supervisor.sock = None
+    signal.signal(signal.SIGTERM, supervisor.stop)
+    supervisor.spawn(0)
+    (pid,) = supervisor.children
+    assert wait(pid) == 0
+    assert not signal.pthread_sigmask(signal.SIG_BLOCK, []) & server.STOP_SIGNALS
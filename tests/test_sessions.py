@@ -0,0 +1,86 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import select
+
+import src.crud as crud
+import src.jobs as jobs
+import src.models as models
+import src.schemas as schemas
+from src.internal.sessions import open_session, parse_refresh_token, refresh_session
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def user(db):
+    user = models.User(username="ann", email="ann@example.com", hashed_password="-", otp_secret="-",
+                       disable=False, role=schemas.Role.user)
+    db.add(user)
+    await db.commit()
+    return user
+
+
+async def session_row(db, refresh_token: str) -> models.UserSession:
+    session_id, _ = parse_refresh_token(refresh_token)
+    db.expire_all()
+    return await db.get(models.UserSession, session_id)
+
+
+async def assert_rejected(db, refresh_token: str):
+    with pytest.raises(HTTPException) as error:
+        await refresh_session(db, refresh_token)
+    assert error.value.status_code == 401
+
+
+async def test_refresh_rotates_the_secret(db, user):
+    opened = await open_session(db, user)
+    refreshed = await refresh_session(db, opened["refresh_token"])
+
+    assert refreshed["refresh_token"] != opened["refresh_token"]
+    assert parse_refresh_token(refreshed["refresh_token"])[0] == parse_refresh_token(opened["refresh_token"])[0]
+    assert refreshed["access_token"]
+    assert (await refresh_session(db, refreshed["refresh_token"]))["refresh_token"] != refreshed["refresh_token"]
+
+
+async def test_reused_refresh_token_revokes_the_session(db, user):
+    opened = await open_session(db, user)
+    refreshed = await refresh_session(db, opened["refresh_token"])
+
+    await assert_rejected(db, opened["refresh_token"])
+    assert (await session_row(db, opened["refresh_token"])).revoked_at is not None
+    # The rotated token was copied along with the old one, it dies with the session
+    await assert_rejected(db, refreshed["refresh_token"])
+    # Other sessions of the user are not affected
+    assert await refresh_session(db, (await open_session(db, user))["refresh_token"])
+
+
+async def test_unknown_secret_does_not_revoke(db, user):
+    opened = await open_session(db, user)
+    session_id, _ = parse_refresh_token(opened["refresh_token"])
+
+    await assert_rejected(db, f"{session_id}.guessed")
+    assert (await session_row(db, opened["refresh_token"])).revoked_at is None
+
+
+async def test_expired_session_is_rejected_and_removed(db, user):
+    opened = await open_session(db, user)
+    active = await open_session(db, user)
+    db_session = await session_row(db, opened["refresh_token"])
+    db_session.expires_at = datetime.utcnow() - timedelta(seconds=1)
+    await db.commit()
+
+    await assert_rejected(db, opened["refresh_token"])
+    assert await crud.delete_expired_sessions(db, batch_size=1) == 1
+    assert await session_row(db, opened["refresh_token"]) is None
+    assert await session_row(db, active["refresh_token"]) is not None
+
+
+async def test_expired_sessions_are_removed_periodically(db):
+    assert jobs.PERIODIC["remove_expired_sessions"] > 0
+    assert await jobs.enqueue_periodic(db, "remove_expired_sessions")
+    # Not queued again while the first one is still waiting
+    assert not await jobs.enqueue_periodic(db, "remove_expired_sessions")
+    queued = (await db.execute(select(models.Job.kind))).scalars().all()
+    assert queued == ["remove_expired_sessions"]
@@ -0,0 +1,121 @@
+import time
+from datetime import timedelta
+
+import pytest
+from fastapi import HTTPException
+
+import src.cache as cache
+import src.internal.tokens as tokens
+import src.internal.users as users
+import src.models as models
+import src.schemas as schemas
+from src.internal.tokens import RevocationList, VerifiedTokens
+
+pytestmark = pytest.mark.anyio
+
+
+class Clock:
+    """Stands in for the time module of src.cache and src.internal.tokens"""
+
+    def __init__(self):
+        self.offset = 0.0
+
+    def monotonic(self) -> float:
+        return time.monotonic() + self.offset
+
+    def time(self) -> float:
+        return time.time() + self.offset
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache, "time", clock)
+    monkeypatch.setattr(tokens, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def verified(monkeypatch):
+    verified = VerifiedTokens(maxsize=10)
+    monkeypatch.setattr(users, "verified_tokens", verified)
+    return verified
+
+
+@pytest.fixture
+def revocations(monkeypatch):
+    revocations = RevocationList(refresh_seconds=60)
+    monkeypatch.setattr(users, "revocations", revocations)
+    return revocations
+
+
+@pytest.fixture
+async def admin(db):
+    admin = models.User(username="root", email="root@example.com", hashed_password="-", otp_secret="-",
+                        disable=False, role=schemas.Role.admin)
+    db.add(admin)
+    await db.commit()
+    return admin
+
+
+def access_token(user, minutes: int = 15) -> str:
+    return users.create_access_token(users.token_claims(user), expires_delta=timedelta(minutes=minutes))
+
+
+async def assert_rejected(token: str, db):
+    with pytest.raises(HTTPException) as error:
+        await users.get_token_data(token, db)
+    assert error.value.status_code == 401
+
+
+async def test_revoked_token_is_rejected_while_cached(db, admin, verified, revocations):
+    token = access_token(admin)
+    assert (await users.get_token_data(token, db)).role == schemas.Role.admin
+    assert verified.get(token) is not None
+
+    admin.disable = True
+    revocations.update(admin)
+    await assert_rejected(token, db)
+    # The signature stays verified, the revocation list decides on every request
+    assert verified.get(token) is not None
+
+
+async def test_demoted_admin_is_rejected_while_cached(db, admin, verified, revocations):
+    token = access_token(admin)
+    await users.get_token_data(token, db)
+    admin.role = schemas.Role.user
+    await db.commit()
+
+    # Demoted by another worker, seen once the list is reloaded
+    await users.get_token_data(token, db)
+    revocations._refreshed_at = float("-inf")
+    await assert_rejected(token, db)
+
+
+def test_cached_claims_expire_with_the_token(clock):
+    verified = VerifiedTokens(maxsize=10)
+    claims = schemas.TokenData(username="ann", id=1, role=schemas.Role.user, disable=False)
+    verified.set("token", claims, expires_at=clock.time() + 60)
+
+    clock.offset = 59
+    assert verified.get("token") == claims
+    clock.offset = 61
+    assert verified.get("token") is None
+    # Evicted by the lookup, not only hidden
+    assert len(verified._cache) == 0
+
+
+def test_expired_token_is_not_cached(clock):
+    verified = VerifiedTokens(maxsize=10)
+    claims = schemas.TokenData(username="ann", id=1, role=schemas.Role.user, disable=False)
+    verified.set("token", claims, expires_at=clock.time() - 1)
+    assert len(verified._cache) == 0
+
+
+async def test_cached_result_does_not_outlive_the_exp_claim(db, admin, verified, revocations, clock):
+    token = access_token(admin, minutes=1)
+    await users.get_token_data(token, db)
+    assert verified.get(token) is not None
+
+    clock.offset = 61
+    assert verified.get(token) is None
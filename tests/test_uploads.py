@@ -0,0 +1,100 @@
+import hashlib
+
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from src.uploads import StreamingFormParser, UploadTarget
+
+COVER = bytes(range(256)) * 64
+
+
+@pytest.fixture
+def covers(tmp_path):
+    return tmp_path / "covers"
+
+
+@pytest.fixture
+def client(covers):
+    parsers = []
+
+    async def upload(request):
+        form = StreamingFormParser(request, {"cover": UploadTarget(covers, ("image/png",), "Only png covers")},
+                                   max_size=len(COVER) + 1024)
+        parsers.append(form)
+        fields, files = await form.parse()
+        return JSONResponse({"fields": fields,
+                             "files": {name: {"filename": file.filename, "content_type": file.content_type,
+                                              "size": file.size, "sha256": file.sha256,
+                                              "content": file.temp_path.read_bytes().decode("latin-1")}
+                                       for name, file in files.items()}})
+
+    with TestClient(Starlette(routes=[Route("/upload", upload, methods=["POST"])])) as client:
+        client.parsers = parsers
+        yield client
+
+
+def leftovers(directory) -> list:
+    return sorted(path.name for path in directory.glob(".upload-*")) if directory.exists() else []
+
+
+def test_file_is_hashed_while_it_is_written(client, covers):
+    response = client.post("/upload", data={"title": "Dune"},
+                           files={"cover": ("../../dune.png", COVER, "image/png")})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["fields"] == {"title": "Dune"}
+    cover = body["files"]["cover"]
+    assert cover["filename"] == "dune.png"
+    assert cover["content_type"] == "image/png"
+    assert cover["size"] == len(COVER)
+    assert cover["sha256"] == hashlib.sha256(COVER).hexdigest()
+    assert cover["content"].encode("latin-1") == COVER
+    # The temporary file stays for the caller until it is moved or discarded
+    assert len(leftovers(covers)) == 1
+
+
+def test_discard_removes_the_temporary_files(client, covers):
+    client.post("/upload", files={"cover": ("dune.png", COVER, "image/png")})
+    client.portal.call(client.parsers[0].discard)
+    assert leftovers(covers) == []
+
+
+def test_files_of_other_fields_are_not_stored(client, covers):
+    response = client.post("/upload", files={"book": ("dune.pdf", b"%PDF", "application/pdf")})
+    assert response.status_code == 200
+    assert response.json() == {"fields": {"book": "%PDF"}, "files": {}}
+    assert leftovers(covers) == []
+
+
+def test_declared_size_over_the_limit_is_a_413(client, covers):
+    response = client.post("/upload", files={"cover": ("dune.png", COVER * 2, "image/png")})
+    assert response.status_code == 413
+    assert leftovers(covers) == []
+
+
+def test_streamed_size_over_the_limit_is_a_413_and_leaves_no_file(client, covers):
+    boundary = "b0undary"
+    body = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"cover\"; filename=\"dune.png\"\r\n"
+            f"Content-Type: image/png\r\n\r\n").encode() + COVER * 2 + f"\r\n--{boundary}--\r\n".encode()
+    # No Content-Length, the limit is only noticed half way through the file part
+    chunks = iter([body[i:i + 4096] for i in range(0, len(body), 4096)])
+    response = client.post("/upload", content=chunks,
+                           headers={"Content-Type": f"multipart/form-data; boundary={boundary}"})
+    assert response.status_code == 413
+    assert covers.exists()
+    assert leftovers(covers) == []
+
+
+def test_unsupported_content_type_is_a_418(client, covers):
+    response = client.post("/upload", files={"cover": ("dune.gif", b"GIF89a", "image/gif")})
+    assert response.status_code == 418
+    assert response.text == "Only png covers"
+    assert leftovers(covers) == []
+
+
+def test_missing_boundary_is_a_400(client):
+    response = client.post("/upload", content=b"", headers={"Content-Type": "multipart/form-data"})
+    assert response.status_code == 400